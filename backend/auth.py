@@ -0,0 +1,163 @@
+"""
+Аутентификация мини-приложения и админки.
+
+Мини-приложение получает от Telegram строку initData, подписанную
+HMAC-SHA256 ключом из токена бота. POST /api/auth/session проверяет
+подпись и выдаёт короткоживущий токен сессии «user_id.expires.подпись»;
+дальше клиент передаёт его в Authorization: Bearer. Проверка токена —
+один HMAC по короткой строке без разбора initData. initData можно
+передавать и напрямую (Authorization: tma <initData>): уже проверенные
+строки лежат в LRU, и подпись для них не пересчитывается.
+
+Бот ходит в API с ключом сервиса в X-API-Key: BACKEND_API_KEY или,
+по умолчанию, ключ, производный от BOT_TOKEN (так же считает бот).
+/api/admin/* доступны ему и пользователям из ADMIN_IDS.
+
+Без BOT_TOKEN проверка выключена (локальная разработка вне Telegram):
+user_id берётся из запроса, админские маршруты открыты.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+
+from cache import LRUStore
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+# Сколько принимать initData после auth_date и сколько живёт токен сессии
+INIT_DATA_TTL = int(os.getenv("INIT_DATA_TTL", "86400"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+AUTH_ENABLED = bool(BOT_TOKEN)
+if not AUTH_ENABLED:
+    logger.warning("BOT_TOKEN is not set: initData verification and admin auth are disabled")
+
+def derive_key(label: str) -> bytes:
+    return hmac.new(BOT_TOKEN.encode(), label.encode(), hashlib.sha256).digest()
+
+# Ключ проверки initData по документации Telegram Mini Apps
+WEBAPP_SECRET = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+SESSION_SECRET = os.getenv("SESSION_SECRET", "").encode() or derive_key("session")
+SERVICE_KEY = os.getenv("BACKEND_API_KEY") or derive_key("backend-api-key").hex()
+
+class Identity(NamedTuple):
+    user_id: Optional[int]  # None — сервис (бот)
+    is_admin: bool
+
+# Проверенные initData: строка -> (user_id, auth_date)
+verified_init_data = LRUStore(AUTH_CACHE_SIZE)
+
+def digests_equal(expected: str, received: str) -> bool:
+    """Сравнение за постоянное время. Строки из запроса могут быть не-ASCII:
+    compare_digest принимает такие только байтами"""
+    return hmac.compare_digest(expected.encode(), received.encode())
+
+def verify_init_data(init_data: str) -> Tuple[int, int]:
+    """Проверить подпись initData. Возвращает (user_id, auth_date)"""
+    cached = verified_init_data.get(init_data)
+    if cached is None:
+        try:
+            data = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Malformed initData")
+        received = data.pop("hash", "")
+        check_string = "\n".join(f"{key}={value}" for key, value in sorted(data.items()))
+        expected = hmac.new(WEBAPP_SECRET, check_string.encode(), hashlib.sha256).hexdigest()
+        if not digests_equal(expected, received):
+            raise HTTPException(status_code=401, detail="Invalid initData signature")
+        try:
+            cached = (int(json.loads(data["user"])["id"]), int(data["auth_date"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=401, detail="initData has no user")
+        verified_init_data.set(init_data, cached)
+    if time.time() - cached[1] > INIT_DATA_TTL:
+        raise HTTPException(status_code=401, detail="initData expired")
+    return cached
+
+def sign(payload: str) -> str:
+    digest = hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def issue_token(user_id: int) -> Tuple[str, int]:
+    """Токен сессии и время его истечения (unix)"""
+    expires = int(time.time()) + SESSION_TTL
+    payload = f"{user_id}.{expires}"
+    return f"{payload}.{sign(payload)}", expires
+
+def verify_token(token: str) -> int:
+    payload, _, signature = token.rpartition(".")
+    if not digests_equal(sign(payload), signature):
+        raise HTTPException(status_code=401, detail="Invalid session token")
+    user_id, _, expires = payload.partition(".")
+    if int(expires) < time.time():
+        raise HTTPException(status_code=401, detail="Session expired")
+    return int(user_id)
+
+def identify(request: Request) -> Optional[Identity]:
+    """Кто делает запрос; None — учётных данных нет"""
+    api_key = request.headers.get("x-api-key")
+    if api_key is not None:
+        if not digests_equal(SERVICE_KEY, api_key):
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        return Identity(None, True)
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    scheme = scheme.lower()
+    if scheme == "bearer":
+        user_id = verify_token(credentials.strip())
+    elif scheme == "tma":
+        user_id, _ = verify_init_data(credentials.strip())
+    else:
+        return None
+    return Identity(user_id, user_id in ADMIN_IDS)
+
+async def optional_user(request: Request) -> Optional[int]:
+    """id пользователя, если запрос подписан; без подписи — None"""
+    if not AUTH_ENABLED:
+        return None
+    identity = identify(request)
+    return identity.user_id if identity else None
+
+async def current_identity(request: Request) -> Optional[Identity]:
+    """Пользователь или бот, подписавший запрос; None — проверка выключена"""
+    if not AUTH_ENABLED:
+        return None
+    identity = identify(request)
+    if identity is None:
+        raise HTTPException(status_code=401, detail="Authentication required",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return identity
+
+async def current_user(request: Request) -> Optional[int]:
+    """id подписавшего запрос пользователя; None — проверка выключена"""
+    if not AUTH_ENABLED:
+        return None
+    identity = identify(request)
+    if identity is None or identity.user_id is None:
+        raise HTTPException(status_code=401, detail="Telegram initData or session token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return identity.user_id
+
+async def require_admin(request: Request):
+    """Зависимость /api/admin/*: бот с ключом сервиса или админ из ADMIN_IDS"""
+    if not AUTH_ENABLED:
+        return
+    identity = identify(request)
+    if identity is None:
+        raise HTTPException(status_code=401, detail="Authentication required",
+                            headers={"WWW-Authenticate": "Bearer"})
+    if not identity.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
@@ -0,0 +1,137 @@
+"""
+Рассылки пользователям бота.
+
+Аудитория — все, кто смотрел товары (distinct product_views.user_id),
+кроме заблокировавших бота в прошлых рассылках. При создании рассылки
+аудитория копируется в broadcast_recipients одним INSERT ... SELECT,
+и дальше каждый получатель хранит свой статус: pending, sent, blocked,
+failed. Отправляет бот — он берёт пачки pending по возрастанию user_id
+и возвращает результаты, поэтому после перезапуска рассылка продолжается
+с того же места.
+
+Вести рассылку может только владелец аренды (lease): её продлевают
+на каждой пачке, а просроченную аренду забирает другой процесс.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, func, insert, literal, or_, select, update
+
+from models import Broadcast, BroadcastRecipient, ProductView
+from stock import utcnow
+
+recipients_table = BroadcastRecipient.__table__
+
+STATUSES = ("pending", "sent", "blocked", "failed")
+
+def audience_query():
+    """user_id всех, кто смотрел товары и не блокировал бота"""
+    blocked = select(BroadcastRecipient.user_id).where(BroadcastRecipient.status == "blocked")
+    return (
+        select(ProductView.user_id)
+        .where(ProductView.user_id.not_in(blocked))
+        .distinct()
+    )
+
+async def audience_size(db) -> int:
+    return await db.scalar(select(func.count()).select_from(audience_query().subquery()))
+
+async def create_broadcast(db, text: str, photo: Optional[str] = None) -> Broadcast:
+    """Создать рассылку и зафиксировать её аудиторию"""
+    broadcast = Broadcast(text=text, photo=photo, status="running", total=0)
+    db.add(broadcast)
+    await db.flush()
+    audience = audience_query().subquery()
+    await db.execute(insert(recipients_table).from_select(
+        ["broadcast_id", "user_id", "status"],
+        select(literal(broadcast.id), audience.c.user_id, literal("pending")),
+    ))
+    broadcast.total = await db.scalar(
+        select(func.count()).select_from(recipients_table)
+        .where(recipients_table.c.broadcast_id == broadcast.id)
+    )
+    if not broadcast.total:
+        broadcast.status = "done"
+        broadcast.finished_at = datetime.now(timezone.utc)
+    await db.commit()
+    return broadcast
+
+async def status_counts(db, broadcast_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+    """Число получателей по статусам: {broadcast_id: {"sent": 10, ...}}"""
+    broadcast_ids = list(broadcast_ids)
+    result = {broadcast_id: dict.fromkeys(STATUSES, 0) for broadcast_id in broadcast_ids}
+    if not broadcast_ids:
+        return result
+    rows = await db.execute(
+        select(BroadcastRecipient.broadcast_id, BroadcastRecipient.status, func.count())
+        .where(BroadcastRecipient.broadcast_id.in_(broadcast_ids))
+        .group_by(BroadcastRecipient.broadcast_id, BroadcastRecipient.status)
+    )
+    for broadcast_id, status, count in rows:
+        result[broadcast_id][status] = count
+    return result
+
+async def acquire_lease(db, broadcast_id: int, owner: str, ttl: int) -> bool:
+    """Взять или продлить аренду. False — рассылку ведёт другой процесс
+    или она уже завершена"""
+    now = utcnow()
+    leased = await db.scalar(
+        update(Broadcast)
+        .where(
+            Broadcast.id == broadcast_id,
+            Broadcast.status == "running",
+            or_(Broadcast.lease_owner.is_(None), Broadcast.lease_owner == owner, Broadcast.lease_until < now),
+        )
+        .values(lease_owner=owner, lease_until=now + timedelta(seconds=ttl))
+        .returning(Broadcast.id)
+    )
+    await db.commit()
+    return leased is not None
+
+async def pending_recipients(db, broadcast_id: int, after: int, limit: int) -> List[int]:
+    """Следующая пачка неотправленных получателей (keyset по user_id)"""
+    return list(await db.scalars(
+        select(BroadcastRecipient.user_id)
+        .where(
+            BroadcastRecipient.broadcast_id == broadcast_id,
+            BroadcastRecipient.status == "pending",
+            BroadcastRecipient.user_id > after,
+        )
+        .order_by(BroadcastRecipient.user_id)
+        .limit(limit)
+    ))
+
+async def record_results(db, broadcast_id: int, results) -> Dict[str, int]:
+    """Сохранить результаты доставки пачки. Когда pending не осталось,
+    рассылка завершается. Возвращает число получателей по статусам"""
+    if results:
+        await db.execute(
+            update(recipients_table)
+            .where(recipients_table.c.broadcast_id == broadcast_id,
+                   recipients_table.c.user_id == bindparam("b_user_id"))
+            .values(status=bindparam("b_status"), error=bindparam("b_error")),
+            [
+                {"b_user_id": result.user_id, "b_status": result.status, "b_error": result.error}
+                for result in results
+            ],
+        )
+    counts = (await status_counts(db, [broadcast_id]))[broadcast_id]
+    if not counts["pending"]:
+        await db.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+            .values(status="done", finished_at=datetime.now(timezone.utc), lease_owner=None, lease_until=None)
+        )
+    await db.commit()
+    return counts
+
+async def cancel_broadcast(db, broadcast_id: int) -> bool:
+    """Остановить рассылку: неотправленные остаются pending"""
+    cancelled = await db.scalar(
+        update(Broadcast)
+        .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+        .values(status="cancelled", finished_at=datetime.now(timezone.utc), lease_owner=None, lease_until=None)
+        .returning(Broadcast.id)
+    )
+    await db.commit()
+    return cancelled is not None
@@ -0,0 +1,209 @@
+"""
+In-process кэш каталога.
+
+Хранит уже сериализованные JSON-ответы (bytes) вместе с ETag и сжатыми
+копиями (gzip и, если установлен пакет brotli, br): сжатие выполняется
+один раз при записи в кэш, а не на каждый запрос.
+Товары меняются только через админские эндпоинты, которые вызывают
+invalidate(), поэтому кэш можно держать без TTL. Остальные воркеры
+сбрасывают свой кэш по событиям каталога (events.py).
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional
+
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаём gzip
+    brotli = None
+
+# Ответы короче этого не сжимаем: выигрыш меньше заголовков
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: str
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому ответа"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def dumps(value) -> bytes:
+    """JSON ответа сразу в bytes: orjson сам сериализует datetime и вложенные
+    dict, без jsonable_encoder и повторной проверки через модели"""
+    return orjson.dumps(value)
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+def make_entry(body: bytes) -> CacheEntry:
+    if len(body) < COMPRESS_MIN_SIZE:
+        return CacheEntry(body, make_etag(body))
+    return CacheEntry(
+        body, make_etag(body),
+        gzip=compress(body, "gzip"),
+        br=compress(body, "br") if brotli is not None else None,
+    )
+
+class LRUStore:
+    """Ограниченный словарь с вытеснением давно не использованных записей"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def set(self, key: Hashable, entry: CacheEntry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class ProductCache:
+    """
+    Версионированный снимок каталога.
+
+    Любое изменение товаров увеличивает version. Запись, начатая до
+    инвалидации (чтение из БД шло параллельно с изменением), отбрасывается,
+    чтобы в кэш не попал устаревший снимок.
+    """
+
+    def __init__(self, max_products: int = 1000, max_pages: int = 256):
+        self.version = 0
+        self._products = LRUStore(max_products)
+        self._pages = LRUStore(max_pages)
+        self._lock = threading.Lock()
+
+    def get_product(self, product_id: int) -> Optional[CacheEntry]:
+        with self._lock:
+            return self._products.get(product_id)
+
+    def set_product(self, product_id: int, body: bytes, version: int) -> CacheEntry:
+        entry = make_entry(body)
+        with self._lock:
+            if version == self.version:
+                self._products.set(product_id, entry)
+        return entry
+
+    def get_page(self, key: Hashable) -> Optional[CacheEntry]:
+        with self._lock:
+            return self._pages.get(key)
+
+    def set_page(self, key: Hashable, body: bytes, version: int) -> CacheEntry:
+        entry = make_entry(body)
+        with self._lock:
+            if version == self.version:
+                self._pages.set(key, entry)
+        return entry
+
+    def invalidate(self, product_id: Optional[int] = None):
+        """Сбросить страницы каталога и (если указан) кэш одного товара"""
+        with self._lock:
+            self.version += 1
+            self._pages.clear()
+            if product_id is not None:
+                self._products.pop(product_id)
+
+    def clear(self):
+        """Сбросить весь кэш (массовые изменения, например импорт)"""
+        with self._lock:
+            self.version += 1
+            self._pages.clear()
+            self._products.clear()
+
+def accepted_encodings(request: Request) -> set:
+    """Кодировки из Accept-Encoding (кроме явно запрещённых q=0)"""
+    encodings = set()
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+def choose_encoding(request: Request, entry: Optional[CacheEntry] = None) -> Optional[str]:
+    """br, если он есть у сервера и клиента, иначе gzip.
+    Для записи кэша — только из уже сжатых копий"""
+    accepted = accepted_encodings(request)
+    if "br" in accepted and (entry.br if entry else brotli) is not None:
+        return "br"
+    if "gzip" in accepted and (entry is None or entry.gzip is not None):
+        return "gzip"
+    return None
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """У сжатого представления свой ETag ("hash" -> "hash-gzip")"""
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Клиент мог получить и сжатый вариант: содержимое у них одно
+    variants = {etag, encoded_etag(etag, "gzip"), encoded_etag(etag, "br")}
+    return any(tag.strip().removeprefix("W/") in variants for tag in header.split(","))
+
+def cached_response(request: Request, entry: CacheEntry) -> Response:
+    """JSON-ответ с ETag; 304 без тела, если у клиента актуальная версия"""
+    encoding = choose_encoding(request, entry)
+    headers = {
+        "ETag": encoded_etag(entry.etag, encoding),
+        # Клиент может хранить ответ, но обязан перепроверять его по ETag
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    body = entry.body
+    if encoding is not None:
+        body = entry.br if encoding == "br" else entry.gzip
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def json_response(request: Request, body: bytes, status_code: int = 200) -> Response:
+    """Уже сериализованный JSON без повторной проверки и jsonable_encoder.
+    Большие ответы сжимаются под Accept-Encoding клиента"""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = choose_encoding(request) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding is not None:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+product_cache = ProductCache(
+    max_products=int(os.getenv("CACHE_MAX_PRODUCTS", "1000")),
+    max_pages=int(os.getenv("CACHE_MAX_PAGES", "256")),
+)
@@ -0,0 +1,242 @@
+"""
+Массовый импорт и экспорт каталога (JSONL / CSV).
+
+Импорт читает тело запроса по мере поступления, разбирает строки
+и пишет товары пачками: один INSERT ... ON CONFLICT (sku) DO UPDATE
+на batch_size строк вместо отдельного commit на каждый товар.
+Ключ — внешний артикул sku, поэтому повторный импорт того же файла
+обновляет товары, а не создаёт дубликаты.
+
+Экспорт отдаёт каталог генератором: строки читаются из базы порциями
+и сразу уходят клиенту, весь каталог в памяти не собирается.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import and_, case, func, select
+
+from database import AsyncSessionLocal, dialect_insert
+from models import Product
+from schemas import ProductImportRow
+from stock import replace_stock, stock_by_product
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+EXPORT_BATCH_SIZE = 1000
+# Сколько ошибок по строкам вернуть в ответе (остальные только считаются)
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = {"jsonl": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_COLUMNS = ("sku", "name", "price", "description", "image_url", "sizes")
+
+def detect_format(format: Optional[str], content_type: Optional[str]) -> str:
+    """Формат из ?format= или Content-Type (по умолчанию jsonl)"""
+    if format:
+        format = format.lower()
+        if format == "ndjson":
+            format = "jsonl"
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format, use one of: {', '.join(FORMATS)}")
+        return format
+    if content_type and "csv" in content_type:
+        return "csv"
+    return "jsonl"
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Текстовые строки из потока байт (UTF-8, BOM от Excel отбрасывается)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+# Записи файла: (номер строки, данные, ошибка разбора этой записи)
+Record = Tuple[int, Optional[dict], Optional[str]]
+
+async def iter_jsonl(lines: AsyncIterator[str]) -> AsyncIterator[Record]:
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except json.JSONDecodeError as e:
+            # Битая строка не мешает остальным
+            yield number, None, f"invalid JSON: {e.msg}"
+
+def parse_sizes(value: str) -> Optional[Dict[str, int]]:
+    """Размеры в CSV: JSON {"S": 5} или короткая запись S:5;M:3"""
+    value = value.strip()
+    if not value:
+        return None
+    if value.startswith("{"):
+        return json.loads(value)
+    sizes = {}
+    for part in value.replace(",", ";").split(";"):
+        if part.strip():
+            size, _, count = part.partition(":")
+            sizes[size.strip()] = int(count)
+    return sizes
+
+async def iter_csv(lines: AsyncIterator[str]) -> AsyncIterator[Record]:
+    """Записи CSV с заголовком; поле в кавычках может занимать несколько строк"""
+    header = None
+    record = ""
+    start = number = 0
+    async for line in lines:
+        number += 1
+        if not record:
+            start = number
+        record = f"{record}\n{line}" if record else line
+        # Нечётное число кавычек — запись ещё не закончилась
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader(io.StringIO(record)), [])
+        record = ""
+        if not any(values):
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        row = {key: value for key, value in zip(header, values) if value != ""}
+        if "sizes" in row:
+            try:
+                row["sizes"] = parse_sizes(row["sizes"])
+            except ValueError:
+                yield start, None, "sizes: expected S:5;M:3 or a JSON object"
+                continue
+        yield start, row, None
+    if record:
+        raise ValueError(f"Line {start}: unterminated quoted field")
+
+def upsert_statement():
+    stmt = dialect_insert(Product)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=["sku"],
+        set_={
+            "name": excluded.name,
+            "price": excluded.price,
+            # Пустые поля в файле не затирают уже заполненные
+            "description": func.coalesce(excluded.description, Product.description),
+            "image_url": func.coalesce(excluded.image_url, Product.image_url),
+            # Варианты построены по старому фото: с новым image_url их нет,
+            # иначе витрина продолжит показывать прежнюю картинку
+            "image_variants": case(
+                (and_(excluded.image_url.is_not(None),
+                      excluded.image_url.is_distinct_from(Product.image_url)), None),
+                else_=Product.image_variants,
+            ),
+            "version": Product.version + 1,
+        },
+    )
+
+class CatalogImport:
+    """Счётчики и пачечная запись одного импорта"""
+
+    def __init__(self, db, batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.batch_size = batch_size
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        # sku -> строка: повтор sku внутри пачки схлопывается (побеждает последний)
+        self._batch: Dict[str, ProductImportRow] = {}
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    async def add(self, line: int, data) -> None:
+        try:
+            row = ProductImportRow.model_validate(data)
+        except ValidationError as e:
+            first = e.errors()[0]
+            field = ".".join(str(part) for part in first["loc"])
+            return self.error(line, f"{field}: {first['msg']}" if field else first["msg"])
+        self._batch[row.sku] = row
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._batch:
+            return
+        rows = list(self._batch.values())
+        self._batch = {}
+        skus = [row.sku for row in rows]
+        existing = await self.db.scalar(
+            select(func.count()).select_from(Product).where(Product.sku.in_(skus))
+        )
+        await self.db.execute(upsert_statement(), [row.model_dump(exclude={"sizes"}) for row in rows])
+        # Остатки заменяются только у строк, где размеры указаны
+        sizes = {row.sku: row.sizes for row in rows if row.sizes is not None}
+        if sizes:
+            ids = await self.db.execute(select(Product.sku, Product.id).where(Product.sku.in_(list(sizes))))
+            await replace_stock(self.db, {product_id: sizes[sku] for sku, product_id in ids})
+        await self.db.commit()
+        self.updated += existing
+        self.created += len(rows) - existing
+
+    def summary(self) -> dict:
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+async def import_catalog(db, chunks: AsyncIterator[bytes], format: str) -> dict:
+    """Импортировать каталог из потока байт, вернуть сводку"""
+    job = CatalogImport(db)
+    records = iter_csv(iter_lines(chunks)) if format == "csv" else iter_jsonl(iter_lines(chunks))
+    try:
+        async for line, data, error in records:
+            if error:
+                job.error(line, error)
+            else:
+                await job.add(line, data)
+    except (ValueError, csv.Error) as e:
+        # Дальше файл не разобрать: сохраняем то, что успели прочитать
+        await job.flush()
+        summary = job.summary()
+        summary["aborted"] = str(e)
+        return summary
+    await job.flush()
+    return job.summary()
+
+def format_row(row, sizes: Dict[str, int], format: str) -> str:
+    values = dict(zip(EXPORT_COLUMNS, row))
+    values["sizes"] = sizes or None
+    if format == "jsonl":
+        return json.dumps(values, ensure_ascii=False) + "\n"
+    if values["sizes"] is not None:
+        values["sizes"] = json.dumps(values["sizes"], ensure_ascii=False)
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerow(values.values())
+    return buffer.getvalue()
+
+async def export_catalog(format: str) -> AsyncIterator[str]:
+    """Каталог построчно; своя сессия, т.к. генератор живёт дольше запроса"""
+    if format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\n"
+    columns = [getattr(Product, name) for name in EXPORT_COLUMNS if name != "sizes"]
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(Product.id, *columns).order_by(Product.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            sizes = await stock_by_product(db, [row.id for row in rows])
+            yield "".join(format_row(row[1:], sizes[row.id], format) for row in rows)
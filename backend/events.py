@@ -0,0 +1,232 @@
+"""
+События каталога для клиентов: GET /api/events (Server-Sent Events).
+
+После commit изменения товара или остатка публикуется дельта:
+
+- product — товар создан или изменён: полная карточка (как /api/products/{id});
+- stock   — новые остатки изменившихся размеров: {"product_id", "sizes"};
+- resync  — изменений слишком много или часть пропущена (импорт, переполнение
+            очереди, потеря LISTEN): клиенту нужно перечитать каталог.
+
+В PostgreSQL событие уходит через NOTIFY, и каждый воркер получает его по
+LISTEN на отдельном соединении — в одном и том же порядке (порядке commit).
+Воркер сбрасывает по нему свой кэш каталога и раздаёт событие подписчикам:
+сообщение SSE кодируется один раз на всех. В SQLite (один процесс,
+локальная разработка) событие раздаётся сразу, без базы.
+
+id события уникален между воркерами, поэтому после переподключения
+(EventSource сам передаёт Last-Event-ID) любой воркер досылает пропущенное
+из истории последних EVENTS_HISTORY событий; если id там нет — resync.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import threading
+from collections import deque
+from typing import AsyncIterator, Optional, Set
+
+import orjson
+from sqlalchemy import func, select
+
+from cache import dumps, product_cache
+from database import async_engine
+from metrics import EVENT_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "catalog_events"
+# Очередь подписчика: не успевающий читать клиент получает resync
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "1000"))
+# Комментарий в пустом потоке, чтобы прокси не закрывали соединение
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+# Через сколько миллисекунд EventSource переподключается после обрыва
+EVENTS_RETRY_MS = 3000
+# Предел payload у NOTIFY — 8000 байт; карточка длиннее уходит без тела
+NOTIFY_MAX_SIZE = 7900
+
+RESYNC_MESSAGE = b"event: resync\ndata: {}\n\n"
+
+def product_event(product: dict, created: bool = False) -> dict:
+    return {"type": "product", "op": "created" if created else "updated",
+            "product_id": product["id"], "product": product}
+
+def stock_event(product_id: int, sizes: dict) -> dict:
+    return {"type": "stock", "product_id": product_id, "sizes": sizes}
+
+def resync_event() -> dict:
+    return {"type": "resync"}
+
+def encode(event: dict) -> bytes:
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (event["id"].encode(), event["type"].encode(), dumps(event))
+
+class CatalogEvents:
+    def __init__(self, queue_size: int = 256, history: int = 1000):
+        self.queue_size = queue_size
+        # Префикс id событий этого процесса
+        self.origin = secrets.token_hex(4)
+        self._published = 0
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._history = deque(maxlen=history)  # (id, сообщение SSE)
+        self._use_notify = async_engine.dialect.name == "postgresql"
+        self._closed = False
+        self._task = None
+
+    async def publish(self, event: dict):
+        """Разослать событие всем воркерам. Ошибка не роняет запрос,
+        изменивший каталог: клиенты увидят его после resync"""
+        self._published += 1
+        event = {"id": f"{self.origin}-{self._published}", **event}
+        if not self._use_notify:
+            self.dispatch(event)
+            return
+        payload = dumps(event)
+        if len(payload) > NOTIFY_MAX_SIZE:
+            # Клиент перечитает товар сам
+            event.pop("product", None)
+            payload = dumps(event)
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(select(func.pg_notify(CHANNEL, payload.decode())))
+        except Exception:
+            logger.exception("Failed to publish catalog event %s", event["id"])
+
+    def dispatch(self, event: dict):
+        """Событие дошло до воркера: сбросить кэш и раздать подписчикам"""
+        if not event["id"].startswith(self.origin + "-"):
+            # Свои изменения кэш уже сбросил в момент commit
+            if event["type"] == "resync":
+                product_cache.clear()
+            else:
+                product_cache.invalidate(event["product_id"])
+        message = encode(event)
+        self._history.append((event["id"], message))
+        for queue in self._subscribers:
+            self._put(queue, message)
+
+    def _put(self, queue: asyncio.Queue, message: bytes):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Пропущенные дельты не восстановить: вместо них один resync
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC_MESSAGE)
+
+    def resync(self):
+        """Часть событий могла потеряться: всё перечитать"""
+        product_cache.clear()
+        self._history.clear()
+        for queue in self._subscribers:
+            self._put(queue, RESYNC_MESSAGE)
+
+    def close(self):
+        """Завершить потоки клиентов: сервер останавливается"""
+        self._closed = True
+        for queue in self._subscribers:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    def replay(self, last_event_id: Optional[str]) -> list:
+        """Сообщения после last_event_id; [RESYNC_MESSAGE], если его нет в истории"""
+        if not last_event_id:
+            return []
+        history = list(self._history)
+        for position in range(len(history) - 1, -1, -1):
+            if history[position][0] == last_event_id:
+                return [message for _, message in history[position + 1:]]
+        return [RESYNC_MESSAGE]
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Поток SSE одного клиента"""
+        queue = asyncio.Queue(self.queue_size)
+        # Подписка и снимок истории без await между ними: событие попадёт
+        # либо в replay, либо в очередь, но не в оба и не мимо
+        self._subscribers.add(queue)
+        backlog = self.replay(last_event_id)
+        EVENT_SUBSCRIBERS.inc()
+        try:
+            yield b"retry: %d\n\n" % EVENTS_RETRY_MS
+            for message in backlog:
+                yield message
+            while not self._closed:
+                try:
+                    message = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    break
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+            EVENT_SUBSCRIBERS.dec()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.dispatch(orjson.loads(payload))
+        except Exception:
+            logger.exception("Bad catalog event payload: %r", payload)
+
+    async def _listen(self):
+        import asyncpg
+
+        dsn = async_engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        # Были ли промежутки без LISTEN, когда события шли мимо воркера
+        missed = False
+        while True:
+            lost = asyncio.Event()
+            try:
+                conn = await asyncpg.connect(dsn)
+            except Exception:
+                logger.exception("Failed to connect for LISTEN %s, retrying", CHANNEL)
+                missed = True
+                await asyncio.sleep(5)
+                continue
+            try:
+                conn.add_termination_listener(lambda _, lost=lost: lost.set())
+                await conn.add_listener(CHANNEL, self._on_notify)
+                if missed:
+                    logger.warning("LISTEN %s restored, clients will resync", CHANNEL)
+                    self.resync()
+                await lost.wait()
+                logger.warning("LISTEN %s connection lost", CHANNEL)
+                missed = True
+            finally:
+                await conn.close()
+
+    def _close_on_signals(self):
+        """Потоки сами не заканчиваются, а uvicorn при остановке ждёт открытые
+        запросы: закрываем их по SIGTERM/SIGINT до обработчика сервера"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.close)
+                previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def start(self):
+        self._closed = False
+        self._close_on_signals()
+        if self._use_notify and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+catalog_events = CatalogEvents(queue_size=EVENTS_QUEUE_SIZE, history=EVENTS_HISTORY)
@@ -0,0 +1,51 @@
+"""
+Продакшен-запуск API: gunicorn с воркерами uvicorn.
+
+    python init_db.py                      # схема и миграции, один раз
+    gunicorn -c gunicorn.conf.py main:app
+
+Воркеров по умолчанию столько, сколько ядер (WEB_CONCURRENCY — явно):
+воркер асинхронный, и одного на ядро хватает, а каждый лишний держит
+свой пул соединений к базе (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+Приложение импортирует каждый воркер сам (без preload_app): движок
+базы, пул обработки фото и фоновые задачи не переживают fork.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+# uvicorn с пределом ожидания открытых запросов при остановке, см. worker.py
+worker_class = "worker.UvicornWorker"
+# Воркер, не ответивший мастеру за timeout секунд, перезапускается
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+# Сколько ждать завершения запросов и фоновых задач при остановке
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Перезапуск воркеров раз в max_requests запросов (0 — никогда)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+
+# Метрики всех воркеров суммируются через файлы (см. metrics.py).
+# Переменная должна быть задана до импорта prometheus_client в воркерах
+if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="broshop-metrics-")
+
+def on_starting(server):
+    # Файлы прошлого запуска дали бы устаревшие значения
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
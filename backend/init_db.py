@@ -1,11 +1,91 @@
 """
 Скрипт для инициализации базы данных
 Запустите этот файл один раз для создания таблиц
+(повторный запуск безопасен: он применит недостающие миграции)
+
+Сервер API схему не трогает: init_db.py запускается перед ним один раз
+на развёртывание (в docker-compose — сервисом migrate), а не при старте
+каждого воркера.
 """
+from sqlalchemy import inspect, text
 from database import Base, engine
-from models import Product, ProductView
+# Импорт регистрирует все модели в Base.metadata для create_all
+import models  # noqa: F401
+from models import PRODUCT_SEARCH_DDL
+
+def add_column(table: str, column: str, ddl: str):
+    """Миграция: добавить колонку, если её ещё нет (работает и в SQLite)"""
+    def migrate(conn):
+        columns = {c["name"] for c in inspect(conn).get_columns(table)}
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return migrate
+
+def postgres_only(statements):
+    """Миграция, которая применяется только в PostgreSQL"""
+    def migrate(conn):
+        if conn.dialect.name == "postgresql":
+            for statement in statements:
+                conn.execute(text(statement))
+    return migrate
+
+def move_sizes_to_stock(conn):
+    """Миграция: перенести остатки из JSON products.sizes в product_stock.
+    После переноса колонка очищается, чтобы повторный запуск ничего не вернул"""
+    columns = {c["name"] for c in inspect(conn).get_columns("products")}
+    if "sizes" not in columns:
+        return
+    each = "json_each_text" if conn.dialect.name == "postgresql" else "json_each"
+    conn.execute(text(f"""
+        INSERT INTO product_stock (product_id, size, quantity)
+        SELECT p.id, UPPER(s.key), CAST(s.value AS INTEGER)
+        FROM products p, {each}(p.sizes) s
+        WHERE p.sizes IS NOT NULL
+        ON CONFLICT (product_id, size) DO NOTHING
+    """))
+    conn.execute(text("UPDATE products SET sizes = NULL WHERE sizes IS NOT NULL"))
+
+# Идемпотентные миграции для уже существующих баз.
+# create_all создаёт только отсутствующие таблицы, поэтому новые
+# индексы и колонки для старых таблиц добавляются здесь.
+MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_products_price ON products (price)",
+    # Пересчёт счётчиков уникальных просмотров по сырой таблице
+    # (WHERE true нужен SQLite для INSERT ... SELECT ... ON CONFLICT)
+    """
+    INSERT INTO product_view_counters (product_id, unique_views)
+    SELECT product_id, COUNT(*) FROM product_views WHERE true GROUP BY product_id
+    ON CONFLICT (product_id) DO UPDATE SET unique_views = excluded.unique_views
+    """,
+    add_column("products", "image_variants", "JSON"),
+    add_column("products", "sku", "VARCHAR"),
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_products_sku ON products (sku)",
+    move_sizes_to_stock,
+    add_column("products", "version", "INTEGER NOT NULL DEFAULT 1"),
+    postgres_only(PRODUCT_SEARCH_DDL),
+    "CREATE INDEX IF NOT EXISTS ix_product_views_user_recent ON product_views (user_id, id)",
+    # Последние просмотры для уже накопленной истории — время первого просмотра
+    """
+    INSERT INTO product_last_views (user_id, product_id, viewed_at)
+    SELECT user_id, product_id, viewed_at FROM product_views WHERE viewed_at IS NOT NULL
+    ON CONFLICT (user_id, product_id) DO NOTHING
+    """,
+]
+
+def run_migrations():
+    with engine.begin() as conn:
+        for migration in MIGRATIONS:
+            if callable(migration):
+                migration(conn)
+            else:
+                conn.execute(text(migration))
+
+def init_db():
+    """Создать недостающие таблицы и применить миграции"""
+    Base.metadata.create_all(bind=engine)
+    run_migrations()
 
 if __name__ == "__main__":
     print("Создание таблиц в базе данных...")
-    Base.metadata.create_all(bind=engine)
+    init_db()
     print("✅ Таблицы созданы успешно!")
@@ -1,21 +1,89 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, UploadFile, File, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
-from models import Product, ProductView
-from schemas import ProductCreate, ProductResponse, ProductViewCreate
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, async_engine, engine
+from models import Broadcast, Product, ProductViewCounter, StockReservation
+from schemas import (
+    ProductCreate, ProductPatch, ProductResponse, ProductViewCreate, ProductViewBulkCreate, ProductPage,
+    Recommendations, SessionCreate, SessionResponse,
+    StockChange, ReservationCreate, ReservationResponse,
+    BroadcastCreate, BroadcastLease, BroadcastResponse, BroadcastResults,
+)
+from cache import product_cache, cached_response, dumps, json_response
+from view_ingest import view_ingestor
+from rollups import rollup_aggregator, to_utc_naive, window_stats, WINDOWS
+from stock import (
+    RESERVATION_TTL, confirm, decrement, in_stock, release, reservation_reaper, reserve,
+    set_stock, stock_by_product, upsert_stock,
+)
+from search import search_query
+from events import catalog_events, product_event, resync_event
+from recommendations import RECOMMENDATIONS_MAX, also_viewed_cache, coview_aggregator, recently_viewed
+from broadcasts import (
+    acquire_lease, audience_size, cancel_broadcast, create_broadcast, pending_recipients,
+    record_results, status_counts,
+)
+from auth import (
+    ADMIN_IDS, AUTH_ENABLED, SESSION_TTL, Identity, current_identity, current_user, issue_token,
+    optional_user, require_admin, verify_init_data,
+)
+from metrics import MetricsMiddleware, render_metrics, setup_metrics
+from catalog_io import FORMATS, detect_format, import_catalog, export_catalog
+from media import image_processor, media_store, MediaStaticFiles, MEDIA_DIR, UploadLimitMiddleware
 import os
-import uuid
+import asyncio
+import base64
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
 from dotenv import load_dotenv
-from pathlib import Path
-import shutil
 
 load_dotenv()
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# Сколько ждать ответа базы в /ready
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
 
-app = FastAPI(title="bro shop API")
+async def check_database():
+    """Подключение к базе и наличие схемы (её создаёт init_db.py)"""
+    async with async_engine.connect() as conn:
+        await conn.execute(select(Product.id).limit(1))
+
+# Таблицы и миграции создаёт init_db.py до запуска сервера:
+# воркеры не выполняют DDL при старте
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    try:
+        # Первое соединение открываем сразу, а не на первом запросе
+        await asyncio.wait_for(check_database(), READINESS_TIMEOUT)
+    except Exception:
+        logger.exception("Database is not available, did you run init_db.py?")
+    view_ingestor.start()
+    rollup_aggregator.start()
+    coview_aggregator.start()
+    reservation_reaper.start()
+    catalog_events.start()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    await catalog_events.stop()
+    await reservation_reaper.stop()
+    await rollup_aggregator.stop()
+    await coview_aggregator.stop()
+    # Дописываем накопленные просмотры перед остановкой
+    await view_ingestor.stop()
+    image_processor.shutdown()
+    await async_engine.dispose()
+    engine.dispose()
+
+app = FastAPI(title="bro shop API", lifespan=lifespan)
 
 # CORS для мини-приложения
 app.add_middleware(
@@ -24,131 +92,546 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Ограничение размера загружаемых фото (до разбора multipart)
+app.add_middleware(UploadLimitMiddleware)
+
+# Метрики добавляются последними, чтобы мерить запрос целиком
+setup_metrics(async_engine)
+app.add_middleware(MetricsMiddleware)
+
 # Статические файлы для изображений
-# Путь к media относительно корня проекта
-project_root = Path(__file__).parent.parent
-media_dir = project_root / "media"
-media_dir.mkdir(exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(media_dir)), name="static")
-
-def get_db():
-    db = SessionLocal()
-    try:
+# (по умолчанию media в корне проекта, переопределяется MEDIA_DIR)
+MEDIA_DIR.mkdir(exist_ok=True)
+app.mount("/static", MediaStaticFiles(directory=str(MEDIA_DIR)), name="static")
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-@app.get("/api/products")
-def get_products(db: Session = Depends(get_db)):
-    """Получить список всех товаров"""
-    products = db.query(Product).all()
-    return [ProductResponse.model_validate(p) for p in products]
+# Админские маршруты (/api/admin/* и списание остатка): бот (ключ сервиса)
+# или админ из ADMIN_IDS, см. auth.py
+admin = APIRouter(dependencies=[Depends(require_admin)])
+
+# Колонки облегчённой карточки каталога (без description)
+PRODUCT_LIST_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.price,
+    Product.image_url,
+    Product.image_variants,
+    Product.created_at,
+)
 
-@app.get("/api/products/{product_id}")
-def get_product(product_id: int, db: Session = Depends(get_db)):
+# Полная карточка товара (ответ /api/products/{id})
+PRODUCT_COLUMNS = PRODUCT_LIST_COLUMNS + (Product.sku, Product.description, Product.version)
+
+async def build_products(db, rows) -> List[dict]:
+    """Товары для ответа из строк запроса вместе с остатками (одним запросом).
+    Обычные dict вместо ORM-объектов и моделей: колонки уже совпадают
+    с полями ProductListItem / ProductResponse, проверять их повторно незачем"""
+    sizes = await stock_by_product(db, [row.id for row in rows])
+    return [{**row._mapping, "sizes": sizes[row.id]} for row in rows]
+
+def encode_cursor(product_id: int) -> str:
+    """Курсор следующей страницы: id последнего отданного товара"""
+    return base64.urlsafe_b64encode(str(product_id).encode()).decode()
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/products", response_model=ProductPage)
+async def get_products(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    size: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Получить страницу каталога (новые сверху, keyset-пагинация)"""
+    if size:
+        size = size.upper()
+    cache_key = (cursor, limit, min_price, max_price, size)
+    entry = product_cache.get_page(cache_key)
+    if entry:
+        return cached_response(request, entry)
+    
+    version = product_cache.version
+    query = select(*PRODUCT_LIST_COLUMNS)
+    
+    if min_price is not None:
+        query = query.where(Product.price >= min_price)
+    if max_price is not None:
+        query = query.where(Product.price <= max_price)
+    if size:
+        # Только товары, у которых указанный размер есть в наличии
+        query = query.where(in_stock(size))
+    
+    if cursor:
+        # id растёт вместе с created_at, поэтому порядок по id = "новые сверху",
+        # а первичный ключ служит индексом для keyset-пагинации
+        query = query.where(Product.id < decode_cursor(cursor))
+    
+    # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+    result = await db.execute(query.order_by(Product.id.desc()).limit(limit + 1))
+    rows = result.all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    
+    page = {"items": await build_products(db, rows), "next_cursor": next_cursor}
+    entry = product_cache.set_page(cache_key, dumps(page), version)
+    return cached_response(request, entry)
+
+@app.get("/api/products/search", response_model=ProductPage)
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+):
+    """Поиск по названию и описанию: префиксы слов (для подсказок при наборе) и опечатки"""
+    cache_key = ("search", q.strip().lower(), limit)
+    entry = product_cache.get_page(cache_key)
+    if entry:
+        return cached_response(request, entry)
+    
+    version = product_cache.version
+    query = search_query(PRODUCT_LIST_COLUMNS, q, limit)
+    rows = (await db.execute(query)).all() if query is not None else []
+    page = {"items": await build_products(db, rows), "next_cursor": None}
+    entry = product_cache.set_page(cache_key, dumps(page), version)
+    return cached_response(request, entry)
+
+@app.get("/api/products/{product_id}", response_model=ProductResponse)
+async def get_product(product_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Получить товар по ID"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    entry = product_cache.get_product(product_id)
+    if entry:
+        return cached_response(request, entry)
+    
+    version = product_cache.version
+    rows = (await db.execute(select(*PRODUCT_COLUMNS).where(Product.id == product_id))).all()
+    if not rows:
         raise HTTPException(status_code=404, detail="Product not found")
-    return ProductResponse.model_validate(product)
-
-@app.post("/api/views")
-def create_view(view: ProductViewCreate, db: Session = Depends(get_db)):
-    """Создать просмотр товара (уникальный для user_id + product_id)"""
-    # Проверяем, существует ли уже такой просмотр
-    existing = db.query(ProductView).filter(
-        ProductView.user_id == view.user_id,
-        ProductView.product_id == view.product_id
-    ).first()
-    
-    if existing:
-        return {"message": "View already exists", "id": existing.id}
-    
-    db_view = ProductView(**view.model_dump())
-    db.add(db_view)
-    db.commit()
-    db.refresh(db_view)
-    return {"message": "View created", "id": db_view.id}
+    product, = await build_products(db, rows)
+    entry = product_cache.set_product(product_id, dumps(product), version)
+    return cached_response(request, entry)
+
+@app.get("/api/events", include_in_schema=False)
+async def catalog_event_stream(request: Request):
+    """Изменения каталога потоком SSE: товары и остатки (см. events.py).
+    После обрыва EventSource передаёт Last-Event-ID, пропущенное досылается"""
+    return StreamingResponse(
+        catalog_events.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен копить поток в буфере
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/recommendations", response_model=Recommendations)
+async def get_recommendations(
+    request: Request,
+    product_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=RECOMMENDATIONS_MAX),
+    session_user: Optional[int] = Depends(optional_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """«Вы недавно смотрели» (по user_id) и «С этим товаром смотрят» (по product_id).
+    С включённой проверкой initData недавние — только свои, из сессии"""
+    if AUTH_ENABLED:
+        user_id = session_user
+    recent = await recently_viewed(db, user_id, limit, exclude=product_id) if user_id is not None else []
+    also = (await also_viewed_cache.get(db, product_id))[:limit] if product_id is not None else []
+    
+    # Карточки обоих списков — одним запросом по первичному ключу
+    ids = set(recent) | set(also)
+    rows = (await db.execute(select(*PRODUCT_LIST_COLUMNS).where(Product.id.in_(ids)))).all() if ids else []
+    cards = {card["id"]: card for card in await build_products(db, rows)}
+    return json_response(request, dumps({
+        "recently_viewed": [cards[i] for i in recent if i in cards],
+        "also_viewed": [cards[i] for i in also if i in cards],
+    }))
+
+def view_user(body_user_id: Optional[int], session_user: Optional[int]) -> int:
+    """Чей просмотр: пользователь сессии, а без проверки initData — из тела запроса"""
+    user_id = session_user if AUTH_ENABLED else body_user_id
+    if user_id is None:
+        raise HTTPException(status_code=422, detail="user_id is required")
+    return user_id
+
+@app.post("/api/auth/session", response_model=SessionResponse)
+async def create_session(body: SessionCreate):
+    """Обменять initData мини-приложения на короткоживущий токен сессии"""
+    if not AUTH_ENABLED:
+        raise HTTPException(status_code=503, detail="Authentication is disabled: BOT_TOKEN is not set")
+    user_id, _ = verify_init_data(body.init_data)
+    token, _ = issue_token(user_id)
+    return SessionResponse(token=token, expires_in=SESSION_TTL, user_id=user_id, is_admin=user_id in ADMIN_IDS)
+
+@app.post("/api/views", status_code=202)
+async def create_view(view: ProductViewCreate, session_user: Optional[int] = Depends(current_user)):
+    """Зарегистрировать просмотр товара (уникальный для user_id + product_id).
+    Запись в БД идёт пачками в фоне, повторные просмотры отбрасываются."""
+    if not view_ingestor.add(view_user(view.user_id, session_user), view.product_id):
+        raise HTTPException(status_code=503, detail="View queue is full")
+    return {"message": "View accepted"}
+
+@app.post("/api/views/bulk", status_code=202)
+async def create_views_bulk(views: ProductViewBulkCreate, session_user: Optional[int] = Depends(current_user)):
+    """Зарегистрировать несколько просмотров одним запросом"""
+    user_id = view_user(views.user_id, session_user)
+    accepted = view_ingestor.add_many(
+        (user_id, product_id) for product_id in views.product_ids
+    )
+    if not accepted:
+        raise HTTPException(status_code=503, detail="View queue is full")
+    return {"message": "Views accepted", "count": len(views.product_ids)}
+
+def top_products_query(limit: int):
+    """ТОП товаров по уникальным просмотрам вместе с названиями — один запрос"""
+    return select(
+        Product.id,
+        Product.name,
+        ProductViewCounter.unique_views.label("views"),
+    ).join(
+        Product, Product.id == ProductViewCounter.product_id
+    ).order_by(ProductViewCounter.unique_views.desc(), Product.id).limit(limit)
 
 @app.get("/api/stats")
-def get_stats(db: Session = Depends(get_db)):
+async def get_stats(request: Request, db: AsyncSession = Depends(get_db)):
     """Статистика для админки"""
-    from sqlalchemy import func
-    
-    total_products = db.query(Product).count()
-    
-    # ТОП-5 просматриваемых товаров
-    top_products = db.query(
-        ProductView.product_id,
-        func.count(ProductView.user_id.distinct()).label('unique_views')
-    ).group_by(ProductView.product_id).order_by(
-        func.count(ProductView.user_id.distinct()).desc()
-    ).limit(5).all()
-    
-    top_products_data = []
-    for product_id, views in top_products:
-        product = db.query(Product).filter(Product.id == product_id).first()
-        if product:
-            top_products_data.append({
-                "id": product.id,
-                "name": product.name,
-                "views": views
-            })
+    total_products = await db.scalar(select(func.count()).select_from(Product))
+    
+    # ТОП-5 просматриваемых товаров (по инкрементальным счётчикам)
+    top_products = (await db.execute(top_products_query(5))).mappings().all()
+    top_products_data = [dict(row) for row in top_products]
     
     # Последние 3 товара
-    recent_products = db.query(Product).order_by(Product.id.desc()).limit(3).all()
+    recent_products = (await db.execute(select(*PRODUCT_COLUMNS).order_by(Product.id.desc()).limit(3))).all()
     
-    return {
+    return json_response(request, dumps({
         "total_products": total_products,
         "top_products": top_products_data,
-        "recent_products": [ProductResponse.model_validate(p) for p in recent_products]
-    }
+        "recent_products": await build_products(db, recent_products),
+    }))
+
+@app.get("/api/stats/views")
+async def get_view_stats(
+    window: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+):
+    """ТОП товаров и тренд просмотров за окно (24h, 7d, 30d, 90d) или период start..end"""
+    now = datetime.now(timezone.utc)
+    if window:
+        if window not in WINDOWS:
+            raise HTTPException(status_code=400, detail=f"Unknown window, use one of: {', '.join(WINDOWS)}")
+        start, end = now - WINDOWS[window], now
+    elif start is None:
+        raise HTTPException(status_code=400, detail="Either window or start is required")
+    # Время без часового пояса считается UTC
+    start, end = to_utc_naive(start), to_utc_naive(end or now)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return await window_stats(db, start, end, limit)
+
+@admin.post("/api/products/{product_id}/stock/decrement")
+async def decrement_stock(product_id: int, change: StockChange, db: AsyncSession = Depends(get_db)):
+    """Списать остаток размера (продажа без резерва). 409, если не хватает"""
+    size = change.size.upper()
+    remaining = await decrement(db, product_id, size, change.quantity)
+    if remaining is None:
+        raise HTTPException(status_code=409, detail="Not enough stock")
+    return {"product_id": product_id, "size": size, "remaining": remaining}
+
+async def owned_reservation(db: AsyncSession, reservation_id: int, identity: Optional[Identity]):
+    """Резерв, которым может распоряжаться вызывающий: свой, или любой для админа и бота"""
+    reservation = await db.get(StockReservation, reservation_id)
+    if reservation is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    if identity is not None and not identity.is_admin and reservation.user_id != identity.user_id:
+        raise HTTPException(status_code=403, detail="Reservation belongs to another user")
+    return reservation
 
-@app.post("/api/admin/upload")
+@app.post("/api/products/{product_id}/reservations", response_model=ReservationResponse, status_code=201)
+async def create_reservation(
+    product_id: int,
+    body: ReservationCreate,
+    identity: Optional[Identity] = Depends(current_identity),
+    db: AsyncSession = Depends(get_db),
+):
+    """Зарезервировать товар на ttl секунд (по умолчанию RESERVATION_TTL).
+    Неподтверждённый резерв по истечении срока возвращается в остаток.
+    Резерв оформляется на пользователя сессии; user_id из тела — только для бота
+    и без проверки initData"""
+    user_id = body.user_id if identity is None or identity.user_id is None else identity.user_id
+    reservation = await reserve(
+        db, product_id, body.size.upper(), body.quantity,
+        ttl=body.ttl or RESERVATION_TTL, user_id=user_id,
+    )
+    if reservation is None:
+        raise HTTPException(status_code=409, detail="Not enough stock")
+    return reservation
+
+@app.post("/api/reservations/{reservation_id}/confirm", response_model=ReservationResponse)
+async def confirm_reservation(
+    reservation_id: int,
+    identity: Optional[Identity] = Depends(current_identity),
+    db: AsyncSession = Depends(get_db),
+):
+    """Подтвердить покупку по резерву"""
+    await owned_reservation(db, reservation_id, identity)
+    reservation = await confirm(db, reservation_id)
+    if reservation is None:
+        raise HTTPException(status_code=404, detail="Reservation not found or expired")
+    return reservation
+
+@app.delete("/api/reservations/{reservation_id}")
+async def cancel_reservation(
+    reservation_id: int,
+    identity: Optional[Identity] = Depends(current_identity),
+    db: AsyncSession = Depends(get_db),
+):
+    """Отменить резерв и вернуть товар в остаток"""
+    await owned_reservation(db, reservation_id, identity)
+    if not await release(db, reservation_id):
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return {"message": "Reservation released"}
+
+@admin.post("/api/admin/upload")
 async def upload_file(file: UploadFile = File(...)):
-    """Загрузить файл (фото товара)"""
-    # Генерируем уникальное имя файла
-    file_ext = Path(file.filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = media_dir / unique_filename
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Возвращаем URL для доступа к файлу
-    return {"url": f"/static/{unique_filename}"}
+    """Загрузить файл (фото товара) и построить уменьшенные варианты.
+    Одинаковые фото хранятся один раз (имя файла — хэш содержимого)."""
+    # Возвращаем URL для доступа к файлу и его вариантам
+    return await media_store.save(file)
 
-@app.post("/api/admin/products")
-def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+@admin.post("/api/admin/products")
+async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_db)):
     """Создать товар (для админки)"""
-    db_product = Product(**product.model_dump())
+    db_product = Product(**product.model_dump(exclude={"sizes"}))
+    set_stock(db_product, product.sizes)
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
-    return ProductResponse.model_validate(db_product)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Product with this SKU already exists")
+    product_cache.invalidate()
+    await db.refresh(db_product)
+    response = ProductResponse.model_validate(db_product)
+    await catalog_events.publish(product_event(response.model_dump(), created=True))
+    return response
 
-@app.put("/api/admin/products/{product_id}")
-def update_product(product_id: int, product: ProductCreate, db: Session = Depends(get_db)):
+@admin.put("/api/admin/products/{product_id}")
+async def update_product(product_id: int, product: ProductCreate, db: AsyncSession = Depends(get_db)):
     """Обновить товар (для админки)"""
-    db_product = db.query(Product).filter(Product.id == product_id).first()
+    db_product = await db.get(Product, product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    for key, value in product.model_dump().items():
+    for key, value in product.model_dump(exclude={"sizes"}).items():
         setattr(db_product, key, value)
+    if set_stock(db_product, product.sizes):
+        # version_id_col растёт только при UPDATE строки products:
+        # смена одних остатков тоже новая версия товара
+        db_product.version = db_product.version + 1
     
-    db.commit()
-    db.refresh(db_product)
-    return ProductResponse.model_validate(db_product)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Product with this SKU already exists")
+    except StaleDataError:
+        raise HTTPException(status_code=409, detail="Product was modified concurrently")
+    product_cache.invalidate(product_id)
+    await db.refresh(db_product)
+    response = ProductResponse.model_validate(db_product)
+    await catalog_events.publish(product_event(response.model_dump()))
+    return response
 
-@app.get("/api/admin/products")
-def list_products(db: Session = Depends(get_db)):
+@admin.patch("/api/admin/products/{product_id}", response_model=ProductResponse)
+async def patch_product(product_id: int, patch: ProductPatch, db: AsyncSession = Depends(get_db)):
+    """Изменить только переданные поля одним UPDATE ... RETURNING.
+    Если передана version и товар с тех пор изменили — 409 с текущей версией."""
+    values = patch.model_dump(exclude_unset=True, exclude={"version", "sizes"})
+    table = Product.__table__
+    stmt = update(table).where(table.c.id == product_id)
+    if patch.version is not None:
+        stmt = stmt.where(table.c.version == patch.version)
+    try:
+        row = (await db.execute(
+            stmt.values(**values, version=table.c.version + 1).returning(*table.c)
+        )).first()
+        if row is not None and patch.sizes:
+            await upsert_stock(db, product_id, patch.sizes)
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Product with this SKU already exists")
+    
+    if row is None:
+        current = await db.scalar(select(Product.version).where(Product.id == product_id))
+        if current is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(status_code=409, detail={
+            "message": "Product was modified by someone else",
+            "version": current,
+        })
+    product_cache.invalidate(product_id)
+    
+    sizes = await stock_by_product(db, [product_id])
+    response = ProductResponse(**row._mapping, sizes=sizes[product_id])
+    await catalog_events.publish(product_event(response.model_dump()))
+    return response
+
+@admin.get("/api/admin/products")
+async def list_products(request: Request, db: AsyncSession = Depends(get_db)):
     """Список всех товаров для админки"""
-    products = db.query(Product).order_by(Product.id.desc()).limit(20).all()
-    return [ProductResponse.model_validate(p) for p in products]
+    rows = (await db.execute(select(*PRODUCT_COLUMNS).order_by(Product.id.desc()).limit(20))).all()
+    return json_response(request, dumps(await build_products(db, rows)))
+
+@admin.post("/api/admin/products/import")
+async def import_products(request: Request, format: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Массовый импорт товаров из JSONL или CSV (тело запроса — сам файл).
+    Товары сопоставляются по sku: новые создаются, существующие обновляются."""
+    try:
+        format = detect_format(format, request.headers.get("content-type"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # Файл разбирается по мере получения, целиком в память не читается
+        summary = await import_catalog(db, request.stream(), format)
+    finally:
+        product_cache.clear()
+        # Дельт на весь импорт не шлём: клиенты перечитают каталог
+        await catalog_events.publish(resync_event())
+    return summary
+
+@admin.get("/api/admin/products/export")
+async def export_products(format: str = "jsonl"):
+    """Выгрузка всего каталога в JSONL или CSV (потоком)"""
+    try:
+        format = detect_format(format, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        export_catalog(format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+async def broadcast_response(db: AsyncSession, broadcast: Broadcast) -> BroadcastResponse:
+    counts = (await status_counts(db, [broadcast.id]))[broadcast.id]
+    return BroadcastResponse.model_validate(broadcast).model_copy(update=counts)
+
+@admin.get("/api/admin/broadcasts/audience")
+async def get_broadcast_audience(db: AsyncSession = Depends(get_db)):
+    """Сколько пользователей получит рассылку (ничего не создаёт)"""
+    return {"audience": await audience_size(db)}
+
+@admin.post("/api/admin/broadcasts", response_model=BroadcastResponse, status_code=201)
+async def create_broadcast_endpoint(body: BroadcastCreate, db: AsyncSession = Depends(get_db)):
+    """Создать рассылку; аудитория фиксируется в момент создания"""
+    broadcast = await create_broadcast(db, body.text, body.photo)
+    return await broadcast_response(db, broadcast)
+
+@admin.get("/api/admin/broadcasts", response_model=List[BroadcastResponse])
+async def list_broadcasts(status: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Последние рассылки (status=running — незавершённые, их продолжает бот)"""
+    query = select(Broadcast).order_by(Broadcast.id.desc()).limit(20)
+    if status:
+        query = query.where(Broadcast.status == status)
+    broadcasts = (await db.scalars(query)).all()
+    counts = await status_counts(db, [broadcast.id for broadcast in broadcasts])
+    return [
+        BroadcastResponse.model_validate(broadcast).model_copy(update=counts[broadcast.id])
+        for broadcast in broadcasts
+    ]
+
+@admin.get("/api/admin/broadcasts/{broadcast_id}", response_model=BroadcastResponse)
+async def get_broadcast(broadcast_id: int, db: AsyncSession = Depends(get_db)):
+    broadcast = await db.get(Broadcast, broadcast_id)
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return await broadcast_response(db, broadcast)
+
+@admin.post("/api/admin/broadcasts/{broadcast_id}/lease")
+async def lease_broadcast(broadcast_id: int, lease: BroadcastLease, db: AsyncSession = Depends(get_db)):
+    """Взять или продлить аренду рассылки; 409 — её ведёт другой процесс или она завершена"""
+    if not await acquire_lease(db, broadcast_id, lease.owner, lease.ttl):
+        raise HTTPException(status_code=409, detail="Broadcast is not available")
+    return {"message": "Lease acquired"}
+
+@admin.get("/api/admin/broadcasts/{broadcast_id}/recipients", response_model=List[int])
+async def get_broadcast_recipients(
+    broadcast_id: int,
+    after: int = 0,
+    limit: int = Query(500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Следующие неотправленные получатели с user_id больше after"""
+    return await pending_recipients(db, broadcast_id, after, limit)
+
+@admin.post("/api/admin/broadcasts/{broadcast_id}/results", response_model=BroadcastResponse)
+async def report_broadcast_results(broadcast_id: int, body: BroadcastResults, db: AsyncSession = Depends(get_db)):
+    """Результаты доставки пачки; когда неотправленных не осталось, рассылка завершается"""
+    broadcast = await db.get(Broadcast, broadcast_id)
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    counts = await record_results(db, broadcast_id, body.results)
+    await db.refresh(broadcast)
+    return BroadcastResponse.model_validate(broadcast).model_copy(update=counts)
+
+@admin.post("/api/admin/broadcasts/{broadcast_id}/cancel", response_model=BroadcastResponse)
+async def cancel_broadcast_endpoint(broadcast_id: int, db: AsyncSession = Depends(get_db)):
+    """Остановить рассылку"""
+    broadcast = await db.get(Broadcast, broadcast_id)
+    if not broadcast:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    await cancel_broadcast(db, broadcast_id)
+    await db.refresh(broadcast)
+    return await broadcast_response(db, broadcast)
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: процесс жив и обслуживает запросы"""
+    return {"status": "ok"}
+
+@app.get("/ready", include_in_schema=False)
+async def ready(response: Response):
+    """Readiness: воркер запущен, база доступна и схема создана"""
+    if not getattr(app.state, "ready", False):
+        response.status_code = 503
+        return {"status": "starting"}
+    try:
+        await asyncio.wait_for(check_database(), READINESS_TIMEOUT)
+    except Exception as e:
+        response.status_code = 503
+        return {"status": "unavailable", "error": type(e).__name__}
+    return {"status": "ready"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+app.include_router(admin)
 
 if __name__ == "__main__":
+    # Для продакшена — gunicorn -c gunicorn.conf.py main:app
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")),
+                workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+                # Клиентов /api/events, переставших читать, при остановке ждём не дольше 10 с
+                timeout_graceful_shutdown=10)
@@ -0,0 +1,276 @@
+"""
+Загрузка и обработка фото товаров.
+
+Файл принимается потоково с ограничением размера и одновременно хэшируется.
+Хранилище адресуется по содержимому: media/ab/cd/<sha256>.<ext>, поэтому
+повторная загрузка того же фото не пишет файл второй раз, а URL никогда
+не меняет содержимое и может кэшироваться навсегда.
+
+В пуле процессов (вне event loop) из оригинала строятся уменьшенные
+варианты thumb/medium в JPEG, WebP и, если Pillow собран с libavif, AVIF.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import aiofiles
+from fastapi import HTTPException, UploadFile
+from fastapi.staticfiles import StaticFiles
+from PIL import Image, ImageOps, features
+
+MEDIA_DIR = Path(os.getenv("MEDIA_DIR", Path(__file__).resolve().parent.parent / "media"))
+MEDIA_URL_PREFIX = "/static"
+# Недокачанные загрузки; лежат на той же ФС, чтобы перенос был атомарным
+TMP_DIR_NAME = ".tmp"
+
+# Формат Pillow -> расширение файла в хранилище
+IMAGE_EXTENSIONS = {
+    "JPEG": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+    "GIF": "gif",
+    "AVIF": "avif",
+}
+
+# ab/cd/<sha256>.ext и его варианты ab/cd/<sha256>_thumb.webp
+CONTENT_ADDRESSED_PATH = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$")
+
+# Год — максимум, который имеет смысл указывать в max-age
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Имя варианта -> максимальная сторона в пикселях
+VARIANT_SIZES = {
+    "thumb": 400,
+    "medium": 1080,
+}
+
+# Формат -> (расширение, параметры Pillow)
+VARIANT_FORMATS = {
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 4}),
+    "avif": ("avif", {"format": "AVIF", "quality": 60}),
+}
+
+def available_formats():
+    if features.check("avif"):
+        return list(VARIANT_FORMATS)
+    return [name for name in VARIANT_FORMATS if name != "avif"]
+
+class UploadTooLarge(Exception):
+    pass
+
+def blob_path(digest: str, suffix: str) -> str:
+    """Путь blob-а относительно MEDIA_DIR: ab/cd/<digest><suffix>"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{suffix}"
+
+async def stream_upload_to_file(file: UploadFile, destination: Path,
+                                max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """Скопировать загрузку на диск кусками, не превышая max_bytes.
+    Возвращает sha256 содержимого."""
+    written = 0
+    digest = hashlib.sha256()
+    try:
+        async with aiofiles.open(destination, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                await out.write(chunk)
+    except UploadTooLarge:
+        destination.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail="File is too large")
+    return digest.hexdigest()
+
+def generate_variants(source: str, output_dir: str, stem: str, formats) -> Dict[str, Dict[str, str]]:
+    """
+    Построить уменьшенные копии изображения.
+    Выполняется в отдельном процессе, поэтому принимает и возвращает только простые типы.
+    Возвращает {"thumb": {"webp": "<имя файла>", ...}, "medium": {...}}.
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGB")
+
+    variants = {}
+    for name, max_side in VARIANT_SIZES.items():
+        resized = None
+        variants[name] = {}
+        for fmt in formats:
+            ext, options = VARIANT_FORMATS[fmt]
+            filename = f"{stem}_{name}.{ext}"
+            target = Path(output_dir) / filename
+            variants[name][fmt] = filename
+            # Варианты детерминированы хэшем оригинала: уже построенные не трогаем
+            if target.exists():
+                continue
+            if resized is None:
+                resized = image.copy()
+                resized.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            tmp = target.with_name(f".{uuid.uuid4().hex}.{ext}")
+            resized.save(tmp, **options)
+            os.replace(tmp, target)
+    return variants
+
+def detect_format(path: str) -> Optional[str]:
+    """Формат изображения по содержимому (JPEG, PNG, ...) или None"""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            return image.format
+    except Exception:
+        return None
+
+class ImageProcessor:
+    """Пул процессов для CPU-тяжёлого ресайза и перекодирования"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers
+        self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, func, *args)
+
+    async def build_variants(self, source: Path, url_prefix: str) -> Dict[str, Dict[str, str]]:
+        filenames = await self.run(
+            generate_variants, str(source), str(source.parent), source.stem, available_formats()
+        )
+        return {
+            name: {fmt: f"{url_prefix}/{filename}" for fmt, filename in formats.items()}
+            for name, formats in filenames.items()
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+image_processor = ImageProcessor(
+    workers=int(os.getenv("IMAGE_WORKERS")) if os.getenv("IMAGE_WORKERS") else None
+)
+
+def touch_blob(path: Path) -> bool:
+    """
+    Обновить mtime фото и его вариантов. media_gc удаляет файлы без ссылок
+    старше --min-age-hours: повторно загруженное фото не должно пропасть
+    до того, как на него сошлётся товар. False — фото нет.
+    """
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    for variant in path.parent.glob(f"{path.stem}_*"):
+        try:
+            os.utime(variant)
+        except FileNotFoundError:
+            # Удалён между glob и utime — build_variants построит заново
+            pass
+    return True
+
+class MediaStore:
+    """Хранилище фото, адресуемое по sha256 содержимого"""
+
+    def __init__(self, root: Path = MEDIA_DIR, processor: ImageProcessor = image_processor):
+        self.root = root
+        self.processor = processor
+        self.tmp_dir = root / TMP_DIR_NAME
+
+    async def save(self, file: UploadFile) -> dict:
+        """Сохранить фото (если такого ещё нет) и построить варианты"""
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        try:
+            digest = await stream_upload_to_file(file, tmp_path)
+            image_format = await self.processor.run(detect_format, str(tmp_path))
+            if image_format not in IMAGE_EXTENSIONS:
+                raise HTTPException(status_code=400, detail="Unsupported image")
+            relative = blob_path(digest, "." + IMAGE_EXTENSIONS[image_format])
+            destination = self.root / relative
+            # Такое фото уже загружали: второй раз не пишем, только освежаем mtime
+            if not touch_blob(destination):
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, destination)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        url_dir = f"{MEDIA_URL_PREFIX}/{relative.rsplit('/', 1)[0]}"
+        variants = await self.processor.build_variants(destination, url_dir)
+        return {"url": f"{MEDIA_URL_PREFIX}/{relative}", "variants": variants}
+
+media_store = MediaStore()
+
+class MediaStaticFiles(StaticFiles):
+    """Раздача media: файлы по хэшу помечаются как неизменяемые"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        path = self.get_path(scope).replace(os.sep, "/")
+        if CONTENT_ADDRESSED_PATH.match(path):
+            response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+            response.headers["Expires"] = "Thu, 31 Dec 2037 23:55:55 GMT"
+        return response
+
+class UploadLimitMiddleware:
+    """
+    Отклоняет слишком большие загрузки до разбора multipart:
+    по Content-Length сразу и по фактическому числу байт при chunked-передаче.
+    """
+
+    def __init__(self, app, path_prefix: str = "/api/admin/upload",
+                 max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.path_prefix = path_prefix
+        # Запас на заголовки multipart вокруг самого файла
+        self.max_bytes = max_bytes + 64 * 1024
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length:
+            try:
+                length = int(content_length)
+            except ValueError:
+                return await self._reject(send, 400, "Invalid Content-Length")
+            if length > self.max_bytes:
+                return await self._reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail="File is too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send, status: int = 413, detail: str = "File is too large"):
+        body = b'{"detail":"%s"}' % detail.encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,68 @@
+"""
+Сборка мусора в media: удаляет файлы, на которые не ссылается ни один товар
+(ни image_url, ни image_variants).
+
+Запуск:
+    python media_gc.py --dry-run        # только показать, что будет удалено
+    python media_gc.py --min-age-hours 24
+
+Свежие файлы не трогаем: фото загружается раньше, чем создаётся товар,
+и в этот промежуток на него ещё никто не ссылается.
+"""
+import argparse
+import time
+
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import Product
+from media import MEDIA_DIR, MEDIA_URL_PREFIX, TMP_DIR_NAME
+
+def referenced_paths() -> set:
+    """Пути (относительно MEDIA_DIR), на которые ссылаются товары"""
+    urls = set()
+    with SessionLocal() as db:
+        for image_url, variants in db.execute(select(Product.image_url, Product.image_variants)):
+            if image_url:
+                urls.add(image_url)
+            for formats in (variants or {}).values():
+                urls.update(formats.values())
+    prefix = MEDIA_URL_PREFIX + "/"
+    return {url[len(prefix):] for url in urls if url.startswith(prefix)}
+
+def collect_garbage(min_age_hours: float, dry_run: bool):
+    keep = referenced_paths()
+    threshold = time.time() - min_age_hours * 3600
+    removed = 0
+    freed = 0
+    for path in MEDIA_DIR.rglob("*"):
+        if not path.is_file() or path.name == ".gitkeep":
+            continue
+        relative = path.relative_to(MEDIA_DIR).as_posix()
+        if relative in keep:
+            continue
+        # Сюда же попадают зависшие временные файлы из .tmp
+        stat = path.stat()
+        if stat.st_mtime > threshold:
+            continue
+        removed += 1
+        freed += stat.st_size
+        print(("[dry-run] " if dry_run else "") + f"удаляю {relative}")
+        if not dry_run:
+            path.unlink()
+
+    # Пустые шард-директории (папку для временных файлов оставляем)
+    if not dry_run:
+        for directory in sorted(MEDIA_DIR.rglob("*"), reverse=True):
+            if directory.is_dir() and directory.name != TMP_DIR_NAME and not any(directory.iterdir()):
+                directory.rmdir()
+
+    print(f"✅ Файлов: {removed}, освобождено: {freed / 1024 / 1024:.1f} МБ")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Удалить неиспользуемые фото из media")
+    parser.add_argument("--dry-run", action="store_true", help="ничего не удалять, только показать")
+    parser.add_argument("--min-age-hours", type=float, default=24,
+                        help="не трогать файлы моложе указанного возраста (по умолчанию 24 ч)")
+    args = parser.parse_args()
+    collect_garbage(args.min_age_hours, args.dry_run)
@@ -0,0 +1,188 @@
+"""
+Метрики производительности бэкенда в формате Prometheus (/metrics).
+
+MetricsMiddleware меряет каждый запрос: время по маршруту, коды ответа,
+число запросов в работе. События движка SQLAlchemy считают запросы к БД
+и их время — и в целом, и в разрезе HTTP-запроса (через contextvar,
+который виден и внутри асинхронного движка). Заполненность пула
+соединений читается в момент сбора метрик.
+
+SLOW_QUERY_MS > 0 включает лог медленных SQL-запросов.
+
+Под gunicorn с несколькими воркерами метрики пишутся в файлы
+PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py задаёт её сам), и /metrics
+любого воркера отдаёт сумму по всем. Пул соединений тогда считается
+событиями checkout/checkin, а не читается при сборе.
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса",
+    ["method", "route"],
+)
+REQUESTS = Counter(
+    "http_requests_total", "HTTP-запросы по коду ответа",
+    ["method", "route", "status"],
+)
+IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP-запросы в обработке", multiprocess_mode="livesum")
+EVENT_SUBSCRIBERS = Gauge("catalog_event_subscribers", "Открытые потоки /api/events", multiprocess_mode="livesum")
+# Долгие потоки (SSE) исказили бы время запросов и число запросов в обработке:
+# их считает свой gauge
+STREAMING_PATHS = {"/api/events"}
+
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Время одного SQL-запроса",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Число SQL-запросов на HTTP-запрос",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Суммарное время SQL-запросов на HTTP-запрос",
+    ["route"],
+)
+
+class RequestStats:
+    __slots__ = ("route", "queries", "db_time")
+
+    def __init__(self):
+        self.route = "unmatched"
+        self.queries = 0
+        self.db_time = 0.0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def route_label(scope) -> str:
+    """Шаблон пути (/api/products/{product_id}), а не сам путь: меньше рядов"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mount (например, /static) записывает свой префикс в root_path
+    return scope.get("root_path") or "unmatched"
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in STREAMING_PATHS:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_PROGRESS.dec()
+            _request_stats.reset(token)
+            route = route_label(scope)
+            method = scope["method"]
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            REQUESTS.labels(method, route, str(status)).inc()
+            DB_QUERIES_PER_REQUEST.labels(route).observe(stats.queries)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.db_time)
+
+def instrument_engine(engine):
+    """Подписаться на события движка (для AsyncEngine — engine.sync_engine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        DB_QUERY_LATENCY.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            logger.warning("Slow query %.1f ms: %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+class PoolCollector:
+    """Состояние пула соединений на момент сбора метрик"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.pool
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Соединения, выданные из пула")
+        size = GaugeMetricFamily("db_pool_size", "Постоянный размер пула")
+        overflow = GaugeMetricFamily("db_pool_overflow", "Соединения сверх размера пула")
+        saturation = GaugeMetricFamily("db_pool_saturation", "Доля занятых соединений от максимума")
+        # У пулов SQLite нет size()/overflow()
+        if hasattr(pool, "size"):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            checked_out.add_metric([], pool.checkedout())
+            size.add_metric([], pool.size())
+            overflow.add_metric([], max(pool.overflow(), 0))
+            saturation.add_metric([], pool.checkedout() / capacity if capacity else 0)
+        return [checked_out, size, overflow, saturation]
+
+def instrument_pool(engine):
+    """Пул при нескольких воркерах: у каждого свой, в сумму идут только живые"""
+    checked_out = Gauge("db_pool_checked_out", "Соединения, выданные из пула",
+                        multiprocess_mode="livesum", registry=None)
+    size = Gauge("db_pool_size", "Постоянный размер пула", multiprocess_mode="livesum", registry=None)
+    if hasattr(engine.pool, "size"):
+        size.set(engine.pool.size())
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+_instrumented = set()
+
+def setup_metrics(engine):
+    # python main.py импортирует main дважды (как __main__ и как main:app для uvicorn)
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+    instrument_engine(engine.sync_engine)
+    if MULTIPROCESS:
+        instrument_pool(engine.sync_engine)
+    else:
+        REGISTRY.register(PoolCollector(engine))
+
+def metrics_registry():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def render_metrics():
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
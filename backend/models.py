@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, BigInteger, DateTime, JSON, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, BigInteger, DateTime, Date, JSON, UniqueConstraint, Index, ForeignKey, CheckConstraint, DDL, event
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
 
@@ -6,12 +7,84 @@ class Product(Base):
     __tablename__ = "products"
     
     id = Column(Integer, primary_key=True, index=True)
+    sku = Column(String)  # внешний артикул, ключ массового импорта
     name = Column(String, nullable=False)
     price = Column(Integer, nullable=False)
     description = Column(Text)
     image_url = Column(String)
-    sizes = Column(JSON)  # {"S": 5, "M": 3, "L": 0}
+    image_variants = Column(JSON)  # {"thumb": {"webp": "/static/..."}, "medium": {...}}
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Растёт при каждом изменении товара: оптимистичная блокировка правок
+    version = Column(Integer, nullable=False, server_default="1")
+    # Остатки по размерам; грузятся вместе с товаром одним дополнительным SELECT
+    stock = relationship("ProductStock", lazy="selectin", order_by="ProductStock.id",
+                         cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Фильтр каталога по диапазону цен (keyset-пагинация идёт по первичному ключу)
+        Index('ix_products_price', 'price'),
+        Index('ix_products_sku', 'sku', unique=True),
+    )
+    
+    # ORM сам увеличивает version и проверяет её в WHERE при UPDATE
+    __mapper_args__ = {"version_id_col": version}
+    
+    @property
+    def sizes(self):
+        """{"S": 5, "M": 3, "L": 0} — представление строк product_stock"""
+        return {row.size: row.quantity for row in self.stock}
+
+# Полнотекстовый и нечёткий поиск (только PostgreSQL, см. search.py):
+# генерируемый tsvector по названию (вес A) и описанию (вес B)
+# и триграммные индексы pg_trgm для префиксов и опечаток
+PRODUCT_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING GIN (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_description_trgm ON products USING GIN (description gin_trgm_ops)",
+]
+
+for statement in PRODUCT_SEARCH_DDL:
+    event.listen(Product.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+class ProductStock(Base):
+    """Доступный остаток товара по размеру (зарезервированное уже вычтено)"""
+    __tablename__ = "product_stock"
+    
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    size = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint('product_id', 'size', name='unique_product_size'),
+        CheckConstraint('quantity >= 0', name='product_stock_quantity_non_negative'),
+    )
+
+class StockReservation(Base):
+    """Резерв товара: вычтен из остатка до подтверждения или истечения срока"""
+    __tablename__ = "stock_reservations"
+    
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    size = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    user_id = Column(BigInteger)
+    expires_at = Column(DateTime, nullable=False)  # naive UTC
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index('ix_stock_reservations_expires_at', 'expires_at'),
+        # id отменённого резерва не должен достаться новому (SQLite переиспользует rowid)
+        {'sqlite_autoincrement': True},
+    )
 
 class ProductView(Base):
     __tablename__ = "product_views"
@@ -23,4 +96,105 @@ class ProductView(Base):
     
     __table_args__ = (
         UniqueConstraint('user_id', 'product_id', name='unique_user_product_view'),
+        # История пользователя по порядку просмотров (совместные просмотры)
+        Index('ix_product_views_user_recent', 'user_id', 'id'),
+    )
+
+class ProductLastView(Base):
+    """Когда пользователь последний раз смотрел товар.
+    product_views хранит только первый просмотр пары, а эта строка
+    обновляется при каждом — по ней строится «Вы недавно смотрели»"""
+    __tablename__ = "product_last_views"
+    
+    user_id = Column(BigInteger, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    viewed_at = Column(DateTime(timezone=True), nullable=False)
+    
+    __table_args__ = (
+        Index('ix_product_last_views_user_recent', 'user_id', 'viewed_at'),
+    )
+
+class ProductViewCounter(Base):
+    """Счётчик уникальных просмотров товара.
+    Увеличивается при каждой реально вставленной строке product_views."""
+    __tablename__ = "product_view_counters"
+    
+    product_id = Column(Integer, primary_key=True)
+    unique_views = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('ix_product_view_counters_unique_views', 'unique_views'),
+    )
+
+class ProductViewHourly(Base):
+    """Почасовые агрегаты просмотров (bucket — начало часа, UTC)"""
+    __tablename__ = "product_view_hourly"
+    
+    product_id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    views = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('ix_product_view_hourly_bucket', 'bucket'),
+    )
+
+class ProductViewDaily(Base):
+    """Дневные агрегаты просмотров (UTC)"""
+    __tablename__ = "product_view_daily"
+    
+    product_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    views = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('ix_product_view_daily_day', 'day'),
+    )
+
+class ProductCoView(Base):
+    """Сколько пользователей смотрели оба товара («с этим товаром смотрят»).
+    Каждая пара хранится в обе стороны, чтобы список для товара читался по индексу"""
+    __tablename__ = "product_coviews"
+    
+    product_id = Column(Integer, primary_key=True)
+    other_id = Column(Integer, primary_key=True)
+    views = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index('ix_product_coviews_top', 'product_id', 'views', 'other_id'),
+    )
+
+class RollupState(Base):
+    """Докуда (по product_views.id) уже посчитаны агрегаты"""
+    __tablename__ = "rollup_state"
+    
+    name = Column(String, primary_key=True)
+    last_view_id = Column(BigInteger, nullable=False, default=0)
+
+class Broadcast(Base):
+    """Рассылка: текст (или фото с подписью) и снимок аудитории на момент создания"""
+    __tablename__ = "broadcasts"
+    
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    photo = Column(String)  # file_id фото в Telegram
+    status = Column(String, nullable=False, default="running")  # running, done, cancelled
+    total = Column(Integer, nullable=False, default=0)
+    # Аренда: рассылку ведёт один процесс бота, после его падения её подхватит другой
+    lease_owner = Column(String)
+    lease_until = Column(DateTime)  # naive UTC
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+class BroadcastRecipient(Base):
+    """Получатель рассылки и результат доставки: pending, sent, blocked, failed"""
+    __tablename__ = "broadcast_recipients"
+    
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    status = Column(String, nullable=False, default="pending")
+    error = Column(String)
+    
+    __table_args__ = (
+        # Выборка следующей пачки: WHERE broadcast_id = ? AND status = 'pending' AND user_id > ?
+        Index('ix_broadcast_recipients_pending', 'broadcast_id', 'status', 'user_id'),
     )
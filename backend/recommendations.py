@@ -0,0 +1,98 @@
+"""
+Рекомендации по просмотрам: «Вы недавно смотрели» и «С этим товаром смотрят».
+
+Индекс совместных просмотров product_coviews строится инкрементально, как
+агрегаты в rollups.py: фоновая задача берёт новые строки product_views
+после отметки в rollup_state и для каждой добавляет пары с более ранними
+просмотрами того же пользователя. Так каждая пара пользователя считается
+ровно один раз — когда обрабатывается более поздний из двух просмотров.
+
+Запросы API самосоединений не делают: список для товара — первые k строк
+индекса (product_id, views, other_id), недавние — первые k строк
+(user_id, viewed_at) в product_last_views. Списки по товару дополнительно
+кэшируются в памяти на RECOMMENDATION_TTL секунд.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import List, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased
+
+from cache import LRUStore
+from models import ProductCoView, ProductLastView, ProductView
+from rollups import RollupAggregator, rollup_upsert
+
+# Сколько рекомендаций можно запросить за раз (и сколько хранит кэш)
+RECOMMENDATIONS_MAX = 20
+
+class CoViewAggregator(RollupAggregator):
+    name = "product_coviews"
+
+    async def apply(self, db, lower: int, upper: int) -> int:
+        newer = aliased(ProductView)
+        older = aliased(ProductView)
+        # Пары (новый просмотр, более ранний просмотр того же пользователя);
+        # по индексу (user_id, id) читаются только истории этих пользователей
+        pairs = await db.execute(
+            select(newer.product_id, older.product_id, func.count())
+            .join(older, and_(older.user_id == newer.user_id, older.id < newer.id))
+            .where(newer.id > lower, newer.id <= upper)
+            .group_by(newer.product_id, older.product_id)
+        )
+        counts = defaultdict(int)
+        for product_id, other_id, views in pairs:
+            counts[(product_id, other_id)] += views
+            counts[(other_id, product_id)] += views
+        if counts:
+            await rollup_upsert(db, ProductCoView, "other_id", [
+                {"product_id": product_id, "other_id": other_id, "views": views}
+                for (product_id, other_id), views in counts.items()
+            ])
+        # Не ноль, пока отметка двигается: _run догоняет отставание пачками
+        return upper - lower
+
+class AlsoViewedCache:
+    """Списки «с этим товаром смотрят» (id товаров) с TTL.
+    Индекс обновляется раз в интервал агрегатора, точнее кэшировать незачем"""
+
+    def __init__(self, ttl: float = 60.0, max_products: int = 1000):
+        self.ttl = ttl
+        self._lists = LRUStore(max_products)
+        self._lock = threading.Lock()
+
+    async def get(self, db, product_id: int) -> List[int]:
+        with self._lock:
+            cached = self._lists.get(product_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        ids = list(await db.scalars(
+            select(ProductCoView.other_id)
+            .where(ProductCoView.product_id == product_id)
+            .order_by(ProductCoView.views.desc(), ProductCoView.other_id.desc())
+            .limit(RECOMMENDATIONS_MAX)
+        ))
+        with self._lock:
+            self._lists.set(product_id, (time.monotonic() + self.ttl, ids))
+        return ids
+
+async def recently_viewed(db, user_id: int, limit: int, exclude: Optional[int] = None) -> List[int]:
+    """Последние просмотренные пользователем товары, новые первыми"""
+    query = select(ProductLastView.product_id).where(ProductLastView.user_id == user_id)
+    if exclude is not None:
+        query = query.where(ProductLastView.product_id != exclude)
+    query = query.order_by(ProductLastView.viewed_at.desc(), ProductLastView.product_id.desc())
+    return list(await db.scalars(query.limit(limit)))
+
+coview_aggregator = CoViewAggregator(
+    interval=float(os.getenv("COVIEW_INTERVAL", "60")),
+    lag=float(os.getenv("ROLLUP_LAG", "30")),
+    batch_size=int(os.getenv("COVIEW_BATCH_SIZE", "5000")),
+)
+
+also_viewed_cache = AlsoViewedCache(
+    ttl=float(os.getenv("RECOMMENDATION_TTL", "60")),
+    max_products=int(os.getenv("CACHE_MAX_PRODUCTS", "1000")),
+)
@@ -0,0 +1,198 @@
+"""
+Почасовые и дневные агрегаты просмотров.
+
+Фоновая задача периодически берёт новые строки product_views (по id после
+сохранённой отметки в rollup_state), группирует их по товару и часу
+и прибавляет к product_view_hourly / product_view_daily. Аналитика за
+произвольный период читает только агрегаты, не трогая сырые события.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, func
+
+from database import AsyncSessionLocal, async_engine, dialect_insert
+from models import Product, ProductView, ProductViewHourly, ProductViewDaily, RollupState
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = "product_views"
+
+def to_utc_naive(value) -> datetime:
+    """Привести время к naive UTC — так хранятся границы агрегатов"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def hour_bucket(column):
+    """Начало часа (UTC) для выбранной СУБД"""
+    if async_engine.dialect.name == "postgresql":
+        return func.date_trunc("hour", func.timezone("UTC", column))
+    return func.strftime("%Y-%m-%d %H:00:00", column)
+
+# Строк в одном INSERT: держимся далеко от лимита параметров запроса
+UPSERT_CHUNK = 5000
+
+async def rollup_upsert(db, model, key_column: str, rows):
+    """Прибавить views к агрегатам (product_id, key_column)"""
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        stmt = dialect_insert(model).values(rows[i:i + UPSERT_CHUNK])
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["product_id", key_column],
+            set_={"views": model.views + stmt.excluded.views},
+        ))
+
+# Окна, доступные по короткому имени (?window=24h)
+WINDOWS = {
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+    "90d": timedelta(days=90),
+}
+
+# До этой длины окна тренд строится по часам, дальше — по дням
+HOURLY_MAX_RANGE = timedelta(days=7)
+
+async def window_stats(db, start: datetime, end: datetime, limit: int = 5) -> dict:
+    """ТОП товаров и тренд просмотров за период — только по агрегатам"""
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    if end - start <= HOURLY_MAX_RANGE:
+        granularity = "hour"
+        key = ProductViewHourly.bucket
+        views = ProductViewHourly.views
+        product_id = ProductViewHourly.product_id
+        in_range = (key >= start.replace(minute=0, second=0, microsecond=0), key < end)
+    else:
+        granularity = "day"
+        key = ProductViewDaily.day
+        views = ProductViewDaily.views
+        product_id = ProductViewDaily.product_id
+        in_range = (key >= start.date(), key <= end.date())
+
+    total = func.sum(views).label("views")
+    top = (await db.execute(
+        select(Product.id, Product.name, total)
+        .join(Product, Product.id == product_id)
+        .where(*in_range)
+        .group_by(Product.id, Product.name)
+        .order_by(total.desc(), Product.id)
+        .limit(limit)
+    )).mappings().all()
+
+    trend = (await db.execute(
+        select(key.label("bucket"), total).where(*in_range).group_by(key).order_by(key)
+    )).all()
+
+    return {
+        "start": start,
+        "end": end,
+        "granularity": granularity,
+        "total_views": sum(row.views for row in trend),
+        "top_products": [dict(row) for row in top],
+        "trend": [{"bucket": row.bucket, "views": row.views} for row in trend],
+    }
+
+class RollupAggregator:
+    """Инкрементальная обработка новых строк product_views по отметке
+    в rollup_state. Наследники задают name и apply()"""
+    name = ROLLUP_NAME
+
+    def __init__(self, session_factory=AsyncSessionLocal, interval: float = 60.0,
+                 lag: float = 30.0, batch_size: int = 50_000):
+        self.session_factory = session_factory
+        self.interval = interval
+        # Строки моложе lag секунд не трогаем: транзакция с меньшим id
+        # могла ещё не закоммититься, и отметка ушла бы дальше неё
+        self.lag = lag
+        self.batch_size = batch_size
+        self._task = None
+
+    async def run_once(self) -> int:
+        """Досчитать агрегаты по новым просмотрам. Возвращает число строк"""
+        async with self.session_factory() as db:
+            # Блокировка строки состояния: параллельные воркеры не посчитают дважды
+            state = await db.scalar(
+                select(RollupState).where(RollupState.name == self.name).with_for_update()
+            )
+            if state is None:
+                await db.execute(dialect_insert(RollupState).values(
+                    name=self.name, last_view_id=0
+                ).on_conflict_do_nothing(index_elements=["name"]))
+                state = await db.scalar(
+                    select(RollupState).where(RollupState.name == self.name).with_for_update()
+                )
+
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.lag)
+            upper = await db.scalar(
+                select(func.max(ProductView.id)).where(
+                    ProductView.id > state.last_view_id,
+                    ProductView.viewed_at <= cutoff,
+                )
+            )
+            if upper is None:
+                await db.rollback()
+                return 0
+            upper = min(upper, state.last_view_id + self.batch_size)
+            total = await self.apply(db, state.last_view_id, upper)
+            state.last_view_id = upper
+            await db.commit()
+            return total
+
+    async def apply(self, db, lower: int, upper: int) -> int:
+        """Учесть просмотры с lower < id <= upper в той же транзакции"""
+        bucket = hour_bucket(ProductView.viewed_at).label("bucket")
+        grouped = (await db.execute(
+            select(ProductView.product_id, bucket, func.count().label("views"))
+            .where(ProductView.id > lower, ProductView.id <= upper)
+            .group_by(ProductView.product_id, bucket)
+        )).all()
+
+        hourly = []
+        daily = defaultdict(int)
+        total = 0
+        for product_id, hour, views in grouped:
+            hour = to_utc_naive(hour)
+            hourly.append({"product_id": product_id, "bucket": hour, "views": views})
+            daily[(product_id, hour.date())] += views
+            total += views
+
+        if hourly:
+            await rollup_upsert(db, ProductViewHourly, "bucket", hourly)
+            await rollup_upsert(db, ProductViewDaily, "day", [
+                {"product_id": product_id, "day": day, "views": views}
+                for (product_id, day), views in daily.items()
+            ])
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                # Догоняем накопившееся отставание пачками
+                while await self.run_once():
+                    pass
+            except Exception:
+                logger.exception("Failed to update %s rollups", self.name)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+rollup_aggregator = RollupAggregator(
+    interval=float(os.getenv("ROLLUP_INTERVAL", "60")),
+    lag=float(os.getenv("ROLLUP_LAG", "30")),
+)
@@ -1,24 +1,155 @@
-from pydantic import BaseModel
-from typing import Optional, Dict
-from datetime import datetime
+from pydantic import BaseModel, Field, NonNegativeInt, field_validator, model_validator
+from typing import Optional, Dict, List, Literal
+from datetime import datetime, timezone
 
 class ProductBase(BaseModel):
+    sku: Optional[str] = None
     name: str
     price: int
     description: Optional[str] = None
     image_url: Optional[str] = None
-    sizes: Optional[Dict[str, int]] = {}
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None
+    sizes: Optional[Dict[str, NonNegativeInt]] = {}
 
 class ProductCreate(ProductBase):
     pass
 
+class ProductPatch(BaseModel):
+    """Частичное изменение: меняются только переданные поля.
+    version — версия, которую видел клиент; при расхождении ответ 409"""
+    sku: Optional[str] = None
+    name: Optional[str] = Field(None, min_length=1)
+    price: Optional[int] = Field(None, ge=0)
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None
+    sizes: Optional[Dict[str, NonNegativeInt]] = None
+    version: Optional[int] = None
+    
+    @field_validator("name", "price")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
 class ProductResponse(ProductBase):
     id: int
+    version: int
     created_at: datetime
     
     class Config:
         from_attributes = True
 
+class ProductListItem(BaseModel):
+    """Облегчённая карточка товара для каталога (без описания)"""
+    id: int
+    name: str
+    price: int
+    image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None
+    sizes: Optional[Dict[str, int]] = {}
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class ProductPage(BaseModel):
+    items: List[ProductListItem]
+    next_cursor: Optional[str] = None
+
+class Recommendations(BaseModel):
+    recently_viewed: List[ProductListItem] = []
+    also_viewed: List[ProductListItem] = []
+
+class ProductImportRow(BaseModel):
+    """Строка файла импорта: товар ищется по sku"""
+    sku: str = Field(..., min_length=1, max_length=64)
+    name: str = Field(..., min_length=1)
+    price: int = Field(..., ge=0)
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+    sizes: Optional[Dict[str, NonNegativeInt]] = None
+
+class StockChange(BaseModel):
+    size: str = Field(..., min_length=1)
+    quantity: int = Field(1, ge=1, le=100)
+
+class ReservationCreate(StockChange):
+    # Для бота и без проверки initData; иначе резерв — на пользователя сессии
+    user_id: Optional[int] = None
+    ttl: Optional[int] = Field(None, ge=30, le=24 * 3600, description="Срок резерва, секунд")
+
+class ReservationResponse(BaseModel):
+    id: int
+    product_id: int
+    size: str
+    quantity: int
+    expires_at: datetime
+    
+    class Config:
+        from_attributes = True
+    
+    @field_validator("expires_at")
+    @classmethod
+    def assume_utc(cls, value: datetime) -> datetime:
+        # В базе срок хранится в naive UTC
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
 class ProductViewCreate(BaseModel):
-    user_id: int
+    # При включённой проверке initData берётся пользователь из сессии
+    user_id: Optional[int] = None
     product_id: int
+
+class ProductViewBulkCreate(BaseModel):
+    """Несколько просмотров одного пользователя за один запрос"""
+    user_id: Optional[int] = None
+    product_ids: List[int] = Field(..., min_length=1, max_length=100)
+
+class SessionCreate(BaseModel):
+    init_data: str = Field(..., min_length=1, max_length=4096)  # Telegram.WebApp.initData
+
+class SessionResponse(BaseModel):
+    token: str
+    expires_in: int
+    user_id: int
+    is_admin: bool
+
+class BroadcastCreate(BaseModel):
+    text: str = Field(..., min_length=1, max_length=4096)
+    photo: Optional[str] = None  # file_id фото в Telegram
+    
+    @model_validator(mode="after")
+    def caption_limit(self):
+        # Подпись к фото в Telegram короче обычного сообщения
+        if self.photo and len(self.text) > 1024:
+            raise ValueError("Caption must be at most 1024 characters")
+        return self
+
+class BroadcastResponse(BaseModel):
+    id: int
+    text: str
+    photo: Optional[str] = None
+    status: str
+    total: int
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    pending: int = 0
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class BroadcastLease(BaseModel):
+    owner: str = Field(..., min_length=1, max_length=200)
+    ttl: int = Field(120, ge=10, le=3600)
+
+class BroadcastResult(BaseModel):
+    user_id: int
+    status: Literal["sent", "blocked", "failed"]
+    error: Optional[str] = Field(None, max_length=500)
+
+class BroadcastResults(BaseModel):
+    results: List[BroadcastResult] = Field(..., max_length=5000)
@@ -0,0 +1,67 @@
+"""
+Поиск товаров по названию и описанию.
+
+В PostgreSQL поиск идёт одним индексным запросом: слова запроса
+ищутся по колонке search_vector (tsvector, GIN) как префиксы —
+«фут» находит «футболку» уже при наборе, — а опечатки ловит
+pg_trgm (word_similarity по триграммным GIN-индексам name и
+description). Результаты ранжируются по ts_rank и похожести названия.
+Колонка и индексы создаются DDL из models.PRODUCT_SEARCH_DDL.
+
+Остальные СУБД (SQLite в разработке) ищут через ILIKE по каждому слову.
+"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import Select, and_, case, func, literal_column, or_, select
+
+from database import async_engine
+from models import Product
+
+# Конфигурация должна совпадать с той, что в генерируемой колонке
+SEARCH_CONFIG = literal_column("'russian'::regconfig")
+search_vector = literal_column("products.search_vector")
+
+def query_terms(query: str) -> List[str]:
+    """Слова запроса без пунктуации и операторов tsquery"""
+    return re.findall(r"\w+", query.lower())
+
+def postgres_search(columns, query: str, terms: List[str]):
+    # Каждое слово — префикс, все слова обязательны: "фут бел" -> фут:* & бел:*
+    tsquery = func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+    rank = func.ts_rank(search_vector, tsquery) + func.word_similarity(query, Product.name)
+    return (
+        select(*columns)
+        .where(or_(
+            search_vector.op("@@")(tsquery),
+            # name %> q: в названии есть слово, похожее на запрос (опечатки)
+            Product.name.op("%>")(query),
+            Product.description.op("%>")(query),
+        ))
+        .order_by(rank.desc(), Product.id.desc())
+    )
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("_", "\\_").replace("%", "\\%")
+
+def fallback_search(columns, query: str, terms: List[str]):
+    conditions = [
+        or_(
+            Product.name.ilike(f"%{escape_like(term)}%", escape="\\"),
+            Product.description.ilike(f"%{escape_like(term)}%", escape="\\"),
+        )
+        for term in terms
+    ]
+    # Сначала товары, у которых с запроса начинается название
+    starts_with = case((Product.name.ilike(f"{escape_like(query)}%", escape="\\"), 0), else_=1)
+    return select(*columns).where(and_(*conditions)).order_by(starts_with, Product.id.desc())
+
+def search_query(columns, query: str, limit: int) -> Optional[Select]:
+    """SELECT для поиска или None, если в запросе нет ни одного слова"""
+    terms = query_terms(query)
+    if not terms:
+        return None
+    query = " ".join(terms)
+    if async_engine.dialect.name == "postgresql":
+        return postgres_search(columns, query, terms).limit(limit)
+    return fallback_search(columns, query, terms).limit(limit)
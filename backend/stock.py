@@ -0,0 +1,252 @@
+"""
+Остатки по размерам и резервы.
+
+Остаток хранится строкой product_stock на пару (товар, размер).
+Списание и резерв — один условный UPDATE ... WHERE quantity >= n RETURNING:
+конкурирующие покупки сериализуются блокировкой строки в самой базе,
+поэтому продать больше, чем есть, нельзя, а чтения-изменения-записи
+в коде нет. Резерв живёт до expires_at; просроченные резервы фоновая
+задача возвращает в остаток.
+
+Каждое изменение остатка после commit рассылается клиентам (events.py).
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, delete, exists, insert, select, update
+
+from cache import product_cache
+from database import AsyncSessionLocal, dialect_insert
+from events import catalog_events, stock_event
+from models import Product, ProductStock, StockReservation
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL = int(os.getenv("RESERVATION_TTL", "900"))
+
+stock_table = ProductStock.__table__
+
+def utcnow() -> datetime:
+    """Текущее время в naive UTC — так хранится expires_at"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def normalize_sizes(sizes: Optional[Dict[str, int]]) -> Dict[str, int]:
+    return {size.strip().upper(): quantity for size, quantity in (sizes or {}).items()}
+
+def in_stock(size: str):
+    """Условие каталога: у товара есть этот размер в наличии"""
+    return exists().where(
+        ProductStock.product_id == Product.id,
+        ProductStock.size == size,
+        ProductStock.quantity > 0,
+    )
+
+async def stock_by_product(db, product_ids: Iterable[int]) -> Dict[int, Dict[str, int]]:
+    """Остатки нескольких товаров одним запросом: {product_id: {size: quantity}}"""
+    product_ids = list(product_ids)
+    result: Dict[int, Dict[str, int]] = {product_id: {} for product_id in product_ids}
+    if not product_ids:
+        return result
+    rows = await db.execute(
+        select(ProductStock.product_id, ProductStock.size, ProductStock.quantity)
+        .where(ProductStock.product_id.in_(product_ids))
+        .order_by(ProductStock.id)
+    )
+    for product_id, size, quantity in rows:
+        result[product_id][size] = quantity
+    return result
+
+def set_stock(product: Product, sizes: Optional[Dict[str, int]]) -> bool:
+    """Задать остатки товара целиком (админка): строки обновляются на месте,
+    лишние размеры удаляются, новые добавляются. True — остатки изменились"""
+    sizes = normalize_sizes(sizes)
+    current = {row.size: row for row in product.stock}
+    changed = False
+    for size, row in current.items():
+        if size not in sizes:
+            product.stock.remove(row)
+            changed = True
+    for size, quantity in sizes.items():
+        if size not in current:
+            product.stock.append(ProductStock(size=size, quantity=quantity))
+            changed = True
+        elif current[size].quantity != quantity:
+            current[size].quantity = quantity
+            changed = True
+    return changed
+
+async def upsert_stock(db, product_id: int, sizes: Dict[str, int]):
+    """Задать остатки отдельных размеров, не трогая остальные"""
+    sizes = normalize_sizes(sizes)
+    if not sizes:
+        return
+    stmt = dialect_insert(stock_table).values([
+        {"product_id": product_id, "size": size, "quantity": quantity}
+        for size, quantity in sizes.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["product_id", "size"],
+        set_={"quantity": stmt.excluded.quantity},
+    ))
+
+async def replace_stock(db, sizes_by_product: Dict[int, Dict[str, int]]):
+    """Массовая замена остатков (импорт): DELETE + INSERT без загрузки в ORM"""
+    if not sizes_by_product:
+        return
+    await db.execute(delete(stock_table).where(stock_table.c.product_id.in_(list(sizes_by_product))))
+    rows = [
+        {"product_id": product_id, "size": size, "quantity": quantity}
+        for product_id, sizes in sizes_by_product.items()
+        for size, quantity in normalize_sizes(sizes).items()
+    ]
+    if rows:
+        await db.execute(insert(stock_table), rows)
+
+def take_stock(product_id: int, size: str, quantity: int):
+    """Условное списание: строка меняется, только если остатка хватает"""
+    return (
+        update(stock_table)
+        .where(
+            stock_table.c.product_id == product_id,
+            stock_table.c.size == size,
+            stock_table.c.quantity >= quantity,
+        )
+        .values(quantity=stock_table.c.quantity - quantity)
+        .returning(stock_table.c.quantity)
+    )
+
+async def decrement(db, product_id: int, size: str, quantity: int) -> Optional[int]:
+    """Списать остаток. Возвращает новый остаток или None, если не хватило"""
+    remaining = await db.scalar(take_stock(product_id, size, quantity))
+    await db.commit()
+    if remaining is not None:
+        product_cache.invalidate(product_id)
+        await catalog_events.publish(stock_event(product_id, {size: remaining}))
+    return remaining
+
+async def reserve(db, product_id: int, size: str, quantity: int,
+                  ttl: int = RESERVATION_TTL, user_id: Optional[int] = None) -> Optional[StockReservation]:
+    """Вычесть остаток и создать резерв в одной транзакции.
+    None, если остатка не хватило"""
+    remaining = await db.scalar(take_stock(product_id, size, quantity))
+    if remaining is None:
+        await db.rollback()
+        return None
+    reservation = StockReservation(
+        product_id=product_id,
+        size=size,
+        quantity=quantity,
+        user_id=user_id,
+        expires_at=utcnow() + timedelta(seconds=ttl),
+    )
+    db.add(reservation)
+    await db.commit()
+    product_cache.invalidate(product_id)
+    await catalog_events.publish(stock_event(product_id, {size: remaining}))
+    return reservation
+
+async def confirm(db, reservation_id: int) -> Optional[StockReservation]:
+    """Подтвердить покупку: резерв удаляется, остаток уже списан.
+    Просроченный резерв подтвердить нельзя — его вернёт фоновая задача"""
+    row = (await db.execute(
+        delete(StockReservation)
+        .where(StockReservation.id == reservation_id, StockReservation.expires_at > utcnow())
+        .returning(StockReservation)
+        .execution_options(synchronize_session=False)
+    )).scalar_one_or_none()
+    await db.commit()
+    return row
+
+async def restore(db, rows: List[tuple]):
+    """Вернуть в остаток количество из удалённых резервов"""
+    totals: Dict[tuple, int] = defaultdict(int)
+    for product_id, size, quantity in rows:
+        totals[(product_id, size)] += quantity
+    if not totals:
+        return
+    # Если размер за это время удалили из товара, возвращать некуда
+    await db.execute(
+        update(stock_table)
+        .where(stock_table.c.product_id == bindparam("b_product_id"),
+               stock_table.c.size == bindparam("b_size"))
+        .values(quantity=stock_table.c.quantity + bindparam("b_quantity")),
+        [
+            {"b_product_id": product_id, "b_size": size, "b_quantity": quantity}
+            for (product_id, size), quantity in totals.items()
+        ],
+    )
+
+async def publish_stock(db, product_ids: Iterable[int]):
+    """Разослать текущие остатки товаров (после возврата резервов)"""
+    for product_id, sizes in (await stock_by_product(db, product_ids)).items():
+        await catalog_events.publish(stock_event(product_id, sizes))
+
+async def release(db, reservation_id: int) -> bool:
+    """Отменить резерв и вернуть товар в остаток"""
+    rows = (await db.execute(
+        delete(StockReservation)
+        .where(StockReservation.id == reservation_id)
+        .returning(StockReservation.product_id, StockReservation.size, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    )).all()
+    await restore(db, rows)
+    await db.commit()
+    for product_id, _, _ in rows:
+        product_cache.invalidate(product_id)
+    await publish_stock(db, {row.product_id for row in rows})
+    return bool(rows)
+
+class ReservationReaper:
+    """Фоновая задача: возвращает в остаток просроченные резервы"""
+
+    def __init__(self, session_factory=AsyncSessionLocal, interval: float = 30.0):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task = None
+
+    async def run_once(self) -> int:
+        """Снять просроченные резервы. Возвращает их число"""
+        async with self.session_factory() as db:
+            # DELETE ... RETURNING: каждый резерв вернёт ровно один воркер
+            rows = (await db.execute(
+                delete(StockReservation)
+                .where(StockReservation.expires_at <= utcnow())
+                .returning(StockReservation.product_id, StockReservation.size, StockReservation.quantity)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await restore(db, rows)
+            await db.commit()
+            product_ids = {row.product_id for row in rows}
+            for product_id in product_ids:
+                product_cache.invalidate(product_id)
+            await publish_stock(db, product_ids)
+        return len(rows)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Failed to release expired reservations")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+reservation_reaper = ReservationReaper(
+    interval=float(os.getenv("RESERVATION_SWEEP_INTERVAL", "30")),
+)
@@ -0,0 +1,145 @@
+"""
+Буферизованная запись просмотров товаров.
+
+Эндпоинт /api/views только кладёт событие в память, а фоновая задача
+пишет накопленные просмотры пачкой одним INSERT ... ON CONFLICT DO NOTHING.
+В той же транзакции увеличиваются счётчики product_view_counters — ровно
+на число реально вставленных (новых уникальных) просмотров — и сдвигается
+время последнего просмотра в product_last_views.
+Пачка сбрасывается при достижении batch_size или раз в flush_interval
+секунд, а также при остановке приложения.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Tuple
+
+from database import AsyncSessionLocal, dialect_insert
+from models import ProductLastView, ProductView, ProductViewCounter
+
+logger = logging.getLogger(__name__)
+
+def counter_upsert(increments: Dict[int, int]):
+    """Прибавить к счётчикам уникальных просмотров {product_id: +n}"""
+    stmt = dialect_insert(ProductViewCounter).values([
+        {"product_id": product_id, "unique_views": count}
+        for product_id, count in increments.items()
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=["product_id"],
+        set_={"unique_views": ProductViewCounter.unique_views + stmt.excluded.unique_views},
+    )
+
+def last_view_upsert(batch):
+    """Сдвинуть время последнего просмотра; более раннее (пачка другого
+    воркера, пришедшая позже) его не откатывает"""
+    stmt = dialect_insert(ProductLastView).values([
+        {"user_id": user_id, "product_id": product_id, "viewed_at": viewed_at}
+        for (user_id, product_id), viewed_at in batch
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "product_id"],
+        set_={"viewed_at": stmt.excluded.viewed_at},
+        where=ProductLastView.viewed_at < stmt.excluded.viewed_at,
+    )
+
+class ViewIngestor:
+    def __init__(self, session_factory=AsyncSessionLocal, batch_size: int = 500,
+                 flush_interval: float = 1.0, max_pending: int = 100_000):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # (user_id, product_id) -> время последнего просмотра: повторы
+        # внутри одной пачки схлопываются ещё до базы
+        self._pending: Dict[Tuple[int, int], datetime] = {}
+        # Примитивы asyncio создаются в start(), внутри рабочего event loop
+        self._batch_ready = None
+        self._flush_lock = None
+        self._task = None
+        self._stopping = False
+
+    def add(self, user_id: int, product_id: int) -> bool:
+        """Поставить просмотр в очередь. False, если буфер переполнен"""
+        return self.add_many([(user_id, product_id)])
+
+    def add_many(self, views: Iterable[Tuple[int, int]]) -> bool:
+        views = list(views)
+        if len(self._pending) + len(views) > self.max_pending:
+            return False
+        viewed_at = datetime.now(timezone.utc)
+        for key in views:
+            self._pending[key] = viewed_at
+        if len(self._pending) >= self.batch_size and self._batch_ready is not None:
+            self._batch_ready.set()
+        return True
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """Записать всё накопленное. Возвращает число отправленных строк"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                batch = [(key, self._pending.pop(key)) for key in list(self._pending)[:self.batch_size]]
+                try:
+                    await self._write_batch(batch)
+                except Exception:
+                    logger.exception("Failed to flush %d product views", len(batch))
+                    # Возвращаем пачку в буфер (более свежий повтор не затираем),
+                    # следующая попытка — по таймеру
+                    for key, viewed_at in batch:
+                        self._pending.setdefault(key, viewed_at)
+                    break
+                written += len(batch)
+            return written
+
+    async def _write_batch(self, batch):
+        rows = [{"user_id": user_id, "product_id": product_id} for (user_id, product_id), _ in batch]
+        stmt = dialect_insert(ProductView).values(rows).on_conflict_do_nothing(
+            index_elements=["user_id", "product_id"]
+        ).returning(ProductView.product_id)
+        async with self.session_factory() as db:
+            inserted = (await db.scalars(stmt)).all()
+            if inserted:
+                await db.execute(counter_upsert(Counter(inserted)))
+            await db.execute(last_view_upsert(batch))
+            await db.commit()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._batch_ready = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую задачу и дописать остаток буфера"""
+        if self._task is not None:
+            # Не отменяем задачу посреди записи: просим цикл завершиться сам
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+view_ingestor = ViewIngestor(
+    batch_size=int(os.getenv("VIEW_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("VIEW_FLUSH_INTERVAL", "1.0")),
+    max_pending=int(os.getenv("VIEW_MAX_PENDING", "100000")),
+)
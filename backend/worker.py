@@ -0,0 +1,16 @@
+"""
+Воркер gunicorn: UvicornWorker с пределом ожидания открытых запросов.
+
+Потоки /api/events закрываются по сигналу остановки (events.py), но клиент,
+переставший читать, держал бы свой запрос, и uvicorn ждал бы его, пока
+gunicorn не убьёт воркер через graceful_timeout, — фоновые задачи (запись
+накопленных просмотров) не успели бы завершиться. Поэтому открытые запросы
+ждём не дольше половины graceful_timeout, вторая половина — на остановку
+приложения.
+"""
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+class UvicornWorker(BaseUvicornWorker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(self.cfg.graceful_timeout // 2, 1)
@@ -0,0 +1,127 @@
+"""
+Пробная рассылка против заглушки Bot API (fake_bot_api.py).
+
+Наполняет базу аудиторией из --recipients пользователей, поднимает
+бэкенд и заглушку с лимитами Telegram, создаёт рассылку и отправляет
+её настоящим Broadcaster бота — с RateLimitMiddleware в сессии. Итог —
+JSON: сколько доставлено, сколько раз заглушка ответила 429, время
+и скорость рассылки.
+
+    python benchmarks/broadcast.py --recipients 5000 --latency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from fake_bot_api import FakeBotAPI
+from run import ROOT, backend_env, free_port, git_commit, load_bot, start_backend, wait_ready
+
+async def run(args) -> dict:
+    env = backend_env(args)
+    # Каждый пользователь смотрел в среднем 4 товара: аудитория почти вся
+    seed = [sys.executable, str(ROOT / "benchmarks" / "seed.py"), "--products", "200",
+            "--users", str(args.recipients), "--views", str(args.recipients * 4)]
+    if args.reset:
+        seed.append("--reset")
+    if subprocess.run(seed, env=env, stdout=sys.stderr).returncode:
+        raise SystemExit(1)
+
+    fake = FakeBotAPI(args.global_limit, args.chat_limit, args.blocked_every, args.latency / 1000)
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    api_port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    backend_port = free_port()
+    backend_url = f"http://127.0.0.1:{backend_port}"
+    server = start_backend(env, backend_port)
+    try:
+        async with aiohttp.ClientSession(base_url=backend_url) as client:
+            await wait_ready(client, server)
+
+        os.environ.update({
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{api_port}",
+            "BOT_GLOBAL_RATE": str(args.bot_rate),
+        })
+        bot_main = load_bot(backend_url, args)
+        await bot_main.dp.emit_startup(bot=bot_main.bot, dispatcher=bot_main.dp)
+        try:
+            api = bot_main.dp["api"]
+            broadcaster = bot_main.Broadcaster(bot_main.bot, api, rate=args.rate, workers=args.workers)
+            broadcast = await api.create_broadcast("Новые поступления в <b>bro shop</b>!")
+
+            async def report(progress: dict, rate: float):
+                print(f"… {progress['total'] - progress['pending']}/{progress['total']} · {rate:.1f} сообщ./с",
+                      file=sys.stderr)
+
+            started = time.perf_counter()
+            progress = await broadcaster.run(broadcast["id"], report)
+            elapsed = time.perf_counter() - started
+        finally:
+            await bot_main.dp.emit_shutdown(bot=bot_main.bot, dispatcher=bot_main.dp)
+            await bot_main.bot.session.close()
+    finally:
+        server.terminate()
+        server.wait()
+        await runner.cleanup()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "recipients": broadcast["total"],
+            "rate": args.rate,
+            "workers": args.workers,
+            "bot_rate": args.bot_rate,
+            "api_latency_ms": args.latency,
+            "api_global_limit": args.global_limit,
+        },
+        "results": {
+            "status": progress["status"],
+            "sent": progress["sent"],
+            "blocked": progress["blocked"],
+            "failed": progress["failed"],
+            "pending": progress["pending"],
+            "duration_s": round(elapsed, 2),
+            "throughput_mps": round((progress["sent"] + progress["blocked"] + progress["failed"]) / elapsed, 1),
+            "api_429": fake.stats["too_many_requests"],
+            "api_peak_rps": fake.stats["peak_rps"],
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Пробная рассылка против заглушки Bot API")
+    parser.add_argument("--database-url", help="база для бэкенда (по умолчанию временный SQLite)")
+    parser.add_argument("--reset", action="store_true", help="заменить данные в существующей базе")
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=25, help="BROADCAST_RATE, сообщений в секунду")
+    parser.add_argument("--workers", type=int, default=16, help="BROADCAST_WORKERS")
+    parser.add_argument("--bot-rate", type=float, default=30, help="BOT_GLOBAL_RATE")
+    parser.add_argument("--global-limit", type=int, default=30, help="лимит заглушки, сообщений в секунду")
+    parser.add_argument("--chat-limit", type=int, default=4)
+    parser.add_argument("--blocked-every", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=50, help="задержка ответа заглушки, мс")
+    parser.add_argument("--output", help="сохранить JSON в файл")
+    args = parser.parse_args()
+    args.fsm_storage = "memory"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url is None:
+            args.database_url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        report = asyncio.run(run(args))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
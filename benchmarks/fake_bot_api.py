@@ -0,0 +1,114 @@
+"""
+Локальная заглушка Telegram Bot API для пробных рассылок и замеров.
+
+Отвечает на sendMessage/sendPhoto и прочие методы как настоящий API,
+но ничего не отправляет. Ограничения повторяют Telegram: больше
+--global-limit сообщений в секунду на бота или --chat-limit в секунду
+в один чат — ответ 429 с retry_after. Каждый --blocked-every-й
+пользователь «заблокировал бота» (403). Счётчики — на GET /stats.
+
+Запуск вместе с ботом:
+
+    python benchmarks/fake_bot_api.py --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python bot/main.py
+"""
+import argparse
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+SEND_METHODS = {"sendmessage", "sendphoto", "copymessage", "editmessagetext"}
+
+class FakeBotAPI:
+    def __init__(self, global_limit: int = 30, chat_limit: int = 4, blocked_every: int = 0,
+                 latency: float = 0.0, retry_after: int = 1):
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.blocked_every = blocked_every
+        self.latency = latency
+        self.retry_after = retry_after
+        self._sent = deque()
+        self._chats = defaultdict(deque)
+        self.stats = {"requests": 0, "sent": 0, "blocked": 0, "too_many_requests": 0, "peak_rps": 0}
+        self._message_id = 0
+
+    @staticmethod
+    def _window(timestamps: deque, now: float) -> int:
+        while timestamps and timestamps[0] <= now - 1:
+            timestamps.popleft()
+        return len(timestamps)
+
+    def _error(self, code: int, description: str, **parameters) -> web.Response:
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.stats["requests"] += 1
+        method = request.match_info["method"].lower()
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getme":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot",
+            }})
+        if method not in SEND_METHODS:
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = int(data.get("chat_id", 0))
+        now = time.monotonic()
+        if (self._window(self._sent, now) >= self.global_limit
+                or self._window(self._chats[chat_id], now) >= self.chat_limit):
+            self.stats["too_many_requests"] += 1
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                               retry_after=self.retry_after)
+        if self.blocked_every and chat_id % self.blocked_every == 0:
+            self.stats["blocked"] += 1
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        self._sent.append(now)
+        self._chats[chat_id].append(now)
+        self.stats["sent"] += 1
+        self.stats["peak_rps"] = max(self.stats["peak_rps"], len(self._sent))
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if method == "sendphoto":
+            message["photo"] = [{"file_id": data.get("photo", "photo"), "file_unique_id": "photo",
+                                 "width": 1, "height": 1}]
+            message["caption"] = data.get("caption")
+        else:
+            message["text"] = data.get("text")
+        return web.json_response({"ok": True, "result": message})
+
+    async def stats_view(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/stats", self.stats_view)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--global-limit", type=int, default=30, help="сообщений в секунду на бота")
+    parser.add_argument("--chat-limit", type=int, default=4,
+                        help="сообщений в секунду в один чат (с учётом коротких всплесков)")
+    parser.add_argument("--blocked-every", type=int, default=0, help="каждый N-й user_id заблокировал бота")
+    parser.add_argument("--latency", type=float, default=0, help="задержка ответа, мс")
+    args = parser.parse_args()
+    api = FakeBotAPI(args.global_limit, args.chat_limit, args.blocked_every, args.latency / 1000)
+    web.run_app(api.app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+Нагрузочный бенчмарк API и хэндлеров бота.
+
+Скрипт наполняет базу (seed.py), поднимает бэкенд отдельным процессом
+uvicorn и гоняет сценарии с фиксированной конкурентностью:
+
+- api.*  — HTTP-запросы к /api/products, /api/products/{id}, /api/views, /api/stats,
+  /api/recommendations
+- bot.*  — синтетические апдейты через dp.feed_update; Telegram API заменён
+  заглушкой, запросы бота к бэкенду настоящие. Лимиты исходящих сообщений
+  (ratelimit.py) здесь не действуют — рассылки меряет benchmarks/broadcast.py
+
+Результат — JSON с p50/p95/p99 и пропускной способностью по каждому сценарию
+и метаданными прогона (коммит, база, параметры). --baseline сравнивает
+с сохранённым прогоном:
+
+    python benchmarks/run.py --output before.json
+    ... изменения ...
+    python benchmarks/run.py --output after.json --baseline before.json
+
+По умолчанию база — временный файл SQLite; для PostgreSQL передайте
+--database-url (данные в ней будут заменены, нужен --reset).
+
+Бэкенд запускается с BOT_TOKEN бенчмарка: запросы от имени пользователей
+идут с токенами сессий, полученными по подписанным initData, бот ходит
+в админские маршруты с ключом сервиса. Для --backend-url передайте
+его BOT_TOKEN в --bot-token.
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent.parent
+ADMIN_ID = 1
+BENCH_BOT_TOKEN = "123456:benchmark"
+# Сколько пользователей с сессиями в сценариях api.views и api.recommendations
+SESSION_USERS = 200
+SEARCH_QUERIES = ["фут", "худи", "кепка чёрная", "джинсы", "футболка бел", "куртка"]
+
+API_SCENARIOS = ["api.products", "api.product", "api.views", "api.stats", "api.recommendations"]
+BOT_SCENARIOS = ["bot.start", "bot.edit", "bot.stats", "bot.inline_search"]
+
+# --- Измерение ---
+
+def percentile(sorted_values, p: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def summarize(latencies, errors: int, duration: float) -> dict:
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+async def run_load(action, concurrency: int, duration: float, warmup: float) -> dict:
+    """Гонять action в concurrency корутинах warmup + duration секунд.
+    action возвращает False или бросает исключение при ошибке.
+    В результат попадают только вызовы, начатые после прогрева"""
+    latencies = []
+    errors = 0
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    async def worker():
+        nonlocal errors
+        while True:
+            started = time.perf_counter()
+            if started >= stop_at:
+                return
+            try:
+                ok = await action()
+            except Exception:
+                ok = False
+            if started < measure_from:
+                continue
+            if ok is False:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, duration)
+
+# --- Бэкенд ---
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def seed(args, env):
+    command = [sys.executable, str(ROOT / "benchmarks" / "seed.py"),
+               "--products", str(args.products), "--views", str(args.views),
+               "--users", str(args.users), "--seed", str(args.seed)]
+    if args.reset:
+        command.append("--reset")
+    if subprocess.run(command, env=env, stdout=sys.stderr).returncode:
+        raise SystemExit(1)
+
+def start_backend(env, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT / "backend", env=env,
+    )
+
+def backend_env(args, bot_token: str = BENCH_BOT_TOKEN) -> dict:
+    return dict(os.environ, DATABASE_URL=args.database_url, BOT_TOKEN=bot_token, ADMIN_IDS=str(ADMIN_ID))
+
+def sign_init_data(bot_token: str, user_id: int) -> str:
+    """initData, как его подписывает Telegram для мини-приложения"""
+    data = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"benchmark-{user_id}",
+        "user": json.dumps({"id": user_id, "first_name": f"user{user_id}"}, separators=(",", ":")),
+    }
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    check_string = "\n".join(f"{key}={value}" for key, value in sorted(data.items()))
+    data["hash"] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(data)
+
+async def create_sessions(client: aiohttp.ClientSession, bot_token: str, user_ids) -> list:
+    """Обменять initData пользователей на токены сессий"""
+    async def session(user_id: int) -> str:
+        async with client.post("/api/auth/session", json={"init_data": sign_init_data(bot_token, user_id)}) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Сессия не создана: {response.status} {await response.text()}")
+            return (await response.json())["token"]
+
+    return await asyncio.gather(*(session(user_id) for user_id in user_ids))
+
+async def status(response_cm) -> int:
+    """Код ответа; тело дочитывается, чтобы соединение вернулось в пул"""
+    async with response_cm as response:
+        await response.read()
+        return response.status
+
+async def wait_ready(client: aiohttp.ClientSession, server: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError("Бэкенд завершился при запуске")
+        try:
+            if await status(client.get("/api/products", params={"limit": 1})) == 200:
+                return
+        except aiohttp.ClientConnectionError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Бэкенд не ответил за отведённое время")
+
+async def collect_product_ids(client: aiohttp.ClientSession) -> list:
+    """id всех товаров: по страницам каталога, а не только последние"""
+    product_ids = []
+    params = {"limit": 100}
+    while True:
+        async with client.get("/api/products", params=params) as response:
+            page = await response.json()
+        product_ids.extend(product["id"] for product in page["items"])
+        if not page["next_cursor"]:
+            return product_ids
+        params["cursor"] = page["next_cursor"]
+
+# --- Сценарии API ---
+
+def api_actions(client: aiohttp.ClientSession, rng: random.Random, product_ids, tokens):
+    def auth():
+        return {"Authorization": f"Bearer {rng.choice(tokens)}"}
+
+    async def products():
+        params = {"limit": 20}
+        # Часть запросов — с фильтрами, чтобы не мерить только попадания в кэш
+        if rng.random() < 0.5:
+            params["size"] = rng.choice(["S", "M", "L", "XL"])
+        if rng.random() < 0.3:
+            params["max_price"] = rng.randrange(2000, 15000, 500)
+        return await status(client.get("/api/products", params=params)) == 200
+
+    async def product():
+        return await status(client.get(f"/api/products/{rng.choice(product_ids)}")) == 200
+
+    async def views():
+        return await status(client.post("/api/views", json={
+            "product_id": rng.choice(product_ids),
+        }, headers=auth())) == 202
+
+    async def stats():
+        return await status(client.get("/api/stats")) == 200
+
+    async def recommendations():
+        return await status(client.get("/api/recommendations", params={
+            "product_id": rng.choice(product_ids),
+        }, headers=auth())) == 200
+
+    return {"api.products": products, "api.product": product, "api.views": views, "api.stats": stats,
+            "api.recommendations": recommendations}
+
+# --- Сценарии бота ---
+
+def load_bot(backend_url: str, args, bot_token: str = BENCH_BOT_TOKEN):
+    """Импортировать bot/main.py с окружением для бенчмарка"""
+    os.environ.update({
+        "BOT_TOKEN": bot_token,
+        "ADMIN_IDS": str(ADMIN_ID),
+        "BACKEND_URL": backend_url,
+        "FSM_STORAGE": args.fsm_storage,
+        "BOT_MODE": "polling",
+    })
+    sys.path.insert(0, str(ROOT / "bot"))
+    import main as bot_main
+    return bot_main
+
+def stub_session(latency: float):
+    """Сессия aiogram вместо Telegram Bot API: отвечает сразу (или через latency секунд)"""
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message
+
+    class StubSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            if latency:
+                await asyncio.sleep(latency)
+            if method.__returning__ is Message:
+                return Message(
+                    message_id=1, date=datetime.datetime.now(),
+                    chat=Chat(id=getattr(method, "chat_id", ADMIN_ID), type="private"),
+                    text=getattr(method, "text", None),
+                ).as_(bot)
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+def bot_actions(bot_main, rng: random.Random, product_ids, users: int):
+    from aiogram.types import CallbackQuery, Chat, InlineQuery, Message, Update, User
+
+    dp, bot = bot_main.dp, bot_main.bot
+    admin = User(id=ADMIN_ID, is_bot=False, first_name="admin")
+    update_ids = iter(range(1, 1 << 62))
+
+    def user():
+        return User(id=rng.randint(2, users + 1), is_bot=False, first_name="user")
+
+    def message(from_user: User, text: str) -> Update:
+        return Update(update_id=next(update_ids), message=Message(
+            message_id=1, date=datetime.datetime.now(), text=text,
+            chat=Chat(id=from_user.id, type="private"), from_user=from_user,
+        ))
+
+    def feed(make_update):
+        async def action():
+            await dp.feed_update(bot, make_update())
+        return action
+
+    return {
+        "bot.start": feed(lambda: message(user(), "/start")),
+        "bot.edit": feed(lambda: message(admin, f"/edit {rng.choice(product_ids)}")),
+        "bot.stats": feed(lambda: Update(update_id=next(update_ids), callback_query=CallbackQuery(
+            id="1", from_user=admin, chat_instance="benchmark", data="admin_stats",
+            message=Message(message_id=1, date=datetime.datetime.now(),
+                            chat=Chat(id=ADMIN_ID, type="private"), text="admin"),
+        ))),
+        "bot.inline_search": feed(lambda: Update(update_id=next(update_ids), inline_query=InlineQuery(
+            id="1", from_user=user(), query=rng.choice(SEARCH_QUERIES), offset="", chat_type="private",
+        ))),
+    }
+
+# --- Отчёт ---
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(baseline: dict, report: dict):
+    """Таблица изменений относительно сохранённого прогона (в stderr)"""
+    def delta(old, new):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nСравнение с {baseline['meta'].get('commit')} -> {report['meta']['commit']}", file=sys.stderr)
+    print(f"{'сценарий':<20}{'p95, мс':>24}{'rps':>26}", file=sys.stderr)
+    for name, new in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        p95 = f"{old['p95_ms']} -> {new['p95_ms']} ({delta(old['p95_ms'], new['p95_ms'])})"
+        rps = f"{old['throughput_rps']} -> {new['throughput_rps']} ({delta(old['throughput_rps'], new['throughput_rps'])})"
+        print(f"{name:<20}{p95:>24}{rps:>26}", file=sys.stderr)
+
+async def run(args) -> dict:
+    scenarios = args.scenarios.split(",") if args.scenarios else API_SCENARIOS + BOT_SCENARIOS
+    unknown = set(scenarios) - set(API_SCENARIOS + BOT_SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    server = None
+    backend_url = args.backend_url
+    if backend_url is None:
+        env = backend_env(args, args.bot_token)
+        seed(args, env)
+        port = free_port()
+        backend_url = f"http://127.0.0.1:{port}"
+        server = start_backend(env, port)
+
+    rng = random.Random(args.seed)
+    results = {}
+    try:
+        async with aiohttp.ClientSession(
+            base_url=backend_url,
+            connector=aiohttp.TCPConnector(limit=args.concurrency),
+            timeout=aiohttp.ClientTimeout(total=30),
+        ) as client:
+            await wait_ready(client, server)
+            product_ids = await collect_product_ids(client)
+            if not product_ids:
+                raise SystemExit("В базе нет товаров")
+
+            tokens = []
+            if any(name in ("api.views", "api.recommendations") for name in scenarios):
+                # Пользователи из наполненной базы: у них есть история просмотров
+                tokens = await create_sessions(client, args.bot_token, range(1, min(args.users, SESSION_USERS) + 1))
+            actions = api_actions(client, rng, product_ids, tokens)
+            for name in scenarios:
+                if name in actions:
+                    print(f"… {name}", file=sys.stderr)
+                    results[name] = await run_load(actions[name], args.concurrency, args.duration, args.warmup)
+
+        if any(name in BOT_SCENARIOS for name in scenarios):
+            bot_main = load_bot(backend_url, args, args.bot_token)
+            bot_main.bot.session = stub_session(args.telegram_latency / 1000)
+            await bot_main.dp.emit_startup(bot=bot_main.bot, dispatcher=bot_main.dp)
+            try:
+                actions = bot_actions(bot_main, rng, product_ids, args.users)
+                for name in scenarios:
+                    if name in actions:
+                        print(f"… {name}", file=sys.stderr)
+                        results[name] = await run_load(actions[name], args.concurrency, args.duration, args.warmup)
+            finally:
+                await bot_main.dp.emit_shutdown(bot=bot_main.bot, dispatcher=bot_main.dp)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "database": "external" if args.backend_url else args.database_url.split(":", 1)[0],
+            "products": len(product_ids),
+            "views": args.views,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк API и хэндлеров бота")
+    parser.add_argument("--database-url", help="база для бэкенда (по умолчанию временный SQLite)")
+    parser.add_argument("--backend-url", help="уже запущенный бэкенд: без наполнения базы и запуска uvicorn")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--views", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--reset", action="store_true", help="заменить данные в существующей базе")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="секунд на сценарий")
+    parser.add_argument("--warmup", type=float, default=1, help="секунд прогрева (не учитываются)")
+    parser.add_argument("--scenarios", help="через запятую: " + ",".join(API_SCENARIOS + BOT_SCENARIOS))
+    parser.add_argument("--telegram-latency", type=float, default=0, help="задержка заглушки Telegram API, мс")
+    parser.add_argument("--bot-token", default=BENCH_BOT_TOKEN, help="BOT_TOKEN бэкенда (для --backend-url)")
+    parser.add_argument("--fsm-storage", default="memory", choices=["memory", "sql"])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить JSON в файл")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url is None:
+            args.database_url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        report = asyncio.run(run(args))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    if args.baseline:
+        compare(json.loads(Path(args.baseline).read_text(encoding="utf-8")), report)
+
+if __name__ == "__main__":
+    main()
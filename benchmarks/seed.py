@@ -0,0 +1,117 @@
+"""
+Наполнение базы для бенчмарков.
+
+Создаёт N товаров с остатками по размерам и M уникальных просмотров
+за последние 30 дней, пересчитывает счётчики и агрегаты просмотров.
+Данные зависят только от --seed, поэтому прогоны на разных коммитах
+сравнимы. База берётся из DATABASE_URL:
+
+    DATABASE_URL=sqlite:///bench.db python benchmarks/seed.py --products 1000 --views 20000
+
+Если в базе уже есть товары, нужен --reset (данные каталога и просмотров удаляются).
+"""
+import argparse
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from sqlalchemy import delete, func, insert, select
+
+from database import engine
+from init_db import init_db
+from models import (
+    Product, ProductCoView, ProductStock, ProductView, ProductViewCounter, ProductViewDaily, ProductViewHourly,
+    RollupState, StockReservation,
+)
+from recommendations import CoViewAggregator
+from rollups import RollupAggregator
+
+KINDS = ["Футболка", "Худи", "Свитшот", "Кепка", "Джинсы", "Куртка", "Шорты", "Рубашка"]
+COLORS = ["белая", "чёрная", "серая", "синяя", "красная", "зелёная", "бежевая"]
+SIZES = ["XS", "S", "M", "L", "XL", "XXL"]
+BATCH = 5000
+
+RESET_ORDER = [
+    ProductViewHourly, ProductViewDaily, ProductCoView, RollupState, ProductViewCounter, ProductView,
+    StockReservation, ProductStock, Product,
+]
+
+def chunks(rows, size=BATCH):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def seed_products(conn, rng: random.Random, count: int):
+    rows = []
+    for number in range(1, count + 1):
+        kind = rng.choice(KINDS)
+        rows.append({
+            "sku": f"BENCH-{number:06d}",
+            "name": f"{kind} {rng.choice(COLORS)} {number}",
+            "price": rng.randrange(990, 15000, 10),
+            "description": f"{kind} из хлопка, коллекция {rng.randint(2019, 2025)}",
+        })
+    for batch in chunks(rows):
+        conn.execute(insert(Product.__table__), batch)
+
+    product_ids = conn.scalars(select(Product.id).order_by(Product.id)).all()
+    stock = [
+        {"product_id": product_id, "size": size, "quantity": rng.randint(0, 20)}
+        for product_id in product_ids
+        for size in rng.sample(SIZES, rng.randint(1, len(SIZES)))
+    ]
+    for batch in chunks(stock):
+        conn.execute(insert(ProductStock.__table__), batch)
+    return product_ids
+
+def seed_views(conn, rng: random.Random, product_ids, count: int, users: int):
+    now = datetime.now(timezone.utc)
+    count = min(count, users * len(product_ids))
+    pairs = set()
+    while len(pairs) < count:
+        pairs.add((rng.randint(1, users), rng.choice(product_ids)))
+    rows = [
+        {"user_id": user_id, "product_id": product_id,
+         "viewed_at": now - timedelta(seconds=rng.randint(60, 30 * 86400))}
+        for user_id, product_id in sorted(pairs)
+    ]
+    for batch in chunks(rows):
+        conn.execute(insert(ProductView.__table__), batch)
+    conn.execute(insert(ProductViewCounter.__table__).from_select(
+        ["product_id", "unique_views"],
+        select(ProductView.product_id, func.count()).group_by(ProductView.product_id),
+    ))
+
+async def build_rollups():
+    for aggregator in (RollupAggregator(lag=0), CoViewAggregator(lag=0, batch_size=5000)):
+        while await aggregator.run_once():
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Наполнить базу данными для бенчмарков")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--views", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000, help="число разных user_id в просмотрах")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true", help="удалить существующие товары и просмотры")
+    args = parser.parse_args()
+
+    init_db()
+    rng = random.Random(args.seed)
+    with engine.begin() as conn:
+        if conn.scalar(select(func.count()).select_from(Product)):
+            if not args.reset:
+                print("❌ В базе уже есть товары; запустите с --reset, чтобы их удалить")
+                sys.exit(1)
+            for model in RESET_ORDER:
+                conn.execute(delete(model))
+        product_ids = seed_products(conn, rng, args.products)
+        seed_views(conn, rng, product_ids, args.views, args.users)
+    asyncio.run(build_rollups())
+    print(f"✅ Товаров: {len(product_ids)}, просмотров: {min(args.views, args.users * len(product_ids))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Микробенчмарк сериализации ответов API (без сети и базы).
+
+Сравнивает на страницах из --sizes товаров:
+
+- fastapi   — как было: ORM-объекты -> model_validate -> jsonable_encoder
+              -> JSONResponse (так FastAPI отдаёт возвращённые модели);
+- validated — модели из строк с проверкой типов -> TypeAdapter.dump_json;
+- fast      — dict из строк -> orjson, как сейчас строит ответы
+              main.build_products.
+
+Плюс размер и время сжатия gzip/br (br — если установлен brotli).
+Итог — JSON: микросекунды на ответ и ускорение относительно fastapi.
+
+    python benchmarks/serialization.py --sizes 20,100,1000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# Модели импортируют database.py; база здесь не нужна
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from cache import brotli, compress, dumps
+from models import Product, ProductStock
+from schemas import ProductResponse
+from seed import COLORS, KINDS, SIZES
+
+from run import git_commit
+
+def make_rows(rng: random.Random, count: int) -> List[dict]:
+    """Строки, как их возвращает select(*PRODUCT_COLUMNS), с остатками"""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for number in range(1, count + 1):
+        kind = rng.choice(KINDS)
+        digest = f"{rng.getrandbits(128):032x}"
+        rows.append({
+            "id": number,
+            "sku": f"BENCH-{number:06d}",
+            "name": f"{kind} {rng.choice(COLORS)} {number}",
+            "price": rng.randrange(990, 15000, 10),
+            "description": f"{kind} из хлопка, коллекция {rng.randint(2019, 2025)}",
+            "image_url": f"/static/{digest[:2]}/{digest[2:4]}/{digest}.jpg",
+            "image_variants": {
+                variant: {fmt: f"/static/{digest[:2]}/{digest[2:4]}/{digest}_{variant}.{fmt}"
+                          for fmt in ("jpeg", "webp")}
+                for variant in ("thumb", "medium")
+            },
+            "version": 1,
+            "created_at": now - timedelta(minutes=number),
+            "sizes": {size: rng.randint(0, 20) for size in rng.sample(SIZES, 4)},
+        })
+    return rows
+
+def make_products(rows: List[dict]) -> List[Product]:
+    """ORM-объекты со связанными остатками — прежний источник ответа"""
+    products = []
+    for row in rows:
+        fields = {key: value for key, value in row.items() if key != "sizes"}
+        product = Product(**fields)
+        product.stock = [ProductStock(size=size, quantity=quantity) for size, quantity in row["sizes"].items()]
+        products.append(product)
+    return products
+
+def measure(fn, min_time: float) -> float:
+    """Среднее время вызова, мкс (повторяем не меньше min_time секунд)"""
+    fn()
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return elapsed / calls * 1e6
+
+def bench_size(rows: List[dict], min_time: float) -> dict:
+    products = make_products(rows)
+    adapter = TypeAdapter(List[ProductResponse])
+
+    def fastapi_path():
+        return JSONResponse(jsonable_encoder([ProductResponse.model_validate(p) for p in products])).body
+
+    def validated_path():
+        return adapter.dump_json([ProductResponse(**row) for row in rows])
+
+    def fast_path():
+        return dumps([dict(row) for row in rows])
+
+    # Все пути должны отдавать одно и то же (UTC pydantic пишет как Z, orjson — как +00:00)
+    def parse(body):
+        items = json.loads(body)
+        for item in items:
+            item["created_at"] = datetime.fromisoformat(item["created_at"])
+        return items
+
+    assert parse(fastapi_path()) == parse(validated_path()) == parse(fast_path())
+
+    body = fast_path()
+    timings = {
+        "fastapi_us": measure(fastapi_path, min_time),
+        "validated_us": measure(validated_path, min_time),
+        "fast_us": measure(fast_path, min_time),
+    }
+    result = {name: round(value, 1) for name, value in timings.items()}
+    result["speedup"] = round(timings["fastapi_us"] / timings["fast_us"], 2)
+    result["bytes"] = len(body)
+    for encoding in ("gzip", "br"):
+        if encoding == "br" and brotli is None:
+            continue
+        result[f"{encoding}_bytes"] = len(compress(body, encoding))
+        result[f"{encoding}_us"] = round(measure(lambda: compress(body, encoding), min_time), 1)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк сериализации ответов API")
+    parser.add_argument("--sizes", default="20,100,1000", help="товаров в ответе, через запятую")
+    parser.add_argument("--min-time", type=float, default=1.0, help="секунд на каждое измерение")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить JSON в файл")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {
+        "meta": {"commit": git_commit(), "python": sys.version.split()[0], "brotli": brotli is not None},
+        "results": {
+            size: bench_size(make_rows(rng, int(size)), args.min_time)
+            for size in args.sizes.split(",")
+        },
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
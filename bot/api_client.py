@@ -0,0 +1,212 @@
+"""
+Клиент API бэкенда для бота.
+
+Одна aiohttp-сессия на весь процесс: пул keep-alive соединений, таймауты
+и повтор с экспоненциальной задержкой для идемпотентных запросов.
+Создаётся в main() при старте и закрывается при остановке.
+Админские маршруты бэкенда бот вызывает с ключом сервиса (X-API-Key).
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Optional
+
+import aiohttp
+from aiohttp.payload import AsyncIterablePayload
+
+from metrics import BACKEND_LATENCY, path_label
+
+logger = logging.getLogger(__name__)
+
+# Запросы, которые безопасно повторить: повтор не создаст дубликат
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+class BackendAPIError(Exception):
+    def __init__(self, status: int, detail: Any = None):
+        super().__init__(f"Backend API error {status}: {detail}")
+        self.status = status
+        self.detail = detail
+
+def service_api_key(bot_token: str) -> str:
+    """Ключ сервиса: BACKEND_API_KEY или производный от токена бота,
+    как его считает бэкенд (backend/auth.py)"""
+    return os.getenv("BACKEND_API_KEY") or hmac.new(
+        bot_token.encode(), b"backend-api-key", hashlib.sha256
+    ).hexdigest()
+
+class BackendClient:
+    def __init__(self, base_url: str, timeout: float = 10.0, retries: int = 3,
+                 backoff: float = 0.3, pool_size: int = 20, api_key: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            )
+            headers = {"X-API-Key": self.api_key} if self.api_key else None
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=headers)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            raise RuntimeError("BackendClient is not started")
+        return self._session
+
+    async def request(self, method: str, path: str, *, retry: Optional[bool] = None, **kwargs) -> Any:
+        """
+        Выполнить запрос и вернуть разобранный JSON.
+        По умолчанию повторяются только идемпотентные методы.
+        """
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        attempts = self.retries + 1 if retry else 1
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            started = time.perf_counter()
+            status = "error"
+            try:
+                async with self.session.request(method, url, **kwargs) as resp:
+                    status = str(resp.status)
+                    if resp.status in RETRY_STATUSES and not last_attempt:
+                        raise aiohttp.ClientResponseError(
+                            resp.request_info, resp.history, status=resp.status
+                        )
+                    if resp.status >= 400:
+                        try:
+                            detail = (await resp.json()).get("detail")
+                        except (aiohttp.ContentTypeError, ValueError, AttributeError):
+                            detail = await resp.text()
+                        raise BackendAPIError(resp.status, detail)
+                    return await resp.json()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError,
+                    asyncio.TimeoutError) as e:
+                if last_attempt:
+                    raise BackendAPIError(503, str(e)) from e
+                delay = self.backoff * 2 ** attempt
+                logger.warning("%s %s failed (%s), retry in %.1fs", method, path, e, delay)
+                await asyncio.sleep(delay)
+            finally:
+                BACKEND_LATENCY.labels(method, path_label(path), status).observe(
+                    time.perf_counter() - started
+                )
+
+    async def get(self, path: str, **kwargs) -> Any:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> Any:
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> Any:
+        return await self.request("PUT", path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> Any:
+        return await self.request("PATCH", path, **kwargs)
+
+    # Методы API
+
+    async def list_products(self) -> list:
+        return await self.get("/api/admin/products")
+
+    async def get_product(self, product_id: int) -> dict:
+        return await self.get(f"/api/products/{product_id}")
+
+    async def search_products(self, query: str, limit: int = 20) -> list:
+        page = await self.get("/api/products/search", params={"q": query, "limit": limit})
+        return page["items"]
+
+    async def create_product(self, product_data: dict) -> dict:
+        return await self.post("/api/admin/products", json=product_data)
+
+    async def update_product(self, product_id: int, product_data: dict) -> dict:
+        return await self.put(f"/api/admin/products/{product_id}", json=product_data)
+
+    async def patch_product(self, product_id: int, changes: dict) -> dict:
+        """Изменить отдельные поля; changes["version"] — версия, которую видел админ"""
+        return await self.patch(f"/api/admin/products/{product_id}", json=changes)
+
+    async def get_stats(self) -> dict:
+        return await self.get("/api/stats")
+
+    async def get_view_stats(self, window: str) -> dict:
+        return await self.get("/api/stats/views", params={"window": window})
+
+    async def broadcast_audience(self) -> int:
+        return (await self.get("/api/admin/broadcasts/audience"))["audience"]
+
+    async def create_broadcast(self, text: str, photo: Optional[str] = None) -> dict:
+        return await self.post("/api/admin/broadcasts", json={"text": text, "photo": photo})
+
+    async def get_broadcast(self, broadcast_id: int) -> dict:
+        return await self.get(f"/api/admin/broadcasts/{broadcast_id}")
+
+    async def list_broadcasts(self, status: Optional[str] = None) -> list:
+        params = {"status": status} if status else {}
+        return await self.get("/api/admin/broadcasts", params=params)
+
+    async def lease_broadcast(self, broadcast_id: int, owner: str, ttl: int) -> bool:
+        """Взять или продлить аренду рассылки; False — её ведёт другой процесс"""
+        try:
+            await self.post(f"/api/admin/broadcasts/{broadcast_id}/lease",
+                            json={"owner": owner, "ttl": ttl}, retry=True)
+        except BackendAPIError as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+    async def broadcast_recipients(self, broadcast_id: int, after: int, limit: int) -> list:
+        return await self.get(f"/api/admin/broadcasts/{broadcast_id}/recipients",
+                              params={"after": after, "limit": limit})
+
+    async def report_broadcast(self, broadcast_id: int, results: list) -> dict:
+        # Повтор безопасен: запрос только выставляет статусы получателям
+        return await self.post(f"/api/admin/broadcasts/{broadcast_id}/results",
+                               json={"results": results}, retry=True)
+
+    async def cancel_broadcast(self, broadcast_id: int) -> dict:
+        return await self.post(f"/api/admin/broadcasts/{broadcast_id}/cancel", retry=True)
+
+    async def import_products(self, chunks: AsyncIterator[bytes], format: str) -> dict:
+        """
+        Массовый импорт каталога: файл уходит телом запроса по мере чтения.
+        Бэкенд пишет товары, пока файл ещё передаётся, поэтому общего
+        таймаута нет — только на ожидание ответа.
+        """
+        return await self.post(
+            "/api/admin/products/import",
+            params={"format": format},
+            data=AsyncIterablePayload(chunks),
+            retry=False,
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=self.timeout.total),
+        )
+
+    async def upload_stream(self, chunks: AsyncIterator[bytes], filename: str,
+                            path: str = "/api/admin/upload") -> Any:
+        """
+        Отправить файл multipart-запросом по мере чтения кусков (chunked).
+        Поток нельзя прочитать второй раз, поэтому без повторов.
+        """
+        with aiohttp.MultipartWriter("form-data") as form:
+            part = form.append_payload(AsyncIterablePayload(chunks))
+            part.set_content_disposition("form-data", name="file", filename=filename)
+            return await self.post(path, data=form, retry=False)
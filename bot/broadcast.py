@@ -0,0 +1,173 @@
+"""
+Рассылки: отправка сообщения всей аудитории бота.
+
+Аудитория и статусы получателей хранятся на бэкенде (backend/broadcasts.py).
+Broadcaster берёт пачки неотправленных получателей, рассылает их
+BROADCAST_WORKERS корутинами не быстрее BROADCAST_RATE сообщений в секунду
+и возвращает результаты пачкой. Общий лимит бота и лимит на чат держит
+RateLimitMiddleware (ratelimit.py); BROADCAST_RATE ниже общего лимита,
+чтобы ответы на команды не стояли в очереди за рассылкой.
+
+Рассылку ведёт процесс, взявший аренду; незавершённые рассылки
+подхватываются при старте бота. Если процесс упал между отправкой
+пачки и записью результатов, эта пачка уйдёт повторно — не больше
+BROADCAST_BATCH_SIZE сообщений.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from api_client import BackendAPIError, BackendClient
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "16"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))
+BROADCAST_LEASE_TTL = int(os.getenv("BROADCAST_LEASE_TTL", "120"))
+# Сколько раз за запуск проходить по отложенным получателям
+BROADCAST_PASSES = 3
+
+ProgressCallback = Callable[[dict, float], Awaitable[None]]
+
+class Broadcaster:
+    def __init__(self, bot: Bot, api: BackendClient, rate: float = BROADCAST_RATE,
+                 workers: int = BROADCAST_WORKERS, batch_size: int = BROADCAST_BATCH_SIZE,
+                 lease_ttl: int = BROADCAST_LEASE_TTL):
+        self.bot = bot
+        self.api = api
+        self.rate = rate
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease_ttl = lease_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def deliver(self, broadcast: dict, user_id: int) -> Optional[dict]:
+        """Отправить одному получателю. None — не получилось из-за лимитов,
+        получатель остаётся pending и будет отправлен позже"""
+        try:
+            # Текст хранится в HTML-разметке: форматирование админа сохраняется
+            if broadcast["photo"]:
+                await self.bot.send_photo(user_id, broadcast["photo"], caption=broadcast["text"], parse_mode="HTML")
+            else:
+                await self.bot.send_message(user_id, broadcast["text"], parse_mode="HTML")
+        except TelegramForbiddenError as e:
+            # Бот заблокирован или пользователь удалён: в следующие рассылки он не попадёт
+            return {"user_id": user_id, "status": "blocked", "error": e.message[:500]}
+        except TelegramBadRequest as e:
+            return {"user_id": user_id, "status": "failed", "error": e.message[:500]}
+        except (TelegramRetryAfter, TelegramNetworkError, TelegramServerError) as e:
+            logger.warning("Broadcast %s to %s postponed: %s", broadcast["id"], user_id, e)
+            return None
+        return {"user_id": user_id, "status": "sent", "error": None}
+
+    async def send_batch(self, broadcast: dict, user_ids: List[int], bucket: TokenBucket) -> List[dict]:
+        results = []
+        queue = iter(user_ids)
+
+        async def worker():
+            # Общий итератор: каждый получатель достаётся ровно одной корутине
+            for user_id in queue:
+                await bucket.acquire()
+                result = await self.deliver(broadcast, user_id)
+                if result is not None:
+                    results.append(result)
+
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        return results
+
+    async def run(self, broadcast_id: int, on_progress: Optional[ProgressCallback] = None) -> Optional[dict]:
+        """Разослать всем pending-получателям. Возвращает итоговый прогресс
+        или None, если рассылку ведёт другой процесс"""
+        if not await self.api.lease_broadcast(broadcast_id, self.owner, self.lease_ttl):
+            return None
+        broadcast = await self.api.get_broadcast(broadcast_id)
+        bucket = TokenBucket(self.rate)
+        started = time.monotonic()
+        delivered = 0
+        progress = broadcast
+        after = 0
+        passes = 1
+        while progress["status"] == "running":
+            user_ids = await self.api.broadcast_recipients(broadcast_id, after, self.batch_size)
+            if not user_ids:
+                if after == 0 or passes >= BROADCAST_PASSES:
+                    break
+                # Отложенные из-за лимитов и сбоев получатели: ещё один проход с начала
+                after = 0
+                passes += 1
+                continue
+            results = await self.send_batch(broadcast, user_ids, bucket)
+            progress = await self.api.report_broadcast(broadcast_id, results)
+            delivered += len(results)
+            after = user_ids[-1]
+            if on_progress:
+                await on_progress(progress, delivered / max(time.monotonic() - started, 1e-6))
+            if progress["status"] == "running" and not await self.api.lease_broadcast(
+                broadcast_id, self.owner, self.lease_ttl
+            ):
+                # Рассылку остановили или её аренду забрал другой процесс
+                logger.info("Broadcast %s stopped or taken over", broadcast_id)
+                break
+        logger.info("Broadcast %s: %s sent, %s blocked, %s failed, %s pending",
+                    broadcast_id, progress["sent"], progress["blocked"], progress["failed"], progress["pending"])
+        return progress
+
+    def start(self, broadcast_id: int, on_progress: Optional[ProgressCallback] = None) -> asyncio.Task:
+        """Запустить рассылку в фоне"""
+        task = self._tasks.get(broadcast_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._run_logged(broadcast_id, on_progress))
+            self._tasks[broadcast_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+        return task
+
+    async def _run_logged(self, broadcast_id: int, on_progress: Optional[ProgressCallback]):
+        try:
+            return await self.run(broadcast_id, on_progress)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Broadcast %s stopped, it will resume on next start", broadcast_id)
+
+    async def resume(self):
+        """Продолжить незавершённые рассылки (после перезапуска бота)"""
+        try:
+            broadcasts = await self.api.list_broadcasts(status="running")
+        except BackendAPIError:
+            logger.exception("Failed to list running broadcasts")
+            return
+        for broadcast in broadcasts:
+            self.start(broadcast["id"])
+
+    async def stop(self):
+        """Остановить фоновые рассылки; прогресс уже на бэкенде"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def format_progress(progress: dict, rate: Optional[float] = None) -> str:
+    done = progress["sent"] + progress["blocked"] + progress["failed"]
+    titles = {"running": "идёт", "done": "завершена", "cancelled": "остановлена"}
+    text = (
+        f"📣 Рассылка #{progress['id']} {titles.get(progress['status'], progress['status'])}\n\n"
+        f"Отправлено: {progress['sent']} из {progress['total']}\n"
+        f"Заблокировали бота: {progress['blocked']}\n"
+        f"Ошибок: {progress['failed']}\n"
+        f"Осталось: {progress['total'] - done}"
+    )
+    if rate:
+        text += f"\nСкорость: {rate:.1f} сообщ./с"
+    return text
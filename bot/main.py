@@ -1,17 +1,32 @@
 import asyncio
+import multiprocessing
 import os
 import sys
 from pathlib import Path
+from typing import Optional, Union
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import (
+    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo,
+    InlineQuery, InlineQueryResultArticle, InputTextMessageContent,
+)
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from dotenv import load_dotenv
-import aiohttp
 import json
-from utils import upload_photo_to_backend
+from api_client import BackendClient, BackendAPIError, service_api_key
+from broadcast import BROADCAST_RATE, Broadcaster, format_progress
+from metrics import metrics_view, setup_bot_metrics, start_metrics_server
+from ratelimit import RateLimitMiddleware, create_rate_limiter
+from screens import Screen, edit_screens, stats_texts
+from storage import create_storage
+from utils import iter_telegram_file, track_progress, upload_photo_to_backend
 
 # Определяем путь к корню проекта (родительская директория от bot/)
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -38,17 +53,61 @@ SHOP_HOURS = os.getenv("SHOP_HOURS", "Пн–Сб: 10:00–20:00, Вс: выхо
 SHOP_ADDRESS = os.getenv("SHOP_ADDRESS", "Ваш адрес магазина")
 SHOP_LOCATION_URL = os.getenv("SHOP_LOCATION_URL", "https://yandex.ru/maps/")
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
-
+# Режим работы: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+
+# TELEGRAM_API_URL — свой Bot API сервер (локальный telegram-bot-api или тестовый)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+session = AiohttpSession(
+    api=TelegramAPIServer.from_base(TELEGRAM_API_URL, is_local=os.getenv("TELEGRAM_API_LOCAL", "false").lower() == "true")
+) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session)
+# Все исходящие запросы проходят через лимиты Telegram (см. ratelimit.py)
+bot.session.middleware(RateLimitMiddleware(create_rate_limiter()))
+# Состояние мастеров хранится в FSM: в памяти или в SQL (см. storage.py)
+dp = Dispatcher(storage=create_storage())
+setup_bot_metrics(dp)
+
+# Статичные клавиатуры собираются один раз и переиспользуются во всех ответах
 # Web App кнопка
-def get_webapp_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[[
-        InlineKeyboardButton(
-            text="🛍️ Открыть магазин",
-            web_app=WebAppInfo(url=WEBAPP_URL)
-        )
-    ]])
+WEBAPP_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(
+        text="🛍️ Открыть магазин",
+        web_app=WebAppInfo(url=WEBAPP_URL)
+    )
+]])
+
+ADMIN_MENU_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="➕ Добавить товар", callback_data="admin_add_product")],
+    [InlineKeyboardButton(text="✏️ Редактировать товар", callback_data="admin_edit_product")],
+    [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+    [InlineKeyboardButton(text="📥 Импорт каталога", callback_data="admin_import")],
+    [InlineKeyboardButton(text="📣 Рассылка", callback_data="admin_broadcast")],
+    [InlineKeyboardButton(text="❓ Помощь", callback_data="admin_help")]
+])
+
+BROADCAST_CONFIRM_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[
+    InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_send"),
+    InlineKeyboardButton(text="✖️ Отмена", callback_data="broadcast_cancel"),
+]])
+
+# Окна аналитики просмотров (ключ совпадает с ?window= в /api/stats/views)
+STATS_WINDOWS = {
+    "24h": "За 24 часа",
+    "7d": "За 7 дней",
+    "30d": "За 30 дней",
+}
+
+STATS_WINDOWS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=f"📈 {title}", callback_data=f"admin_stats_window_{key}")]
+    for key, title in STATS_WINDOWS.items()
+] + [[InlineKeyboardButton(text="↩️ Назад", callback_data="admin_back")]])
 
 # Команда /start
 @dp.message(Command("start"))
@@ -59,7 +118,7 @@ async def cmd_start(message: Message):
     
     await message.answer(
         text,
-        reply_markup=get_webapp_keyboard(),
+        reply_markup=WEBAPP_KEYBOARD,
         parse_mode="Markdown"
     )
 
@@ -68,7 +127,7 @@ async def cmd_start(message: Message):
 async def cmd_catalog(message: Message):
     await message.answer(
         "📦 Открываю каталог товаров...",
-        reply_markup=get_webapp_keyboard()
+        reply_markup=WEBAPP_KEYBOARD
     )
 
 # Команда /hours
@@ -90,7 +149,7 @@ async def cmd_location(message: Message):
 # Команда /promo
 @dp.message(Command("promo"))
 async def cmd_promo(message: Message):
-    await message.answer("🎉 Акции и скидки доступны в каталоге товаров!", reply_markup=get_webapp_keyboard())
+    await message.answer("🎉 Акции и скидки доступны в каталоге товаров!", reply_markup=WEBAPP_KEYBOARD)
 
 # Админка
 class AddProductStates(StatesGroup):
@@ -104,33 +163,56 @@ class EditProductStates(StatesGroup):
     waiting_for_field = State()
     waiting_for_value = State()
 
-# Временное хранилище для админ-сессий
-admin_sessions = {}
+class ImportStates(StatesGroup):
+    waiting_for_file = State()
+
+class BroadcastStates(StatesGroup):
+    waiting_for_message = State()
+    waiting_for_confirm = State()
+
+# Расширение файла -> формат импорта на бэкенде
+IMPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+# Предел getFile у облачного Bot API; локальный сервер отдаёт файлы больше
+TELEGRAM_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+
+ACCESS_DENIED = "❌ У вас нет доступа к админ-панели"
+
+async def deny_non_admin(event: Union[Message, CallbackQuery], state: Optional[FSMContext] = None) -> bool:
+    """
+    Отказать не-админу; True — обработчик должен завершиться.
+    Запросы бота к бэкенду идут с ключом сервиса, а callback data и состояние
+    мастера клиент может подделать, поэтому проверка — в каждом админском обработчике.
+    """
+    if event.from_user.id in ADMIN_IDS:
+        return False
+    if state is not None:
+        await state.clear()
+    if isinstance(event, CallbackQuery):
+        await event.answer(ACCESS_DENIED, show_alert=True)
+    else:
+        await event.answer(ACCESS_DENIED)
+    return True
 
 @dp.message(Command("admin"))
 async def cmd_admin(message: Message):
-    if message.from_user.id not in ADMIN_IDS:
-        await message.answer("❌ У вас нет доступа к админ-панели")
+    if await deny_non_admin(message):
         return
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Добавить товар", callback_data="admin_add_product")],
-        [InlineKeyboardButton(text="✏️ Редактировать товар", callback_data="admin_edit_product")],
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton(text="❓ Помощь", callback_data="admin_help")]
-    ])
-    
-    await message.answer("🛠️ Админ-панель bro shop", reply_markup=keyboard)
+    await message.answer("🛠️ Админ-панель bro shop", reply_markup=ADMIN_MENU_KEYBOARD)
 
 @dp.callback_query(F.data == "admin_add_product")
 async def admin_add_product_start(callback: CallbackQuery, state: FSMContext):
-    admin_sessions[callback.from_user.id] = {}
+    if await deny_non_admin(callback):
+        return
+    await state.set_data({})
     await state.set_state(AddProductStates.waiting_for_photo)
     await callback.message.answer("📸 Отправьте фото товара")
     await callback.answer()
 
 @dp.message(AddProductStates.waiting_for_photo)
 async def process_photo(message: Message, state: FSMContext):
+    if await deny_non_admin(message, state):
+        return
     if not message.photo:
         await message.answer("❌ Пожалуйста, отправьте фото")
         return
@@ -140,22 +222,25 @@ async def process_photo(message: Message, state: FSMContext):
     file_path = file_info.file_path
     
     # Сохраняем путь к фото временно
-    admin_sessions[message.from_user.id]["photo_path"] = file_path
-    admin_sessions[message.from_user.id]["photo_file_id"] = photo.file_id
+    await state.update_data(photo_path=file_path, photo_file_id=photo.file_id)
     await state.set_state(AddProductStates.waiting_for_name)
     await message.answer("✅ Фото получено!\n\nВведите название товара:")
 
 @dp.message(AddProductStates.waiting_for_name)
 async def process_name(message: Message, state: FSMContext):
-    admin_sessions[message.from_user.id]["name"] = message.text
+    if await deny_non_admin(message, state):
+        return
+    await state.update_data(name=message.text)
     await state.set_state(AddProductStates.waiting_for_price)
     await message.answer("💰 Введите цену (только число):")
 
 @dp.message(AddProductStates.waiting_for_price)
 async def process_price(message: Message, state: FSMContext):
+    if await deny_non_admin(message, state):
+        return
     try:
         price = int(message.text)
-        admin_sessions[message.from_user.id]["price"] = price
+        await state.update_data(price=price)
         await state.set_state(AddProductStates.waiting_for_description)
         await message.answer("📄 Введите описание товара:")
     except ValueError:
@@ -163,8 +248,9 @@ async def process_price(message: Message, state: FSMContext):
 
 @dp.message(AddProductStates.waiting_for_description)
 async def process_description(message: Message, state: FSMContext):
-    admin_sessions[message.from_user.id]["description"] = message.text
-    admin_sessions[message.from_user.id]["sizes"] = {}
+    if await deny_non_admin(message, state):
+        return
+    await state.update_data(description=message.text, sizes={})
     await state.set_state(AddProductStates.waiting_for_sizes)
     await message.answer(
         "📏 Укажите остатки по размерам.\n"
@@ -173,19 +259,17 @@ async def process_description(message: Message, state: FSMContext):
     )
 
 @dp.message(AddProductStates.waiting_for_sizes)
-async def process_sizes(message: Message, state: FSMContext):
+async def process_sizes(message: Message, state: FSMContext, api: BackendClient):
+    if await deny_non_admin(message, state):
+        return
     if message.text and message.text.lower() == "готово":
         # Сохраняем товар через API
-        session_data = admin_sessions[message.from_user.id]
+        session_data = await state.get_data()
         
         # Загружаем фото на бэкенд
-        photo_url = await upload_photo_to_backend(
-            session_data["photo_file_id"],
-            BOT_TOKEN,
-            BACKEND_URL
-        )
+        uploaded = await upload_photo_to_backend(bot, api, session_data["photo_file_id"])
         
-        if not photo_url:
+        if not uploaded:
             await message.answer("❌ Ошибка загрузки фото. Попробуйте снова.")
             return
         
@@ -194,22 +278,19 @@ async def process_sizes(message: Message, state: FSMContext):
             "name": session_data["name"],
             "price": session_data["price"],
             "description": session_data.get("description", ""),
-            "image_url": photo_url,
+            "image_url": uploaded["url"],
+            "image_variants": uploaded.get("variants"),
             "sizes": session_data["sizes"]
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{BACKEND_URL}/api/admin/products",
-                json=product_data
-            ) as resp:
-                if resp.status == 200:
-                    await message.answer("✅ Товар добавлен!")
-                else:
-                    await message.answer("❌ Ошибка при добавлении товара")
+        try:
+            await api.create_product(product_data)
+            stats_texts.clear()
+            await message.answer("✅ Товар добавлен!")
+        except BackendAPIError:
+            await message.answer("❌ Ошибка при добавлении товара")
         
         await state.clear()
-        del admin_sessions[message.from_user.id]
         return
     
     # Парсим размер
@@ -219,96 +300,458 @@ async def process_sizes(message: Message, state: FSMContext):
             raise ValueError
         size = parts[0].strip().upper()
         quantity = int(parts[1].strip())
-        admin_sessions[message.from_user.id]["sizes"][size] = quantity
+        sizes = (await state.get_data()).get("sizes", {})
+        sizes[size] = quantity
+        await state.update_data(sizes=sizes)
         await message.answer(f"✅ Размер {size}: {quantity} шт. сохранён\n\nОтправьте следующий размер или 'Готово'")
     except (ValueError, IndexError):
         await message.answer("❌ Неверный формат. Используйте: `S: 5`")
 
+IMPORT_HINT = (
+    "📥 Отправьте файл каталога: .csv или .jsonl\n\n"
+    "Колонки: sku, name, price, description, image_url, sizes\n"
+    "Размеры в CSV: `S:5;M:3`\n"
+    "Товары с уже известным sku обновляются, остальные создаются."
+)
+
+@dp.message(Command("import"))
+async def cmd_import(message: Message, state: FSMContext):
+    if await deny_non_admin(message):
+        return
+    await state.set_state(ImportStates.waiting_for_file)
+    await message.answer(IMPORT_HINT)
+
+@dp.callback_query(F.data == "admin_import")
+async def admin_import_start(callback: CallbackQuery, state: FSMContext):
+    if await deny_non_admin(callback):
+        return
+    await state.set_state(ImportStates.waiting_for_file)
+    await callback.message.answer(IMPORT_HINT)
+    await callback.answer()
+
+@dp.message(ImportStates.waiting_for_file)
+async def process_import_file(message: Message, state: FSMContext, api: BackendClient):
+    if await deny_non_admin(message, state):
+        return
+    document = message.document
+    if not document:
+        await message.answer("❌ Пришлите файл документом (.csv или .jsonl)")
+        return
+    extension = os.path.splitext(document.file_name or "")[1].lower()
+    if extension not in IMPORT_FORMATS:
+        await message.answer("❌ Поддерживаются только файлы .csv и .jsonl")
+        return
+    if document.file_size and document.file_size > TELEGRAM_DOWNLOAD_LIMIT and not bot.session.api.is_local:
+        await message.answer("❌ Файл больше 20 МБ — разбейте его на части")
+        return
+    await state.clear()
+
+    total = document.file_size or 0
+    status = await message.answer("⏳ Импорт начат...")
+
+    async def report(sent: int):
+        # Бэкенд пишет товары по мере получения файла, поэтому
+        # доля переданных байт — это и прогресс самого импорта
+        percent = f"{sent * 100 // total}%" if total else f"{sent // 1024} КБ"
+        try:
+            await status.edit_text(f"⏳ Импорт: {percent}")
+        except TelegramBadRequest:
+            pass
+
+    try:
+        file = await bot.get_file(document.file_id)
+        summary = await api.import_products(
+            track_progress(iter_telegram_file(bot, file.file_path), report),
+            IMPORT_FORMATS[extension],
+        )
+    except BackendAPIError as e:
+        await status.edit_text(f"❌ Ошибка импорта: {e.detail}")
+        return
+    finally:
+        # Импорт мог изменить любые товары, даже если прервался
+        edit_screens.clear()
+        stats_texts.clear()
+
+    if summary.get("aborted"):
+        text = f"⚠️ Импорт прерван: {summary['aborted']}\n\n"
+    else:
+        text = "✅ Импорт завершён\n\n"
+    text += (
+        f"Создано: {summary['created']}\n"
+        f"Обновлено: {summary['updated']}\n"
+        f"С ошибками: {summary['failed']}"
+    )
+    for error in summary["errors"][:10]:
+        text += f"\n• строка {error['line']}: {error['error']}"
+    await status.edit_text(text)
+
+BROADCAST_HINT = (
+    "📣 Отправьте сообщение для рассылки: текст или фото с подписью.\n"
+    "Его получат все, кто смотрел товары в магазине."
+)
+
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, state: FSMContext):
+    if await deny_non_admin(message):
+        return
+    await state.set_state(BroadcastStates.waiting_for_message)
+    await message.answer(BROADCAST_HINT)
+
+@dp.callback_query(F.data == "admin_broadcast")
+async def admin_broadcast_start(callback: CallbackQuery, state: FSMContext):
+    if await deny_non_admin(callback):
+        return
+    await state.set_state(BroadcastStates.waiting_for_message)
+    await callback.message.answer(BROADCAST_HINT)
+    await callback.answer()
+
+@dp.message(BroadcastStates.waiting_for_message)
+async def process_broadcast_message(message: Message, state: FSMContext, api: BackendClient):
+    if await deny_non_admin(message, state):
+        return
+    photo = message.photo[-1].file_id if message.photo else None
+    # HTML-разметка сохраняет форматирование админа (жирный, ссылки)
+    text = message.html_text
+    if not text:
+        await message.answer("❌ Отправьте текст или фото с подписью")
+        return
+    if len(text) > (1024 if photo else 4096):
+        await message.answer("❌ Сообщение слишком длинное для Telegram")
+        return
+    try:
+        audience = await api.broadcast_audience()
+    except BackendAPIError:
+        await message.answer("❌ Ошибка получения аудитории")
+        return
+    
+    await state.update_data(text=text, photo=photo)
+    await state.set_state(BroadcastStates.waiting_for_confirm)
+    # Предпросмотр — ровно так, как сообщение уйдёт получателям
+    if photo:
+        await message.answer_photo(photo, caption=text, parse_mode="HTML")
+    else:
+        await message.answer(text, parse_mode="HTML")
+    minutes = audience / BROADCAST_RATE / 60
+    duration = f"≈ {minutes:.0f} мин" if minutes >= 1 else "меньше минуты"
+    await message.answer(
+        f"👆 Так сообщение увидят получатели.\n\nПолучателей: {audience}\nОтправка займёт {duration}",
+        reply_markup=BROADCAST_CONFIRM_KEYBOARD,
+    )
+
+def broadcast_stop_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="⏹ Остановить", callback_data=f"broadcast_stop_{broadcast_id}")
+    ]])
+
+@dp.callback_query(BroadcastStates.waiting_for_confirm, F.data == "broadcast_send")
+async def broadcast_send(callback: CallbackQuery, state: FSMContext, api: BackendClient,
+                         broadcaster: Broadcaster):
+    if await deny_non_admin(callback):
+        return
+    data = await state.get_data()
+    await state.clear()
+    try:
+        broadcast = await api.create_broadcast(data["text"], data.get("photo"))
+    except BackendAPIError:
+        await callback.message.answer("❌ Ошибка создания рассылки")
+        await callback.answer()
+        return
+    
+    keyboard = broadcast_stop_keyboard(broadcast["id"])
+    status = await callback.message.answer(format_progress(broadcast), reply_markup=keyboard)
+    
+    async def report(progress: dict, rate: float):
+        try:
+            await status.edit_text(format_progress(progress, rate),
+                                   reply_markup=keyboard if progress["status"] == "running" else None)
+        except TelegramBadRequest:
+            pass
+    
+    if broadcast["status"] == "running":
+        broadcaster.start(broadcast["id"], report)
+    await callback.answer("Рассылка запущена")
+
+@dp.callback_query(F.data == "broadcast_cancel")
+async def broadcast_cancel(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback.message.answer("Рассылка отменена")
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("broadcast_stop_"))
+async def broadcast_stop(callback: CallbackQuery, api: BackendClient):
+    if await deny_non_admin(callback):
+        return
+    broadcast_id = int(callback.data.removeprefix("broadcast_stop_"))
+    try:
+        progress = await api.cancel_broadcast(broadcast_id)
+    except BackendAPIError:
+        await callback.answer("❌ Не удалось остановить рассылку")
+        return
+    await callback.message.edit_text(format_progress(progress))
+    await callback.answer("Рассылка остановлена")
+
 @dp.callback_query(F.data == "admin_edit_product")
-async def admin_edit_product_start(callback: CallbackQuery):
+async def admin_edit_product_start(callback: CallbackQuery, api: BackendClient):
+    if await deny_non_admin(callback):
+        return
     # Получаем список товаров
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{BACKEND_URL}/api/admin/products") as resp:
-            if resp.status == 200:
-                products = await resp.json()
-                if not products:
-                    await callback.message.answer("📦 Товары не найдены")
-                    await callback.answer()
-                    return
-                
-                keyboard_buttons = []
-                for product in products[:10]:  # Показываем последние 10
-                    keyboard_buttons.append([
-                        InlineKeyboardButton(
-                            text=product["name"],
-                            callback_data=f"edit_product_{product['id']}"
-                        )
-                    ])
-                keyboard_buttons.append([
-                    InlineKeyboardButton(text="↩️ Назад", callback_data="admin_back")
-                ])
-                
-                keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
-                await callback.message.answer("Выберите товар для редактирования:", reply_markup=keyboard)
-            else:
-                await callback.message.answer("❌ Ошибка получения списка товаров")
+    try:
+        products = await api.list_products()
+    except BackendAPIError:
+        await callback.message.answer("❌ Ошибка получения списка товаров")
+        await callback.answer()
+        return
+    
+    if not products:
+        await callback.message.answer("📦 Товары не найдены")
+        await callback.answer()
+        return
+    
+    keyboard_buttons = []
+    for product in products[:10]:  # Показываем последние 10
+        keyboard_buttons.append([
+            InlineKeyboardButton(
+                text=product["name"],
+                callback_data=f"edit_product_{product['id']}"
+            )
+        ])
+    # Остальные товары — через инлайн-поиск: он подставит в чат /edit <id>
+    keyboard_buttons.append([
+        InlineKeyboardButton(text="🔎 Найти товар", switch_inline_query_current_chat="")
+    ])
+    keyboard_buttons.append([
+        InlineKeyboardButton(text="↩️ Назад", callback_data="admin_back")
+    ])
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    await callback.message.answer("Выберите товар для редактирования:", reply_markup=keyboard)
     
     await callback.answer()
 
-@dp.callback_query(F.data.startswith("edit_product_"))
-async def admin_edit_product_menu(callback: CallbackQuery):
-    product_id = int(callback.data.split("_")[-1])
+def render_edit_screen(product: dict) -> Screen:
+    product_id = product["id"]
+    sizes_text = ", ".join([f"{k}: {v}" for k, v in (product.get("sizes") or {}).items()])
     
-    # Получаем товар
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{BACKEND_URL}/api/products/{product_id}") as resp:
-            if resp.status == 200:
-                product = await resp.json()
-                
-                sizes_text = ", ".join([f"{k}: {v}" for k, v in product.get("sizes", {}).items()])
-                
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🖼 Изменить фото", callback_data=f"edit_field_{product_id}_photo")],
-                    [InlineKeyboardButton(text="🔤 Название", callback_data=f"edit_field_{product_id}_name")],
-                    [InlineKeyboardButton(text="💰 Цена", callback_data=f"edit_field_{product_id}_price")],
-                    [InlineKeyboardButton(text="📄 Описание", callback_data=f"edit_field_{product_id}_description")],
-                    [InlineKeyboardButton(text="📏 Остатки по размерам", callback_data=f"edit_field_{product_id}_sizes")],
-                    [InlineKeyboardButton(text="↩️ Назад", callback_data="admin_back")]
-                ])
-                
-                text = f"""Редактирование: "{product['name']}"
+    # В кнопках — версия, которую видит админ: правка поверх чужой не пройдёт
+    suffix = f"{product_id}_{{}}_{product['version']}"
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🖼 Изменить фото", callback_data="edit_field_" + suffix.format("photo"))],
+        [InlineKeyboardButton(text="🔤 Название", callback_data="edit_field_" + suffix.format("name"))],
+        [InlineKeyboardButton(text="💰 Цена", callback_data="edit_field_" + suffix.format("price"))],
+        [InlineKeyboardButton(text="📄 Описание", callback_data="edit_field_" + suffix.format("description"))],
+        [InlineKeyboardButton(text="📏 Остатки по размерам", callback_data="edit_field_" + suffix.format("sizes"))],
+        [InlineKeyboardButton(text="↩️ Назад", callback_data="admin_back")]
+    ])
+    
+    text = f"""Редактирование: "{product['name']}"
 
 💰 Цена: {product['price']} ₽
 📏 Размеры: {sizes_text if sizes_text else 'не указаны'}"""
-                
-                await callback.message.answer(text, reply_markup=keyboard)
-            else:
-                await callback.message.answer("❌ Товар не найден")
+    return Screen(text, keyboard, product["version"])
+
+async def send_edit_menu(message: Message, api: BackendClient, product_id: int):
+    # Экран из кэша (см. screens.py), иначе — товар с бэкенда
+    screen = edit_screens.get(product_id)
+    if screen is None:
+        try:
+            product = await api.get_product(product_id)
+        except BackendAPIError:
+            await message.answer("❌ Товар не найден")
+            return
+        screen = edit_screens.put(product_id, render_edit_screen(product))
     
+    await message.answer(screen.text, reply_markup=screen.keyboard)
+
+@dp.callback_query(F.data.startswith("edit_product_"))
+async def admin_edit_product_menu(callback: CallbackQuery, api: BackendClient):
+    if await deny_non_admin(callback):
+        return
+    product_id = int(callback.data.split("_")[-1])
+    await send_edit_menu(callback.message, api, product_id)
     await callback.answer()
 
+EDIT_FIELD_PROMPTS = {
+    "photo": "🖼 Отправьте новое фото товара",
+    "name": "🔤 Введите новое название:",
+    "price": "💰 Введите новую цену (только число):",
+    "description": "📄 Введите новое описание:",
+    "sizes": "📏 Укажите остатки, например: `S: 5, M: 3`\nОстальные размеры не изменятся",
+}
+
+# edit_field_{id}_{поле}_{версия}
+@dp.callback_query(F.data.startswith("edit_field_"))
+async def admin_edit_field(callback: CallbackQuery, state: FSMContext):
+    if await deny_non_admin(callback):
+        return
+    _, _, product_id, field, version = callback.data.split("_")
+    await state.set_state(EditProductStates.waiting_for_value)
+    await state.set_data({"product_id": int(product_id), "field": field, "version": int(version)})
+    await callback.message.answer(EDIT_FIELD_PROMPTS[field])
+    await callback.answer()
+
+@dp.message(EditProductStates.waiting_for_value)
+async def process_edit_value(message: Message, state: FSMContext, api: BackendClient):
+    if await deny_non_admin(message, state):
+        return
+    data = await state.get_data()
+    product_id, field = data["product_id"], data["field"]
+    
+    if field == "photo":
+        if not message.photo:
+            await message.answer("❌ Пожалуйста, отправьте фото")
+            return
+        uploaded = await upload_photo_to_backend(bot, api, message.photo[-1].file_id)
+        if not uploaded:
+            await message.answer("❌ Ошибка загрузки фото. Попробуйте снова.")
+            return
+        changes = {"image_url": uploaded["url"], "image_variants": uploaded.get("variants")}
+    elif not message.text:
+        await message.answer("❌ Отправьте значение текстом")
+        return
+    elif field == "price":
+        try:
+            changes = {"price": int(message.text)}
+        except ValueError:
+            await message.answer("❌ Цена должна быть числом. Попробуйте снова:")
+            return
+    elif field == "sizes":
+        try:
+            sizes = {}
+            for part in message.text.replace("\n", ",").split(","):
+                if part.strip():
+                    size, quantity = part.split(":")
+                    sizes[size.strip().upper()] = int(quantity.strip())
+            if not sizes:
+                raise ValueError
+        except ValueError:
+            await message.answer("❌ Неверный формат. Используйте: `S: 5, M: 3`")
+            return
+        changes = {"sizes": sizes}
+    else:
+        changes = {field: message.text}
+    
+    try:
+        product = await api.patch_product(product_id, {**changes, "version": data["version"]})
+    except BackendAPIError as e:
+        await state.clear()
+        if e.status == 409:
+            edit_screens.pop(product_id)
+            await message.answer("⚠️ Товар изменили, пока вы редактировали. Вот актуальная версия:")
+            await send_edit_menu(message, api, product_id)
+        else:
+            await message.answer("❌ Ошибка при сохранении товара")
+        return
+    
+    await state.clear()
+    # Ответ PATCH — уже новая версия товара: меню строится без лишнего запроса
+    edit_screens.put(product_id, render_edit_screen(product))
+    await message.answer("✅ Сохранено")
+    await send_edit_menu(message, api, product_id)
+
+# /edit <id> — открыть товар на редактирование (его присылает инлайн-поиск)
+@dp.message(Command("edit"))
+async def cmd_edit(message: Message, command: CommandObject, api: BackendClient):
+    if await deny_non_admin(message):
+        return
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("Использование: /edit <id товара>\nИли найдите товар: наберите @бота и название")
+        return
+    await send_edit_menu(message, api, int(command.args))
+
+# Инлайн-поиск: @бот <запрос> в любом чате
+@dp.inline_query()
+async def inline_search(inline_query: InlineQuery, api: BackendClient):
+    query = inline_query.query.strip()
+    if not query:
+        await inline_query.answer([], cache_time=5)
+        return
+    try:
+        products = await api.search_products(query, limit=20)
+    except BackendAPIError:
+        await inline_query.answer([], cache_time=1)
+        return
+    
+    # Админ в чате с ботом выбирает товар для редактирования,
+    # остальные отправляют в чат карточку товара
+    editing = inline_query.from_user.id in ADMIN_IDS and inline_query.chat_type == "sender"
+    results = []
+    for product in products:
+        sizes_text = ", ".join(size for size, count in (product.get("sizes") or {}).items() if count > 0)
+        if editing:
+            content = f"/edit {product['id']}"
+        else:
+            content = f"{product['name']}\n💰 {product['price']} ₽"
+            if sizes_text:
+                content += f"\n📏 В наличии: {sizes_text}"
+        results.append(InlineQueryResultArticle(
+            id=str(product["id"]),
+            title=product["name"],
+            description=f"{product['price']} ₽" + (f" · {sizes_text}" if sizes_text else ""),
+            input_message_content=InputTextMessageContent(message_text=content),
+        ))
+    await inline_query.answer(results, cache_time=0 if editing else 30, is_personal=editing)
+
 @dp.callback_query(F.data == "admin_stats")
-async def admin_stats(callback: CallbackQuery):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{BACKEND_URL}/api/stats") as resp:
-            if resp.status == 200:
-                stats = await resp.json()
-                text = f"📊 Статистика:\n\n"
-                text += f"Всего товаров: {stats['total_products']}\n\n"
-                text += "ТОП-5 просматриваемых:\n"
-                for i, product in enumerate(stats['top_products'], 1):
-                    text += f"{i}. {product['name']} - {product['views']} просмотров\n"
-                text += "\nПоследние 3 товара:\n"
-                for product in stats['recent_products']:
-                    text += f"• {product['name']}\n"
-            else:
-                text = "❌ Ошибка получения статистики"
+async def admin_stats(callback: CallbackQuery, api: BackendClient):
+    if await deny_non_admin(callback):
+        return
+    text = stats_texts.get("summary")
+    if text is None:
+        try:
+            stats = await api.get_stats()
+            text = f"📊 Статистика:\n\n"
+            text += f"Всего товаров: {stats['total_products']}\n\n"
+            text += "ТОП-5 просматриваемых:\n"
+            for i, product in enumerate(stats['top_products'], 1):
+                text += f"{i}. {product['name']} - {product['views']} просмотров\n"
+            text += "\nПоследние 3 товара:\n"
+            for product in stats['recent_products']:
+                text += f"• {product['name']}\n"
+            stats_texts.set("summary", text)
+        except BackendAPIError:
+            text = "❌ Ошибка получения статистики"
     
-    await callback.message.answer(text)
+    await callback.message.answer(text, reply_markup=STATS_WINDOWS_KEYBOARD)
+    await callback.answer()
+
+def render_sparkline(values):
+    """Мини-график тренда из символов ▁▂▃▄▅▆▇█"""
+    bars = "▁▂▃▄▅▆▇█"
+    if not values:
+        return ""
+    top = max(values) or 1
+    return "".join(bars[min(len(bars) - 1, v * len(bars) // (top + 1))] for v in values)
+
+@dp.callback_query(F.data.startswith("admin_stats_window_"))
+async def admin_stats_window(callback: CallbackQuery, api: BackendClient):
+    if await deny_non_admin(callback):
+        return
+    window = callback.data.removeprefix("admin_stats_window_")
+    text = stats_texts.get(window)
+    if text is None:
+        try:
+            stats = await api.get_view_stats(window)
+            text = f"📈 Просмотры {STATS_WINDOWS.get(window, window).lower()}:\n\n"
+            text += f"Всего: {stats['total_views']}\n"
+            trend = render_sparkline([point["views"] for point in stats["trend"]])
+            if trend:
+                text += f"Тренд: {trend}\n"
+            text += "\nТОП просматриваемых:\n"
+            for i, product in enumerate(stats["top_products"], 1):
+                text += f"{i}. {product['name']} - {product['views']} просмотров\n"
+            if not stats["top_products"]:
+                text += "нет просмотров за период\n"
+            stats_texts.set(window, text)
+        except BackendAPIError:
+            text = "❌ Ошибка получения статистики"
+    
+    await callback.message.answer(text, reply_markup=STATS_WINDOWS_KEYBOARD)
     await callback.answer()
 
 @dp.callback_query(F.data == "admin_help")
 async def admin_help(callback: CallbackQuery):
+    if await deny_non_admin(callback):
+        return
     text = """❓ Помощь по админ-панели:
 
 ➕ Добавить товар:
@@ -319,29 +762,103 @@ async def admin_help(callback: CallbackQuery):
 5. Отправьте "Готово"
 
 ✏️ Редактировать товар:
-1. Выберите товар из списка
+1. Выберите товар из списка или найдите его: «🔎 Найти товар» либо /edit <id>
 2. Выберите поле для редактирования
 3. Введите новое значение
 
+📥 Импорт каталога:
+Отправьте /import и файл .csv или .jsonl — товары сопоставляются по sku.
+
+📣 Рассылка:
+Отправьте /broadcast и сообщение (текст или фото с подписью), проверьте предпросмотр и подтвердите.
+Сообщение получат все, кто смотрел товары; ход рассылки обновляется в чате, её можно остановить.
+
 📊 Статистика:
-Показывает общее количество товаров, ТОП-5 просматриваемых и последние добавленные товары."""
+Показывает общее количество товаров, ТОП-5 просматриваемых и последние добавленные товары.
+Кнопки под статистикой показывают просмотры и тренд за 24 часа, 7 и 30 дней."""
     
     await callback.message.answer(text)
     await callback.answer()
 
 @dp.callback_query(F.data == "admin_back")
 async def admin_back(callback: CallbackQuery):
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Добавить товар", callback_data="admin_add_product")],
-        [InlineKeyboardButton(text="✏️ Редактировать товар", callback_data="admin_edit_product")],
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton(text="❓ Помощь", callback_data="admin_help")]
-    ])
-    await callback.message.answer("🛠️ Админ-панель bro shop", reply_markup=keyboard)
+    if await deny_non_admin(callback):
+        return
+    await callback.message.answer("🛠️ Админ-панель bro shop", reply_markup=ADMIN_MENU_KEYBOARD)
     await callback.answer()
 
+@dp.startup()
+async def on_startup(dispatcher: Dispatcher):
+    # Один клиент бэкенда на процесс: хэндлеры получают его аргументом api
+    api = BackendClient(
+        BACKEND_URL,
+        timeout=float(os.getenv("BACKEND_TIMEOUT", "10")),
+        retries=int(os.getenv("BACKEND_RETRIES", "3")),
+        pool_size=int(os.getenv("BACKEND_POOL_SIZE", "20")),
+        api_key=service_api_key(BOT_TOKEN),
+    )
+    await api.start()
+    dispatcher["api"] = api
+    # Рассылки, прерванные перезапуском, продолжаются в фоне
+    broadcaster = Broadcaster(bot, api)
+    dispatcher["broadcaster"] = broadcaster
+    await broadcaster.resume()
+
+@dp.shutdown()
+async def on_shutdown(dispatcher: Dispatcher):
+    await dispatcher["broadcaster"].stop()
+    await dispatcher["api"].close()
+    await dispatcher.storage.close()
+
 async def main():
+    # Переход с webhook на polling: Telegram не отдаёт getUpdates при активном webhook
+    await bot.delete_webhook()
+    start_metrics_server()
     await dp.start_polling(bot)
 
+async def set_webhook():
+    await bot.set_webhook(
+        f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    await bot.session.close()
+
+def create_webhook_app() -> web.Application:
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/metrics", metrics_view)
+    # Связывает startup/shutdown диспетчера с жизненным циклом aiohttp-приложения
+    setup_application(app, dp, bot=bot)
+    return app
+
+def run_webhook_worker():
+    # reuse_port: все воркеры слушают один порт, ядро распределяет соединения
+    web.run_app(create_webhook_app(), host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                reuse_port=BOT_WORKERS > 1, print=None)
+
+def run_webhook():
+    if not WEBHOOK_BASE_URL:
+        print("❌ Ошибка: для BOT_MODE=webhook нужен WEBHOOK_BASE_URL")
+        sys.exit(1)
+    if BOT_WORKERS > 1 and isinstance(dp.storage, MemoryStorage):
+        print("❌ Ошибка: несколько воркеров требуют общего хранилища FSM (FSM_STORAGE=sql)")
+        sys.exit(1)
+
+    # Webhook регистрируется один раз, до запуска воркеров
+    asyncio.run(set_webhook())
+    if BOT_WORKERS == 1:
+        run_webhook_worker()
+        return
+
+    workers = [multiprocessing.Process(target=run_webhook_worker) for _ in range(BOT_WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(main())
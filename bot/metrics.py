@@ -0,0 +1,82 @@
+"""
+Метрики бота в формате Prometheus.
+
+HandlerTimingMiddleware меряет время каждого хэндлера и считает ошибки,
+BackendClient — время и коды ответов запросов к бэкенду.
+Метрики отдаются на /metrics: в webhook-режиме тем же aiohttp-сервером,
+в режиме polling — отдельным HTTP-сервером на BOT_METRICS_PORT.
+
+При нескольких webhook-воркерах задайте PROMETHEUS_MULTIPROC_DIR
+(пустая папка): тогда /metrics любого воркера отдаёт сумму по всем.
+"""
+import os
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiohttp import web
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest,
+    multiprocess, start_http_server,
+)
+
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "0"))
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Время работы хэндлера",
+    ["event", "handler"],
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Необработанные исключения в хэндлерах",
+    ["event", "handler"],
+)
+BACKEND_LATENCY = Histogram(
+    "bot_backend_request_duration_seconds", "Время запроса к API бэкенда (одна попытка)",
+    ["method", "path", "status"],
+)
+
+def path_label(path: str) -> str:
+    """/api/products/15 -> /api/products/{id}: метка не зависит от id"""
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path)
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    def __init__(self, event_name: str):
+        self.event_name = event_name
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(self.event_name, name).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(self.event_name, name).observe(time.perf_counter() - start)
+
+def setup_bot_metrics(dp: Dispatcher):
+    # Внутренние middleware: вызываются, только когда хэндлер найден
+    for event_name in ("message", "callback_query", "inline_query"):
+        getattr(dp, event_name).middleware(HandlerTimingMiddleware(event_name))
+
+def metrics_registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(body=generate_latest(metrics_registry()),
+                        headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+def start_metrics_server():
+    """HTTP-сервер /metrics для режима polling (если задан BOT_METRICS_PORT)"""
+    if BOT_METRICS_PORT:
+        start_http_server(BOT_METRICS_PORT, registry=metrics_registry())
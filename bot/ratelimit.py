@@ -0,0 +1,128 @@
+"""
+Ограничение исходящих сообщений бота.
+
+Telegram пропускает около 30 сообщений в секунду на бота и примерно одно
+в секунду в один чат; при превышении он отвечает 429 с retry_after и
+может временно заблокировать бота. RateLimitMiddleware стоит в сессии
+бота и пропускает через токен-бакеты все методы, которые пишут в чат:
+общий (BOT_GLOBAL_RATE на все процессы, делится на BOT_WORKERS) и
+отдельный для каждого чата (BOT_CHAT_RATE с запасом BOT_CHAT_BURST).
+На 429 весь процесс замирает на retry_after, и запрос повторяется.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+BOT_GLOBAL_RATE = float(os.getenv("BOT_GLOBAL_RATE", "30"))
+BOT_CHAT_RATE = float(os.getenv("BOT_CHAT_RATE", "1"))
+BOT_CHAT_BURST = float(os.getenv("BOT_CHAT_BURST", "3"))
+RETRY_AFTER_ATTEMPTS = int(os.getenv("RETRY_AFTER_ATTEMPTS", "3"))
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity в запасе.
+    По умолчанию запаса нет: запросы идут ровно через 1/rate секунды,
+    и ни в одном секундном окне их не бывает больше rate + 1"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Забрать токен (возможно, в долг) и вернуть, сколько ждать до его появления.
+        Долг выстраивает конкурентов в очередь без блокировок"""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+class RateLimiter:
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._paused_until = 0.0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            # Полные бакеты ничего не ограничивают, их можно забыть
+            while len(self._chats) > self.max_chats:
+                oldest_id, oldest = next(iter(self._chats.items()))
+                if not oldest.idle:
+                    break
+                del self._chats[oldest_id]
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id=None):
+        """Дождаться права на запрос; chat_id=None — запрос не пишет в чат
+        и ждёт только окончания паузы после 429"""
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        if chat_id is None:
+            return
+        # Сначала очередь чата, потом общая: ожидание одного чата не тратит общий лимит
+        await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, seconds: float):
+        """Остановить отправку на seconds (после 429)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    def __init__(self, limiter: RateLimiter, attempts: int = RETRY_AFTER_ATTEMPTS):
+        self.limiter = limiter
+        self.attempts = attempts
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        for attempt in range(self.attempts):
+            await self.limiter.acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.attempts - 1:
+                    raise
+                logger.warning("Flood control on %s, retry in %ss", type(method).__name__, e.retry_after)
+                self.limiter.pause(e.retry_after)
+
+def create_rate_limiter() -> RateLimiter:
+    return RateLimiter(
+        global_rate=BOT_GLOBAL_RATE / max(BOT_WORKERS, 1),
+        chat_rate=BOT_CHAT_RATE,
+        chat_burst=BOT_CHAT_BURST,
+    )
@@ -0,0 +1,71 @@
+"""
+Кэш отрисованных экранов бота.
+
+Экран редактирования товара (текст и клавиатура) хранится по id товара
+вместе с версией. После своей правки бот кладёт в кэш экран из ответа
+PATCH, поэтому меню товара открывается без запроса к бэкенду. Чужие
+изменения (другой воркер, импорт, списание остатков) видны не позже чем
+через EDIT_SCREEN_TTL секунд. Устаревший экран безопасен: кнопки несут
+версию, и правка по ней получит 409 и свежий экран.
+
+Тексты статистики живут STATS_TTL секунд.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+
+class TTLCache:
+    """Ограниченный словарь: записи живут ttl секунд, лишние вытесняются по LRU"""
+
+    def __init__(self, ttl: float, max_size: int = 1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> Any:
+        if self.ttl > 0:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return value
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+class Screen(NamedTuple):
+    text: str
+    keyboard: InlineKeyboardMarkup
+    version: int = 0
+
+class EditScreenCache(TTLCache):
+    def put(self, product_id: int, screen: Screen) -> Screen:
+        """Запомнить экран, если он не старше уже сохранённого.
+        Ответ GET, ушедший до нашей правки, не затрёт экран из ответа PATCH"""
+        cached = self.get(product_id)
+        if cached is None or cached.version <= screen.version:
+            self.set(product_id, screen)
+        return screen
+
+edit_screens = EditScreenCache(
+    ttl=float(os.getenv("EDIT_SCREEN_TTL", "30")),
+    max_size=int(os.getenv("EDIT_SCREEN_CACHE_SIZE", "500")),
+)
+stats_texts = TTLCache(ttl=float(os.getenv("STATS_TTL", "30")), max_size=16)
@@ -0,0 +1,107 @@
+"""
+Хранилища FSM для бота.
+
+MemoryStorage живёт только внутри одного процесса и теряется при
+перезапуске. SQLStorage хранит состояние и данные мастеров (например,
+недозаполненный товар) в таблице bot_fsm_states: в основной базе
+PostgreSQL или в локальном файле SQLite, — поэтому несколько воркеров
+webhook-режима видят одно и то же состояние, а рестарт его не теряет.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import Column, DateTime, JSON, MetaData, String, Table, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+metadata = MetaData()
+
+fsm_states = Table(
+    "bot_fsm_states",
+    metadata,
+    Column("key", String, primary_key=True),
+    Column("state", String, nullable=True),
+    Column("data", JSON, nullable=True),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), onupdate=func.now()),
+)
+
+def make_async_url(url: str) -> str:
+    """Подставить asyncio-драйвер в URL базы данных"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+class SQLStorage(BaseStorage):
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.key_builder = DefaultKeyBuilder(prefix="fsm", with_bot_id=True, with_destiny=True)
+        self._ready = False
+
+    @classmethod
+    def from_url(cls, url: str) -> "SQLStorage":
+        return cls(create_async_engine(make_async_url(url), pool_pre_ping=True))
+
+    async def setup(self):
+        """Создать таблицу состояний, если её ещё нет"""
+        if not self._ready:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(metadata.create_all)
+            self._ready = True
+
+    def _upsert(self, key: StorageKey, **values):
+        if self.engine.dialect.name == "postgresql":
+            stmt = postgresql.insert(fsm_states)
+        else:
+            stmt = sqlite.insert(fsm_states)
+        stmt = stmt.values(key=self.key_builder.build(key), **values)
+        return stmt.on_conflict_do_update(index_elements=["key"], set_=values)
+
+    async def _get(self, key: StorageKey, column) -> Any:
+        await self.setup()
+        async with self.engine.connect() as conn:
+            return await conn.scalar(
+                select(column).where(fsm_states.c.key == self.key_builder.build(key))
+            )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.setup()
+        value = state.state if isinstance(state, State) else state
+        async with self.engine.begin() as conn:
+            await conn.execute(self._upsert(key, state=value))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get(key, fsm_states.c.state)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.setup()
+        async with self.engine.begin() as conn:
+            await conn.execute(self._upsert(key, data=data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = await self._get(key, fsm_states.c.data)
+        return dict(data or {})
+
+    async def close(self) -> None:
+        await self.engine.dispose()
+
+def create_storage() -> BaseStorage:
+    """
+    FSM_STORAGE=memory — состояние в памяти процесса (по умолчанию);
+    FSM_STORAGE=sql — таблица в FSM_DATABASE_URL (по умолчанию DATABASE_URL),
+    например sqlite:///bot_fsm.db для локального файла.
+    """
+    kind = os.getenv("FSM_STORAGE", "memory").lower()
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sql":
+        url = os.getenv("FSM_DATABASE_URL") or os.getenv("DATABASE_URL")
+        if not url:
+            raise RuntimeError("FSM_STORAGE=sql requires FSM_DATABASE_URL or DATABASE_URL")
+        return SQLStorage.from_url(url)
+    raise RuntimeError(f"Unknown FSM_STORAGE: {kind}")
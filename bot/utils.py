@@ -1,28 +1,57 @@
-import aiohttp
+import asyncio
 import os
+import time
+from typing import AsyncIterator, Awaitable, Callable
 
-async def upload_photo_to_backend(photo_file_id: str, bot_token: str, backend_url: str):
-    """Загружает фото на бэкенд и возвращает URL"""
-    from aiogram import Bot
-    
-    bot = Bot(token=bot_token)
-    
+import aiofiles
+from aiogram import Bot
+from api_client import BackendClient
+
+# Фото пересылаются потоком: в памяти одновременно не больше
+# PHOTO_RELAY_CONCURRENCY * RELAY_CHUNK_SIZE байт на процесс
+RELAY_CHUNK_SIZE = 64 * 1024
+PHOTO_RELAY_CONCURRENCY = int(os.getenv("PHOTO_RELAY_CONCURRENCY", "4"))
+PHOTO_RELAY_TIMEOUT = int(os.getenv("PHOTO_RELAY_TIMEOUT", "60"))
+
+_relay_slots = asyncio.Semaphore(PHOTO_RELAY_CONCURRENCY)
+
+async def iter_telegram_file(bot: Bot, file_path: str) -> AsyncIterator[bytes]:
+    """Читать файл из Telegram по кускам, не собирая его целиком в памяти"""
+    if bot.session.api.is_local:
+        # Локальный Bot API сервер отдаёт путь к файлу на диске
+        async with aiofiles.open(bot.session.api.wrap_local_file.to_local(file_path), "rb") as f:
+            while chunk := await f.read(RELAY_CHUNK_SIZE):
+                yield chunk
+        return
+    url = bot.session.api.file_url(bot.token, file_path)
+    async for chunk in bot.session.stream_content(
+        url, timeout=PHOTO_RELAY_TIMEOUT, chunk_size=RELAY_CHUNK_SIZE
+    ):
+        yield chunk
+
+async def track_progress(chunks: AsyncIterator[bytes], on_progress: Callable[[int], Awaitable[None]],
+                         interval: float = 2.0) -> AsyncIterator[bytes]:
+    """Пропустить поток через себя, сообщая о числе переданных байт
+    не чаще раза в interval секунд"""
+    sent = 0
+    reported_at = time.monotonic()
+    async for chunk in chunks:
+        sent += len(chunk)
+        yield chunk
+        if time.monotonic() - reported_at >= interval:
+            reported_at = time.monotonic()
+            await on_progress(sent)
+
+async def upload_photo_to_backend(bot: Bot, api: BackendClient, photo_file_id: str):
+    """Загружает фото на бэкенд и возвращает {"url": ..., "variants": {...}}.
+    Файл идёт из Telegram в бэкенд потоком, без буферизации целиком."""
     try:
-        # Скачиваем фото из Telegram
-        file = await bot.get_file(photo_file_id)
-        file_data = await bot.download_file(file.file_path)
-        
-        # Отправляем на бэкенд
-        async with aiohttp.ClientSession() as session:
-            data = aiohttp.FormData()
-            data.add_field('file', file_data, filename=os.path.basename(file.file_path))
-            
-            async with session.post(f"{backend_url}/api/admin/upload", data=data) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                    return result.get("url")
-        
-        return None
+        async with _relay_slots:
+            file = await bot.get_file(photo_file_id)
+            return await api.upload_stream(
+                iter_telegram_file(bot, file.file_path),
+                filename=os.path.basename(file.file_path),
+            )
     except Exception as e:
         print(f"Error uploading photo: {e}")
         return None
@@ -0,0 +1,43 @@
+"""
+Общая настройка тестов: бэкенд с временной SQLite и включённой проверкой initData.
+
+Модули бэкенда читают окружение при импорте, поэтому оно задаётся здесь,
+до их импорта в тестах.
+"""
+import hashlib
+import hmac
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND))
+
+TMP = tempfile.mkdtemp(prefix="broshop-tests-")
+BOT_TOKEN = "123456:test"
+ADMIN_ID = 1
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TMP}/test.db",
+    "MEDIA_DIR": f"{TMP}/media",
+    "BOT_TOKEN": BOT_TOKEN,
+    "ADMIN_IDS": str(ADMIN_ID),
+})
+os.environ.pop("BACKEND_API_KEY", None)
+os.environ.pop("SESSION_SECRET", None)
+
+# Заголовок бота: ключ сервиса по умолчанию выводится из BOT_TOKEN
+SERVICE = {"X-API-Key": hmac.new(BOT_TOKEN.encode(), b"backend-api-key", hashlib.sha256).hexdigest()}
+
+@pytest.fixture(scope="module")
+def client():
+    from init_db import init_db
+    import main
+
+    init_db()
+    with TestClient(main.app) as client:
+        yield client
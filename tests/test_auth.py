@@ -0,0 +1,80 @@
+"""Доступ к маршрутам остатков и резервов (auth.py, main.py)"""
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+from conftest import ADMIN_ID, BOT_TOKEN, SERVICE
+
+def sign_init_data(user_id: int) -> str:
+    """initData, подписанный так же, как его подписывает Telegram"""
+    data = {
+        "auth_date": str(int(time.time())),
+        "user": json.dumps({"id": user_id, "first_name": "test"}),
+    }
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    check_string = "\n".join(f"{key}={value}" for key, value in sorted(data.items()))
+    data["hash"] = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(data)
+
+def as_user(user_id: int) -> dict:
+    return {"Authorization": f"tma {sign_init_data(user_id)}"}
+
+@pytest.fixture
+def product_id(client):
+    response = client.post("/api/admin/products", headers=SERVICE, json={
+        "name": "Футболка", "price": 1000, "sizes": {"M": 10},
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def reserve(client, product_id: int, headers: dict, **body):
+    return client.post(f"/api/products/{product_id}/reservations", headers=headers,
+                       json={"size": "M", "quantity": 1, **body})
+
+def test_decrement_is_admin_only(client, product_id):
+    path = f"/api/products/{product_id}/stock/decrement"
+    change = {"size": "M", "quantity": 1}
+    assert client.post(path, json=change).status_code == 401
+    assert client.post(path, json=change, headers=as_user(5)).status_code == 403
+    assert client.post(path, json=change, headers=as_user(ADMIN_ID)).status_code == 200
+    response = client.post(path, json=change, headers=SERVICE)
+    assert response.status_code == 200
+    assert response.json()["remaining"] == 8
+
+def test_reservation_requires_session(client, product_id):
+    assert reserve(client, product_id, {}).status_code == 401
+
+def test_reservation_belongs_to_session_user(client, product_id):
+    from database import SessionLocal
+    from models import StockReservation
+
+    response = reserve(client, product_id, as_user(5), user_id=99)
+    assert response.status_code == 201
+    with SessionLocal() as db:
+        assert db.get(StockReservation, response.json()["id"]).user_id == 5
+
+def test_only_owner_confirms_and_cancels(client, product_id):
+    reservation_id = reserve(client, product_id, as_user(5)).json()["id"]
+    assert client.post(f"/api/reservations/{reservation_id}/confirm").status_code == 401
+    assert client.post(f"/api/reservations/{reservation_id}/confirm", headers=as_user(6)).status_code == 403
+    assert client.delete(f"/api/reservations/{reservation_id}", headers=as_user(6)).status_code == 403
+    assert client.post(f"/api/reservations/{reservation_id}/confirm", headers=as_user(5)).status_code == 200
+
+def test_admin_and_service_manage_any_reservation(client, product_id):
+    first = reserve(client, product_id, SERVICE, user_id=7).json()["id"]
+    second = reserve(client, product_id, as_user(7)).json()["id"]
+    assert client.delete(f"/api/reservations/{first}", headers=as_user(ADMIN_ID)).status_code == 200
+    assert client.delete(f"/api/reservations/{second}", headers=SERVICE).status_code == 200
+    assert client.delete(f"/api/reservations/{second}", headers=SERVICE).status_code == 404
+
+@pytest.mark.parametrize("headers", [
+    {"X-API-Key": "é".encode()},
+    {"Authorization": "Bearer 1.2.é".encode()},
+    {"Authorization": b"tma auth_date=1&user=%7B%7D&hash=%C3%A9"},
+])
+def test_non_ascii_credentials_are_rejected(client, product_id, headers):
+    assert reserve(client, product_id, headers).status_code == 401
@@ -0,0 +1,125 @@
+"""Админские обработчики бота не выполняются для обычных пользователей"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import Update
+
+from conftest import ADMIN_ID, BOT_TOKEN
+
+BOT = Path(__file__).resolve().parent.parent / "bot"
+# Модули бота, чьи имена совпадают с модулями бэкенда
+SHADOWED = ("main", "metrics")
+USER_ID = 5
+
+class RecordingSession(BaseSession):
+    """Сессия без сети: запоминает вызовы Bot API"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+        self.state = None
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append(method)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+class FailingAPI:
+    """Клиент бэкенда, которого обработчик не должен касаться"""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"backend call {name} for non-admin")
+
+@pytest.fixture(scope="module")
+def bot_main():
+    saved_modules = {name: sys.modules.pop(name) for name in SHADOWED if name in sys.modules}
+    saved_env = dict(os.environ)
+    sys.path.insert(0, str(BOT))
+    try:
+        import main
+        main.dp["api"] = FailingAPI()
+        yield main
+    finally:
+        sys.path.remove(str(BOT))
+        for name in SHADOWED:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved_modules)
+        os.environ.clear()
+        os.environ.update(saved_env)
+
+def feed(bot_main, update: dict, state=None) -> RecordingSession:
+    """Провести update через диспетчер; state — заранее выставленный шаг мастера"""
+    session = RecordingSession()
+    bot = Bot(BOT_TOKEN, session=session)
+    user_id = update.get("message", update.get("callback_query", {}))["from"]["id"]
+    context = bot_main.dp.fsm.get_context(bot, chat_id=user_id, user_id=user_id)
+
+    async def run():
+        await context.set_state(state)
+        await bot_main.dp.feed_update(bot, Update.model_validate(update, context={"bot": bot}))
+        return await context.get_state()
+
+    session.state = asyncio.run(run())
+    return session
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "test"}
+
+def chat_message(user_id: int, text: str) -> dict:
+    return {"message_id": 1, "date": 0, "chat": {"id": user_id, "type": "private"},
+            "from": user(user_id), "text": text}
+
+def callback_update(user_id: int, data: str) -> dict:
+    return {"update_id": 1, "callback_query": {
+        "id": "1", "from": user(user_id), "chat_instance": "1", "data": data,
+        "message": chat_message(user_id, "menu"),
+    }}
+
+@pytest.mark.parametrize("data", [
+    "admin_add_product", "admin_edit_product", "edit_product_1",
+    "admin_stats", "admin_stats_window_24h", "admin_back", "admin_import",
+    "edit_field_1_price_1",
+])
+def test_non_admin_callback_is_rejected(bot_main, data):
+    requests = feed(bot_main, callback_update(USER_ID, data)).requests
+    assert len(requests) == 1
+    assert isinstance(requests[0], AnswerCallbackQuery)
+    assert requests[0].show_alert
+
+def test_admin_callback_is_handled(bot_main):
+    requests = feed(bot_main, callback_update(ADMIN_ID, "admin_back")).requests
+    assert [type(request).__name__ for request in requests] == ["SendMessage", "AnswerCallbackQuery"]
+
+def test_non_admin_cannot_finish_wizard(bot_main):
+    """Шаг мастера с подставленным состоянием: отказ и сброс состояния"""
+    update = {"update_id": 1, "message": chat_message(USER_ID, "Готово")}
+    session = feed(bot_main, update, state=bot_main.AddProductStates.waiting_for_sizes)
+    assert [type(request).__name__ for request in session.requests] == ["SendMessage"]
+    assert session.requests[0].text == bot_main.ACCESS_DENIED
+    assert session.state is None
+
+def test_non_admin_cannot_import(bot_main):
+    update = {"update_id": 1, "message": {
+        **chat_message(USER_ID, ""), "text": None,
+        "document": {"file_id": "1", "file_unique_id": "1", "file_name": "catalog.csv"},
+    }}
+    session = feed(bot_main, update, state=bot_main.ImportStates.waiting_for_file)
+    assert session.requests[0].text == bot_main.ACCESS_DENIED
+    assert session.state is None
+
+def test_non_admin_cannot_patch_product(bot_main):
+    update = {"update_id": 1, "message": chat_message(USER_ID, "1")}
+    session = feed(bot_main, update, state=bot_main.EditProductStates.waiting_for_value)
+    assert session.requests[0].text == bot_main.ACCESS_DENIED
+    assert session.state is None
@@ -0,0 +1,54 @@
+"""Импорт каталога по sku (catalog_io.py)"""
+import asyncio
+
+import pytest
+
+@pytest.fixture(scope="module", autouse=True)
+def db_ready():
+    from init_db import init_db
+
+    init_db()
+
+def import_lines(*lines: str) -> dict:
+    from catalog_io import import_catalog
+    from database import AsyncSessionLocal
+
+    async def chunks():
+        yield ("\n".join(lines) + "\n").encode()
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            return await import_catalog(db, chunks(), "jsonl")
+
+    return asyncio.run(run())
+
+def product_by_sku(sku: str):
+    from database import SessionLocal
+    from models import Product
+
+    with SessionLocal() as db:
+        product = db.query(Product).filter(Product.sku == sku).one()
+        return product.image_url, product.image_variants
+
+def set_variants(sku: str, variants: dict):
+    from database import SessionLocal
+    from models import Product
+
+    with SessionLocal() as db:
+        db.query(Product).filter(Product.sku == sku).update({"image_variants": variants})
+        db.commit()
+
+VARIANTS = {"thumb": {"jpeg": "/static/media/ab/old_thumb.jpg"}}
+
+def test_new_image_url_drops_old_variants():
+    import_lines('{"sku": "IMG-1", "name": "A", "price": 1, "image_url": "/static/old.jpg"}')
+    set_variants("IMG-1", VARIANTS)
+    import_lines('{"sku": "IMG-1", "name": "A", "price": 1, "image_url": "/static/new.jpg"}')
+    assert product_by_sku("IMG-1") == ("/static/new.jpg", None)
+
+def test_same_or_missing_image_url_keeps_variants():
+    import_lines('{"sku": "IMG-2", "name": "B", "price": 1, "image_url": "/static/b.jpg"}')
+    set_variants("IMG-2", VARIANTS)
+    import_lines('{"sku": "IMG-2", "name": "B", "price": 2, "image_url": "/static/b.jpg"}')
+    import_lines('{"sku": "IMG-2", "name": "B", "price": 3}')
+    assert product_by_sku("IMG-2") == ("/static/b.jpg", VARIANTS)
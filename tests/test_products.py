@@ -0,0 +1,47 @@
+"""Изменение товаров админкой: проверка версии (PATCH и PUT)"""
+import pytest
+
+from conftest import SERVICE
+
+PRODUCT = {"name": "Худи", "price": 3000, "sizes": {"M": 2}}
+
+@pytest.fixture
+def product(client):
+    response = client.post("/api/admin/products", headers=SERVICE, json=PRODUCT)
+    assert response.status_code == 200
+    return response.json()
+
+def patch(client, product_id: int, **changes):
+    return client.patch(f"/api/admin/products/{product_id}", headers=SERVICE, json=changes)
+
+def test_patch_bumps_version(client, product):
+    response = patch(client, product["id"], price=3500, version=product["version"])
+    assert response.status_code == 200
+    assert response.json()["price"] == 3500
+    assert response.json()["version"] == product["version"] + 1
+
+def test_stale_version_is_rejected(client, product):
+    # Два админа открыли товар с одной версией: проходит только первая правка
+    first = patch(client, product["id"], price=3100, version=product["version"])
+    second = patch(client, product["id"], name="Свитшот", version=product["version"])
+    assert first.status_code == 200
+    assert second.status_code == 409
+    assert second.json()["detail"]["version"] == first.json()["version"]
+    current = client.get(f"/api/products/{product['id']}").json()
+    assert (current["name"], current["price"]) == ("Худи", 3100)
+
+def test_stale_version_does_not_touch_stock(client, product):
+    patch(client, product["id"], description="Новое", version=product["version"])
+    response = patch(client, product["id"], sizes={"M": 0}, version=product["version"])
+    assert response.status_code == 409
+    assert client.get(f"/api/products/{product['id']}").json()["sizes"] == {"M": 2}
+
+def test_patch_of_missing_product_is_404(client):
+    assert patch(client, 10**9, price=1, version=1).status_code == 404
+
+def test_put_with_only_new_sizes_bumps_version(client, product):
+    path = f"/api/admin/products/{product['id']}"
+    unchanged = client.put(path, headers=SERVICE, json=PRODUCT).json()
+    assert unchanged["version"] == product["version"]
+    changed = client.put(path, headers=SERVICE, json={**PRODUCT, "sizes": {"M": 1}}).json()
+    assert changed["version"] == product["version"] + 1
@@ -0,0 +1,46 @@
+"""«Вы недавно смотрели»: порядок по последнему просмотру"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+@pytest.fixture(scope="module", autouse=True)
+def db_ready():
+    from init_db import init_db
+
+    init_db()
+
+def recent_after(user_id: int, batches, exclude=None):
+    """Записать просмотры пачками (каждая — один flush) и прочитать недавние"""
+    from database import AsyncSessionLocal
+    from recommendations import recently_viewed
+    from view_ingest import ViewIngestor
+
+    async def run():
+        ingestor = ViewIngestor()
+        for batch in batches:
+            ingestor.add_many((user_id, product_id) for product_id in batch)
+            await ingestor.flush()
+        async with AsyncSessionLocal() as db:
+            return await recently_viewed(db, user_id, limit=10, exclude=exclude)
+
+    return asyncio.run(run())
+
+def test_repeat_view_moves_product_to_front():
+    assert recent_after(500, [[101], [102], [103], [101]]) == [101, 103, 102]
+
+def test_older_batch_does_not_move_product_back():
+    from database import AsyncSessionLocal
+    from view_ingest import last_view_upsert
+
+    assert recent_after(501, [[201], [202]]) == [202, 201]
+
+    async def late_batch():
+        # Пачка другого воркера с более ранним просмотром пришла позже
+        async with AsyncSessionLocal() as db:
+            stale = datetime.now(timezone.utc) - timedelta(hours=1)
+            await db.execute(last_view_upsert([((501, 202), stale)]))
+            await db.commit()
+
+    asyncio.run(late_batch())
+    assert recent_after(501, [], exclude=999) == [202, 201]
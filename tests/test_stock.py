@@ -0,0 +1,75 @@
+"""Остатки и резервы (stock.py): без перепродажи при конкурентных покупках"""
+import asyncio
+
+import pytest
+
+@pytest.fixture(scope="module", autouse=True)
+def db_ready():
+    from init_db import init_db
+
+    init_db()
+
+@pytest.fixture
+def product_id():
+    from database import SessionLocal
+    from models import Product, ProductStock
+
+    with SessionLocal() as db:
+        product = Product(name="Кеды", price=5000, stock=[ProductStock(size="42", quantity=5)])
+        db.add(product)
+        db.commit()
+        return product.id
+
+def quantity(product_id: int) -> int:
+    from database import SessionLocal
+    from models import ProductStock
+
+    with SessionLocal() as db:
+        return db.query(ProductStock.quantity).filter_by(product_id=product_id, size="42").scalar()
+
+def run_concurrently(count: int, action):
+    """count одновременных вызовов action(db), у каждого своя сессия"""
+    from database import AsyncSessionLocal
+
+    async def one():
+        async with AsyncSessionLocal() as db:
+            return await action(db)
+
+    async def run():
+        return await asyncio.gather(*(one() for _ in range(count)))
+
+    return asyncio.run(run())
+
+def test_concurrent_decrements_never_oversell(product_id):
+    from stock import decrement
+
+    results = run_concurrently(12, lambda db: decrement(db, product_id, "42", 1))
+    assert sum(result is not None for result in results) == 5
+    assert sorted(result for result in results if result is not None) == [0, 1, 2, 3, 4]
+    assert quantity(product_id) == 0
+
+def test_concurrent_reservations_never_oversell(product_id):
+    from stock import reserve
+
+    results = run_concurrently(6, lambda db: reserve(db, product_id, "42", 2))
+    assert sum(result is not None for result in results) == 2
+    assert quantity(product_id) == 1
+
+def test_expired_reservation_is_returned_to_stock(product_id):
+    from stock import ReservationReaper, confirm, reserve
+
+    [reservation] = run_concurrently(1, lambda db: reserve(db, product_id, "42", 3, ttl=-1))
+    assert quantity(product_id) == 2
+    # Просроченный резерв не подтверждается, его снимает фоновая задача
+    assert run_concurrently(1, lambda db: confirm(db, reservation.id)) == [None]
+    assert asyncio.run(ReservationReaper().run_once()) >= 1
+    assert quantity(product_id) == 5
+
+def test_cancelled_reservation_is_returned_once(product_id):
+    from stock import release, reserve
+
+    [reservation] = run_concurrently(1, lambda db: reserve(db, product_id, "42", 4))
+    assert quantity(product_id) == 1
+    results = run_concurrently(3, lambda db: release(db, reservation.id))
+    assert sorted(results) == [False, False, True]
+    assert quantity(product_id) == 5
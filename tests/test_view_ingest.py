@@ -0,0 +1,73 @@
+"""Буфер просмотров (view_ingest.py): уникальные просмотры и счётчики"""
+import asyncio
+
+import pytest
+
+@pytest.fixture(scope="module", autouse=True)
+def db_ready():
+    from init_db import init_db
+
+    init_db()
+
+def counts(product_id: int):
+    """(строк в product_views, значение счётчика) для товара"""
+    from database import SessionLocal
+    from models import ProductView, ProductViewCounter
+
+    with SessionLocal() as db:
+        rows = db.query(ProductView).filter_by(product_id=product_id).count()
+        counter = db.get(ProductViewCounter, product_id)
+        return rows, counter.unique_views if counter else 0
+
+def test_repeats_are_counted_once():
+    from view_ingest import ViewIngestor
+
+    async def run():
+        ingestor = ViewIngestor()
+        ingestor.add_many([(1, 301), (1, 301), (2, 301)])
+        assert ingestor.pending == 2
+        first = await ingestor.flush()
+        # Повтор уже записанного просмотра и новый пользователь
+        ingestor.add_many([(1, 301), (3, 301)])
+        return first, await ingestor.flush()
+
+    assert asyncio.run(run()) == (2, 2)
+    assert counts(301) == (3, 3)
+
+def test_concurrent_flushes_do_not_double_count():
+    from view_ingest import ViewIngestor
+
+    async def run():
+        # Два воркера с одними и теми же просмотрами пишут одновременно
+        ingestors = [ViewIngestor(), ViewIngestor()]
+        for ingestor in ingestors:
+            ingestor.add_many((user_id, 302) for user_id in range(50))
+        await asyncio.gather(*(ingestor.flush() for ingestor in ingestors))
+
+    asyncio.run(run())
+    assert counts(302) == (50, 50)
+
+def test_full_buffer_rejects_views():
+    from view_ingest import ViewIngestor
+
+    ingestor = ViewIngestor(max_pending=2)
+    assert ingestor.add(1, 303)
+    assert ingestor.add(1, 303)
+    assert ingestor.add(2, 303)
+    assert not ingestor.add(3, 303)
+    assert ingestor.pending == 2
+
+def test_failed_batch_stays_pending():
+    from view_ingest import ViewIngestor
+
+    class BrokenSession:
+        async def __aenter__(self):
+            raise ConnectionError("database is down")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    ingestor = ViewIngestor(session_factory=BrokenSession)
+    ingestor.add_many([(1, 304), (2, 304)])
+    assert asyncio.run(ingestor.flush()) == 0
+    assert ingestor.pending == 2
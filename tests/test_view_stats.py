@@ -0,0 +1,18 @@
+"""Окно аналитики просмотров: /api/stats/views"""
+import pytest
+
+@pytest.mark.parametrize("params", [
+    {"start": "2026-10-01T00:00:00"},
+    {"start": "2026-10-01T00:00:00+03:00", "end": "2026-10-02T00:00:00"},
+    {"start": "2026-10-01T00:00:00", "end": "2026-10-02T00:00:00Z"},
+])
+def test_naive_and_aware_bounds_mix(client, params):
+    response = client.get("/api/stats/views", params=params)
+    assert response.status_code == 200
+    assert response.json()["total_views"] == 0
+
+def test_start_after_end_is_rejected(client):
+    response = client.get("/api/stats/views", params={
+        "start": "2026-10-02T00:00:00", "end": "2026-10-01T00:00:00+00:00",
+    })
+    assert response.status_code == 400
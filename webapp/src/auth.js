@@ -0,0 +1,45 @@
+const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+
+// Токен сессии обновляем заранее, за минуту до истечения
+const REFRESH_MARGIN_MS = 60000
+
+const initData = window.Telegram?.WebApp?.initData || ''
+
+let session = null
+let refreshing = null
+
+const refreshSession = () => {
+  if (!refreshing) {
+    refreshing = fetch(`${API_URL}/api/auth/session`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ init_data: initData }),
+    })
+      .then(response => (response.ok ? response.json() : null))
+      .then(data => {
+        session = data && {
+          token: data.token,
+          refreshAt: Date.now() + data.expires_in * 1000 - REFRESH_MARGIN_MS,
+        }
+      })
+      .catch(error => console.error('Error creating session:', error))
+      .finally(() => {
+        refreshing = null
+      })
+  }
+  return refreshing
+}
+
+// Заголовки для запросов от имени пользователя. Пока токена нет,
+// отправляем initData как есть (бэкенд проверяет и кэширует его сам),
+// а токен получаем в фоне. Вне Telegram заголовков нет.
+export function authHeaders() {
+  if (!initData) {
+    return {}
+  }
+  if (session && session.refreshAt > Date.now()) {
+    return { Authorization: `Bearer ${session.token}` }
+  }
+  refreshSession()
+  return { Authorization: `tma ${initData}` }
+}
@@ -0,0 +1,147 @@
+import { useEffect, useSyncExternalStore } from 'react'
+
+const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+const PAGE_SIZE = 20
+
+// Каталог и карточки товаров живут между переходами по экранам:
+// загружаются один раз, а изменения приходят потоком /api/events
+// и применяются на месте, без повторной загрузки.
+let catalog = { items: [], nextCursor: null, loaded: false }
+// id -> карточка; null — товара нет
+const products = new Map()
+const listeners = new Set()
+let catalogRequest = null
+const productRequests = new Map()
+let events = null
+
+const notify = () => listeners.forEach(listener => listener())
+
+const setCatalog = (changes) => {
+  catalog = { ...catalog, ...changes }
+  notify()
+}
+
+const updateProduct = (id, update) => {
+  if (catalog.items.some(item => item.id === id)) {
+    catalog = { ...catalog, items: catalog.items.map(item => (item.id === id ? update(item) : item)) }
+  }
+  if (products.get(id)) {
+    products.set(id, update(products.get(id)))
+  }
+}
+
+// Каталог приходит страницами: { items, next_cursor }
+export function loadCatalog(cursor = null) {
+  if (!catalogRequest) {
+    const params = new URLSearchParams({ limit: PAGE_SIZE })
+    if (cursor) {
+      params.set('cursor', cursor)
+    }
+    catalogRequest = fetch(`${API_URL}/api/products?${params}`)
+      .then(response => response.json())
+      .then(data => setCatalog({
+        items: cursor ? [...catalog.items, ...data.items] : data.items,
+        nextCursor: data.next_cursor,
+        loaded: true,
+      }))
+      .catch(error => {
+        console.error('Error fetching products:', error)
+        setCatalog({ loaded: true })
+      })
+      .finally(() => {
+        catalogRequest = null
+      })
+  }
+  return catalogRequest
+}
+
+function loadProduct(id) {
+  if (!productRequests.has(id)) {
+    productRequests.set(id, fetch(`${API_URL}/api/products/${id}`)
+      .then(response => (response.ok ? response.json() : null))
+      .then(product => {
+        products.set(id, product)
+        if (product) {
+          updateProduct(id, item => ({ ...item, ...product }))
+        }
+        notify()
+      })
+      .catch(error => {
+        console.error('Error fetching product:', error)
+        products.set(id, null)
+        notify()
+      })
+      .finally(() => productRequests.delete(id)))
+  }
+  return productRequests.get(id)
+}
+
+const handlers = {
+  product: ({ op, product_id: id, product }) => {
+    if (!product) {
+      // Карточка не поместилась в событие: перечитываем, если она показана
+      if (products.has(id) || catalog.items.some(item => item.id === id)) {
+        products.delete(id)
+        loadProduct(id)
+      }
+      return
+    }
+    if (products.has(id)) {
+      products.set(id, product)
+    }
+    if (catalog.items.some(item => item.id === id)) {
+      updateProduct(id, item => ({ ...item, ...product }))
+    } else if (op === 'created' && catalog.loaded) {
+      // Новые товары — сверху каталога
+      catalog = { ...catalog, items: [product, ...catalog.items] }
+    }
+  },
+  stock: ({ product_id: id, sizes }) => {
+    updateProduct(id, item => ({ ...item, sizes: { ...item.sizes, ...sizes } }))
+  },
+  resync: () => {
+    // Часть изменений пропущена: загружаем заново то, что сейчас на экране
+    catalog = { items: [], nextCursor: null, loaded: false }
+    products.clear()
+  },
+}
+
+function connectEvents() {
+  // После обрыва EventSource переподключается сам и передаёт Last-Event-ID,
+  // бэкенд досылает пропущенные события
+  events = new EventSource(`${API_URL}/api/events`)
+  Object.entries(handlers).forEach(([type, handle]) => {
+    events.addEventListener(type, (event) => {
+      handle(JSON.parse(event.data))
+      notify()
+    })
+  })
+}
+
+const subscribe = (listener) => {
+  listeners.add(listener)
+  if (!events) {
+    connectEvents()
+  }
+  return () => listeners.delete(listener)
+}
+
+export function useCatalog() {
+  const snapshot = useSyncExternalStore(subscribe, () => catalog)
+  useEffect(() => {
+    if (!snapshot.loaded) {
+      loadCatalog()
+    }
+  }, [snapshot.loaded])
+  return snapshot
+}
+
+export function useProduct(id) {
+  const product = useSyncExternalStore(subscribe, () => products.get(id))
+  useEffect(() => {
+    if (product === undefined) {
+      loadProduct(id)
+    }
+  }, [id, product])
+  return { product, loading: product === undefined }
+}
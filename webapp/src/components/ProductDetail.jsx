@@ -1,49 +1,73 @@
 import { useState, useEffect } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
+import { authHeaders } from '../auth'
+import { useProduct } from '../catalog'
+import { trackView } from '../viewTracker'
+import ProductImage from './ProductImage'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+const RECOMMENDATIONS_LIMIT = 6
+
+// Fallback для тестирования вне Telegram: один id на сессию
+const fallbackUserId = Math.floor(Math.random() * 1000000)
+const getUserId = () => window.Telegram?.WebApp?.initDataUnsafe?.user?.id || fallbackUserId
+
+function ProductRow({ title, products }) {
+  const navigate = useNavigate()
+  if (!products.length) {
+    return null
+  }
+
+  return (
+    <div className="mt-8">
+      <h2 className="text-xl font-semibold mb-3 text-gray-100">{title}</h2>
+      <div className="flex gap-3 overflow-x-auto pb-2">
+        {products.map((product) => (
+          <div
+            key={product.id}
+            onClick={() => navigate(`/product/${product.id}`)}
+            className="w-32 flex-shrink-0 bg-gray-800 rounded-lg overflow-hidden cursor-pointer border border-gray-700"
+          >
+            {product.image_url && (
+              <ProductImage product={product} variant="thumb" className="w-full h-32 object-cover" />
+            )}
+            <div className="p-2">
+              <h3 className="text-xs mb-1 line-clamp-2 text-gray-100">{product.name}</h3>
+              <p className="text-sm font-bold text-blue-400">{product.price} ₽</p>
+            </div>
+          </div>
+        ))}
+      </div>
+    </div>
+  )
+}
 
 export default function ProductDetail() {
   const { id } = useParams()
   const navigate = useNavigate()
-  const [product, setProduct] = useState(null)
-  const [loading, setLoading] = useState(true)
+  // Карточка из общего кэша каталога, обновляется событиями бэкенда
+  const { product, loading } = useProduct(parseInt(id))
+  const [recommendations, setRecommendations] = useState({ recently_viewed: [], also_viewed: [] })
 
   useEffect(() => {
-    fetchProduct()
+    fetchRecommendations()
     recordView()
   }, [id])
 
-  const fetchProduct = async () => {
+  const fetchRecommendations = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/products/${id}`)
-      const data = await response.json()
-      setProduct(data)
+      const params = new URLSearchParams({ product_id: id, user_id: getUserId(), limit: RECOMMENDATIONS_LIMIT })
+      const response = await fetch(`${API_URL}/api/recommendations?${params}`, { headers: authHeaders() })
+      if (response.ok) {
+        setRecommendations(await response.json())
+      }
     } catch (error) {
-      console.error('Error fetching product:', error)
-    } finally {
-      setLoading(false)
+      console.error('Error fetching recommendations:', error)
     }
   }
 
-  const recordView = async () => {
-    try {
-      const user = window.Telegram?.WebApp?.initDataUnsafe?.user
-      const user_id = user?.id || Math.floor(Math.random() * 1000000) // Fallback для тестирования
-      
-      await fetch(`${API_URL}/api/views`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          user_id: user_id,
-          product_id: parseInt(id)
-        })
-      })
-    } catch (error) {
-      console.error('Error recording view:', error)
-    }
+  const recordView = () => {
+    trackView(getUserId(), parseInt(id))
   }
 
   const handleContact = () => {
@@ -94,11 +118,7 @@ export default function ProductDetail() {
       </button>
       
       {product.image_url && (
-        <img
-          src={`${API_URL}${product.image_url}`}
-          alt={product.name}
-          className="w-full h-96 object-cover rounded-lg mb-6"
-        />
+        <ProductImage product={product} variant="medium" className="w-full h-96 object-cover rounded-lg mb-6" />
       )}
       
       <h1 className="text-3xl font-bold mb-4 text-gray-100">{product.name}</h1>
@@ -147,6 +167,9 @@ export default function ProductDetail() {
           💬 Написать в Telegram
         </button>
       )}
+
+      <ProductRow title="С этим товаром смотрят" products={recommendations.also_viewed} />
+      <ProductRow title="Вы недавно смотрели" products={recommendations.recently_viewed} />
     </div>
   )
 }
@@ -0,0 +1,37 @@
+const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+
+// Порядок источников: браузер берёт первый поддерживаемый формат
+const SOURCE_TYPES = [
+  ['avif', 'image/avif'],
+  ['webp', 'image/webp'],
+]
+
+export default function ProductImage({ product, variant, className }) {
+  const formats = product.image_variants?.[variant]
+
+  // Старые товары без вариантов показываем по исходному фото
+  if (!formats) {
+    return (
+      <img
+        src={`${API_URL}${product.image_url}`}
+        alt={product.name}
+        loading="lazy"
+        className={className}
+      />
+    )
+  }
+
+  return (
+    <picture>
+      {SOURCE_TYPES.filter(([format]) => formats[format]).map(([format, type]) => (
+        <source key={format} srcSet={`${API_URL}${formats[format]}`} type={type} />
+      ))}
+      <img
+        src={`${API_URL}${formats.jpeg || product.image_url}`}
+        alt={product.name}
+        loading="lazy"
+        className={className}
+      />
+    </picture>
+  )
+}
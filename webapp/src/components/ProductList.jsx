@@ -1,27 +1,20 @@
-import { useState, useEffect } from 'react'
+import { useState } from 'react'
 import { useNavigate } from 'react-router-dom'
-
-const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+import { loadCatalog, useCatalog } from '../catalog'
+import ProductImage from './ProductImage'
 
 export default function ProductList() {
-  const [products, setProducts] = useState([])
-  const [loading, setLoading] = useState(true)
+  // Каталог общий для всех экранов: при возврате на список не загружается заново,
+  // а изменения товаров и остатков приходят с бэкенда сами
+  const { items: products, nextCursor, loaded } = useCatalog()
+  const [loadingMore, setLoadingMore] = useState(false)
   const navigate = useNavigate()
+  const loading = !loaded
 
-  useEffect(() => {
-    fetchProducts()
-  }, [])
-
-  const fetchProducts = async () => {
-    try {
-      const response = await fetch(`${API_URL}/api/products`)
-      const data = await response.json()
-      setProducts(data)
-    } catch (error) {
-      console.error('Error fetching products:', error)
-    } finally {
-      setLoading(false)
-    }
+  const loadMore = async () => {
+    setLoadingMore(true)
+    await loadCatalog(nextCursor)
+    setLoadingMore(false)
   }
 
   if (loading) {
@@ -46,11 +39,7 @@ export default function ProductList() {
               className="bg-gray-800 rounded-lg shadow-md overflow-hidden cursor-pointer hover:shadow-lg transition-shadow border border-gray-700"
             >
               {product.image_url && (
-                <img
-                  src={`${API_URL}${product.image_url}`}
-                  alt={product.name}
-                  className="w-full h-48 object-cover"
-                />
+                <ProductImage product={product} variant="thumb" className="w-full h-48 object-cover" />
               )}
               <div className="p-4">
                 <h3 className="font-semibold text-sm mb-2 line-clamp-2 text-gray-100">{product.name}</h3>
@@ -63,6 +52,15 @@ export default function ProductList() {
           )
         })}
       </div>
+      {nextCursor && (
+        <button
+          onClick={loadMore}
+          disabled={loadingMore}
+          className="w-full mt-6 bg-gray-800 hover:bg-gray-700 text-gray-100 font-semibold py-3 rounded-lg border border-gray-700 transition-colors disabled:opacity-50"
+        >
+          {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+        </button>
+      )}
       {products.length === 0 && (
         <div className="text-center py-12">
           <p className="text-gray-400">Товары пока не добавлены</p>
@@ -0,0 +1,53 @@
+import { authHeaders } from './auth'
+
+const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
+
+// Просмотры копятся и отправляются одной пачкой в /api/views/bulk
+const FLUSH_DELAY_MS = 2000
+const MAX_BATCH = 100
+
+let userId = null
+let pending = new Set()
+let timer = null
+
+const flush = () => {
+  clearTimeout(timer)
+  timer = null
+  if (!pending.size || userId === null) {
+    return
+  }
+
+  const productIds = [...pending].slice(0, MAX_BATCH)
+  productIds.forEach(id => pending.delete(id))
+
+  fetch(`${API_URL}/api/views/bulk`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...authHeaders(),
+    },
+    body: JSON.stringify({ user_id: userId, product_ids: productIds }),
+    keepalive: true, // запрос переживёт закрытие мини-приложения
+  }).catch(error => console.error('Error recording views:', error))
+
+  if (pending.size) {
+    flush()
+  }
+}
+
+export function trackView(currentUserId, productId) {
+  userId = currentUserId
+  pending.add(productId)
+  if (pending.size >= MAX_BATCH) {
+    flush()
+  } else if (!timer) {
+    timer = setTimeout(flush, FLUSH_DELAY_MS)
+  }
+}
+
+// Отправляем остаток, когда мини-приложение сворачивают или закрывают
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'hidden') {
+    flush()
+  }
+})